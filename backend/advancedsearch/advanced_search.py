@@ -1,29 +1,109 @@
 import os
 import fitz
-from typing import List
+import threading
+from functools import wraps
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from advancedsearch.entities import EntityExtractor, EntityIndex
+from metrics.instrumentation import BYTES_EXTRACTED, CACHE_HITS, CACHE_MISSES, DOCUMENTS_INDEXED, stage
+
+
+def locked(method):
+    """
+    Run an AdvancedSearch method while holding its lock, so a search never sees the index
+    that build_index is rebuilding or that an ingestion thread is adding a document to.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class AdvancedSearch:
-    def __init__(self, pdf_directory: str):
+    def __init__(self, pdf_directory: str, entity_extractor: Optional[EntityExtractor] = None):
         """
         Initialize the AdvancedSearch object with a directory containing PDF files.
 
         :param pdf_directory: Directory where the PDF files are stored.
+        :param entity_extractor: Extractor used to index the entities of each PDF as it is
+                                 ingested; defaults to the heuristics-only EntityExtractor.
         """
         self.pdf_directory = pdf_directory
         self.index = {}
+        self.text_cache: Dict[str, Tuple[Tuple[float, int], str]] = {}  # filename -> ((mtime, size), text)
+        self.shared_documents: Optional[Mapping[str, str]] = None
+        self.entity_extractor = entity_extractor or EntityExtractor()
+        self.entity_index = EntityIndex()
+        self.lock = threading.RLock()
+
+    @locked
+    def use_shared_documents(self, documents: Mapping[str, str], entity_index: EntityIndex):
+        """
+        Search an already lowercased, read-only filename -> text mapping (such as a shared
+        index snapshot) instead of extracting text from the PDF directory.
+
+        :param documents: Mapping of filenames to lowercased text.
+        :param entity_index: Entity index built over the same documents.
+        """
+        self.shared_documents = documents
+        self.entity_index = entity_index
 
+    @locked
     def build_index(self):
         """
         Build an index of PDF files in the specified directory.
         The index maps filenames to their extracted text content.
+        Text is only re-extracted, and entities re-indexed, for files whose modification
+        time or size changed.
         """
+        if self.shared_documents is not None:
+            self.index = self.shared_documents
+            return
         self.index = {}
         for filename in os.listdir(self.pdf_directory):
             if filename.endswith(".pdf"):
                 filepath = os.path.join(self.pdf_directory, filename)
+                stat = os.stat(filepath)
+                signature = (stat.st_mtime, stat.st_size)
+                cached = self.text_cache.get(filename)
+                if cached is not None and cached[0] == signature:
+                    CACHE_HITS.inc(1, "advanced_search_text")
+                    self.index[filename] = cached[1]
+                    continue
+                CACHE_MISSES.inc(1, "advanced_search_text")
                 text = self.extract_text_from_pdf(filepath)
+                self.text_cache[filename] = (signature, text)
                 self.index[filename] = text
+                self.entity_index.add(filename, self.entity_extractor.extract(text))
+                DOCUMENTS_INDEXED.inc(1, "advanced_search")
+        for filename in self.text_cache.keys() - self.index.keys():
+            del self.text_cache[filename]
+            self.entity_index.remove(filename)
+
+    @locked
+    def add_document(self, filename: str, text: str):
+        """
+        Cache the text of a PDF that was just added to the directory, so build_index does not
+        extract it again. Its entities are indexed separately with index_entities.
+
+        :param filename: Name of a file in the PDF directory.
+        :param text: Its extracted text.
+        """
+        stat = os.stat(os.path.join(self.pdf_directory, filename))
+        self.text_cache[filename] = ((stat.st_mtime, stat.st_size), text)
+        self.index[filename] = text
+        DOCUMENTS_INDEXED.inc(1, "advanced_search")
+
+    def index_entities(self, filename: str, text: str):
+        """
+        Extract and index the entities of a document.
+
+        :param filename: Document name.
+        :param text: Its extracted text.
+        """
+        entities = self.entity_extractor.extract(text)  # outside the lock: NER can be slow
+        with self.lock:
+            self.entity_index.add(filename, entities)
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
@@ -34,28 +114,50 @@ class AdvancedSearch:
         """
         text = ""
         try:
-            with fitz.open(pdf_path) as doc:
+            with stage("fitz_extract"), fitz.open(pdf_path) as doc:
                 for page in doc:
                     text += page.get_text()
         except Exception as e:
             print(f"Error reading {pdf_path}: {e}")
+        BYTES_EXTRACTED.inc(len(text.encode("utf-8")), "advanced_search")
         return text
 
-    def search(self, search_terms: List[str]) -> List[str]:
+    @locked
+    def search(self, search_terms: List[str], match_all: bool = False,
+               filenames: Optional[Iterable[str]] = None) -> List[str]:
         """
-        Search for files containing any of the specified search terms.
+        Search for files containing any (or all) of the specified search terms.
 
         :param search_terms: List of terms to search for within the PDF files.
-        :return: List of filenames that contain any of the search terms.
+        :param match_all: Require every term instead of any of them.
+        :param filenames: Only scan these files, e.g. the result of an entity filter.
+        :return: List of filenames that contain the search terms.
         """
         self.build_index()
         results = []
 
         search_terms_lower = [term.lower() for term in search_terms]  # to handle case sensitive issues
+        matches = all if match_all else any
 
-        for filename, text in self.index.items():
-            text_lower = text.lower()
-            if any(term in text_lower for term in search_terms_lower):
-                results.append(filename)
+        with stage("advanced_match"):
+            for filename in self.index if filenames is None else filenames:
+                text = self.index.get(filename)
+                if text is None:
+                    continue
+                text_lower = text if self.shared_documents is not None else text.lower()
+                if matches(term in text_lower for term in search_terms_lower):
+                    results.append(filename)
 
         return results
+
+    @locked
+    def filter_entities(self, filters: Dict[str, List[str]], match_all: Iterable[str] = ()) -> Optional[Set[str]]:
+        """
+        Find files by their indexed entities (parties, companies, signatories, witnesses, ...).
+
+        :param filters: Dict of entity field -> values, e.g. {"parties": ["Northwind Holdings"]}.
+        :param match_all: Fields whose values must all match; other fields match any value.
+        :return: Set of matching filenames, or None if no entity filter was given.
+        """
+        self.build_index()
+        return self.entity_index.filter(filters, match_all)
@@ -0,0 +1,289 @@
+import re
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from metrics.instrumentation import stage
+
+# Entity fields accepted by /advanced_search, in the order the API lists them.
+ENTITY_FIELDS = ("parties", "companies", "divisions", "mentionedNames", "mentionedSignatures",
+                 "mentionedWitnesses", "dealTypes")
+
+# Canonical deal types and the title phrases that identify them.
+DEAL_TYPES = {
+    "lease": ("lease", "rental", "tenancy"),
+    "employment": ("employment",),
+    "purchase": ("purchase", "sale agreement", "agreement of sale"),
+    "services": ("services agreement", "service agreement", "consulting agreement", "statement of work"),
+    "nda": ("non-disclosure", "nondisclosure", "confidentiality agreement"),
+    "loan": ("loan", "credit agreement", "promissory note"),
+    "license": ("licence", "license"),
+    "partnership": ("partnership", "joint venture", "shareholders agreement"),
+    "suretyship": ("suretyship", "guarantee"),
+}
+
+COMPANY_SUFFIX = (r"(?:LLC|L\.L\.C\.|LLP|Inc\.?|Incorporated|Ltd\.?|Limited|Corp\.?|Corporation|Co\.|GmbH|PLC"
+                  r"|\(Pty\) Ltd)")
+COMPANY_PATTERN = re.compile(r"\b(?:[A-Z][\w&'-]*\s+){1,4}" + COMPANY_SUFFIX + r"(?!\w)")
+DIVISION_PATTERN = re.compile(r"\b(?:[A-Z][\w&-]*\s+){1,4}(?:Division|Department|Business Unit|Branch)\b"
+                              r"|\b(?:Division|Department) of (?:[A-Z][\w&-]*\s?){1,4}")
+# "Label : value" pairs, allowing the blank lines fitz puts around the colon in form-style layouts.
+LABELLED_VALUE_PATTERN = re.compile(r"(?m)^[ \t]*(?P<label>[A-Za-z][A-Za-z’'.()/ -]{1,60}?)[ \t]*(?:\n[ \t]*)*:"
+                                    r"[ \t]*(?:\n[ \t]*)*(?P<value>[^\n:]+?)[ \t]*$")
+# `between A (the "Landlord") and B (the "Tenant")`, as written in most contract preambles.
+PARTIES_PATTERN = re.compile(r"\bbetween:?\s+(?P<first>[^()]{2,300}?)\s*\([^)]*\)\s*,?\s*and\s+"
+                             r"(?P<second>[^()]{2,300}?)\s*\(", re.IGNORECASE)
+# Where a party's name ends and its particulars ("with address at ...", "herein represented by ...") begin.
+PARTY_DETAILS = re.compile(r",\s*(?!(?:Inc|LLC|LLP|Ltd|Corp|Co)\b)|\s(?:with (?:its )?(?:address|registered office)"
+                           r"|herein|residing|of address)\b", re.IGNORECASE)
+SIGNATURE_LABEL = re.compile(r"signed by|signatory|signature|signed for|on behalf of", re.IGNORECASE)
+WITNESS_LABEL = re.compile(r"witness", re.IGNORECASE)
+NOT_A_NAME_LABEL = re.compile(r"date|place|number|capacity|address|\bid\b", re.IGNORECASE)
+TITLE_PATTERN = re.compile(r"\b(?:AGREEMENT|CONTRACT|LEASE|DEED|NOTE|SURETYSHIP)\b")
+ROLE_SEPARATOR = re.compile(r",\s*(?!(?:Inc|LLC|LLP|Ltd|Corp|Co)\b)")
+TOKEN_PATTERN = re.compile(r"\w+")
+PREAMBLE_LENGTH = 2000
+MAX_VALUE_LENGTH = 80
+
+
+def normalize_entity(value: str) -> str:
+    """
+    Normalize an entity value for indexing and lookup.
+
+    :param value: Raw entity text.
+    :return: Lowercased value with collapsed whitespace and surrounding punctuation removed.
+    """
+    value = value.replace("’", "'").replace("“", '"').replace("”", '"')
+    return " ".join(value.split()).strip(" \"'.,;:()_-").lower()
+
+
+def clean_name(value: str) -> Optional[str]:
+    """
+    Clean a value taken from a signature or witness block.
+
+    :param value: Raw value, e.g. "Maria Patel, Landlord" or "______".
+    :return: The name without its trailing role, or None if the field was left blank.
+    """
+    value = ROLE_SEPARATOR.split(value.strip(" _."), maxsplit=1)[0].strip(" _.")
+    if len(value) > MAX_VALUE_LENGTH or not any(character.isalpha() for character in value):
+        return None
+    return value
+
+
+def clean_party(value: str) -> Optional[str]:
+    """
+    Clean a party taken from a contract preamble.
+
+    :param value: Raw value, e.g. "Northwind Holdings LLC with address at 1 Main Road".
+    :return: The party's name without its particulars, or None if the template was left blank.
+    """
+    value = PARTY_DETAILS.split(value, maxsplit=1)[0].strip(" _.:")
+    if len(value) > MAX_VALUE_LENGTH or not any(character.isalpha() for character in value):
+        return None
+    return value
+
+
+class EntityExtractor:
+    def __init__(self, ner: Optional[Callable[[str], List[Tuple[str, str]]]] = None):
+        """
+        Extract contract entities (parties, companies, signatories, witnesses, deal types, ...) from text.
+
+        :param ner: Optional callable returning (entity text, entity group) pairs, such as
+                    TermExtractionHandler.extract_entities. Without it only the regex and
+                    signature/witness block heuristics are used.
+        """
+        self.ner = ner
+
+    def extract(self, text: str) -> Dict[str, Set[str]]:
+        """
+        Extract the entities of one document.
+
+        :param text: Document text, in its original case.
+        :return: Dict mapping each field in ENTITY_FIELDS to a set of normalized values.
+        """
+        entities = {field: set() for field in ENTITY_FIELDS}
+        with stage("entity_extract"):
+            self.add(entities, "companies", (match.group() for match in COMPANY_PATTERN.finditer(text)))
+            self.add(entities, "divisions", (match.group() for match in DIVISION_PATTERN.finditer(text)))
+
+            for match in LABELLED_VALUE_PATTERN.finditer(text):
+                label = match.group("label")
+                if NOT_A_NAME_LABEL.search(label):
+                    continue
+                name = clean_name(match.group("value"))
+                if name is None:
+                    continue
+                if WITNESS_LABEL.search(label):
+                    self.add(entities, "mentionedWitnesses", [name])
+                elif SIGNATURE_LABEL.search(label):
+                    self.add(entities, "mentionedSignatures", [name])
+
+            preamble = " ".join(text[:PREAMBLE_LENGTH].split())
+            preamble_match = PARTIES_PATTERN.search(preamble)
+            if preamble_match:
+                parties = (clean_party(preamble_match.group(group)) for group in ("first", "second"))
+                self.add(entities, "parties", [party for party in parties if party is not None])
+            self.add(entities, "dealTypes", self.deal_types(text))
+
+        if self.ner is not None:
+            named = self.ner(text)
+            self.add(entities, "companies", (word for word, group in named if group == "ORG"))
+            self.add(entities, "mentionedNames", (word for word, group in named if group == "PER"))
+            if preamble_match is None:
+                # No recognizable "between ... and ..." preamble: fall back to the people and
+                # organizations the NER model finds in the opening of the document.
+                self.add(entities, "parties", (word for word, group in named
+                                               if group in ("ORG", "PER") and word in preamble))
+
+        entities["mentionedNames"] |= entities["mentionedSignatures"] | entities["mentionedWitnesses"]
+        return entities
+
+    @staticmethod
+    def add(entities: Dict[str, Set[str]], field: str, values: Iterable[str]):
+        """
+        Normalize values and add the non-empty ones to a field.
+        """
+        for value in values:
+            value = normalize_entity(value)
+            if value and len(value) <= MAX_VALUE_LENGTH:
+                entities[field].add(value)
+
+    @staticmethod
+    def deal_types(text: str) -> Set[str]:
+        """
+        Classify a contract by its title.
+
+        :param text: Document text.
+        :return: The title (if one is found) plus every canonical deal type it mentions.
+        """
+        title = next((line.strip() for line in text[:PREAMBLE_LENGTH].splitlines()
+                      if TITLE_PATTERN.search(line) and line.strip().isupper()), "")
+        heading = (title or text[:PREAMBLE_LENGTH // 4]).lower()
+        deal_types = {deal_type for deal_type, phrases in DEAL_TYPES.items()
+                      if any(phrase in heading for phrase in phrases)}
+        if title:
+            deal_types.add(title)
+        return deal_types
+
+    def index_documents(self, documents: Mapping[str, str]) -> "EntityIndex":
+        """
+        Build an entity index over a filename -> text mapping.
+
+        :param documents: Mapping of filenames to original-case text.
+        :return: The EntityIndex.
+        """
+        entity_index = EntityIndex()
+        for filename, text in documents.items():
+            entity_index.add(filename, self.extract(text))
+        return entity_index
+
+
+class EntityIndex:
+    def __init__(self):
+        """
+        Per-field inverted indexes from entity values to the documents mentioning them.
+
+        Every value is also indexed by its tokens, so the filter "northwind" matches the
+        party "northwind holdings llc" through set intersections rather than a text scan.
+        """
+        self.values: Dict[str, Dict[str, Set[str]]] = {field: defaultdict(set) for field in ENTITY_FIELDS}
+        self.tokens: Dict[str, Dict[str, Set[str]]] = {field: defaultdict(set) for field in ENTITY_FIELDS}
+        self.documents: Dict[str, Dict[str, List[str]]] = {}
+
+    def __contains__(self, filename):
+        return filename in self.documents
+
+    def add(self, filename: str, entities: Mapping[str, Iterable[str]]):
+        """
+        Index the entities of a document, replacing any previously indexed version of it.
+
+        :param filename: Document name.
+        :param entities: Dict of field -> normalized values, as returned by EntityExtractor.extract.
+        """
+        self.remove(filename)
+        self.documents[filename] = {field: sorted(entities.get(field, ())) for field in ENTITY_FIELDS}
+        for field, values in self.documents[filename].items():
+            for value in values:
+                self.values[field][value].add(filename)
+                for token in TOKEN_PATTERN.findall(value):
+                    self.tokens[field][token].add(value)
+
+    def remove(self, filename: str):
+        """
+        Drop a document from every field index.
+
+        :param filename: Document name.
+        """
+        entities = self.documents.pop(filename, None)
+        if entities is None:
+            return
+        for field, values in entities.items():
+            for value in values:
+                documents = self.values[field][value]
+                documents.discard(filename)
+                if documents:
+                    continue
+                del self.values[field][value]
+                for token in TOKEN_PATTERN.findall(value):
+                    self.tokens[field][token].discard(value)
+                    if not self.tokens[field][token]:
+                        del self.tokens[field][token]
+
+    def match(self, field: str, query: str) -> Set[str]:
+        """
+        Find the documents with a value in a field that contains every token of the query.
+
+        :param field: One of ENTITY_FIELDS.
+        :param query: Filter value, e.g. "Northwind Holdings".
+        :return: Set of filenames.
+        """
+        tokens = TOKEN_PATTERN.findall(normalize_entity(query))
+        if not tokens:
+            return set()
+        value_sets = sorted((self.tokens[field].get(token, set()) for token in tokens), key=len)
+        values = set(value_sets[0]).intersection(*value_sets[1:])
+        return set().union(*(self.values[field][value] for value in values))
+
+    def filter(self, filters: Mapping[str, List[str]], match_all: Iterable[str] = ()) -> Optional[Set[str]]:
+        """
+        Evaluate entity filters. Fields are combined with AND; the values of a field are
+        combined with OR, or with AND for fields listed in match_all.
+
+        :param filters: Dict of field -> filter values; empty values are ignored.
+        :param match_all: Fields whose values must all match.
+        :return: Set of matching filenames, or None if no filter was given.
+        """
+        match_all = set(match_all)
+        result = None
+        with stage("entity_filter"):
+            for field in ENTITY_FIELDS:
+                queries = [query for query in filters.get(field) or () if query.strip()]
+                if not queries:
+                    continue
+                # Evaluate the cheapest filters first so an empty intersection stops early.
+                matches = sorted((self.match(field, query) for query in queries), key=len)
+                if field in match_all:
+                    documents = matches[0].intersection(*matches[1:])
+                else:
+                    documents = set().union(*matches)
+                result = documents if result is None else result & documents
+                if not result:
+                    break
+        return result
+
+    def to_dict(self) -> Dict[str, Dict[str, List[str]]]:
+        """
+        :return: JSON-serializable filename -> field -> values mapping.
+        """
+        return self.documents
+
+    @classmethod
+    def from_dict(cls, documents: Mapping[str, Mapping[str, List[str]]]) -> "EntityIndex":
+        """
+        Rebuild an index from the output of to_dict.
+
+        :param documents: Mapping of filename -> field -> values.
+        :return: The EntityIndex.
+        """
+        entity_index = cls()
+        for filename, entities in documents.items():
+            entity_index.add(filename, entities)
+        return entity_index
@@ -0,0 +1,139 @@
+import re
+
+# "7.", "3.1", "49.1.1", "Section 4.2": the number, its trailing dot and the rest of the line.
+NUMBER_PATTERN = re.compile(r'^(?:(?:section|clause|article)\s+)?(\d{1,3}(?:\.\d{1,3}){0,3})(\.?)(?=\s|$)\s*(.*)$',
+                            re.IGNORECASE)
+# A leading upper-case heading ending the line or followed by "." / ":", e.g. "REAL ESTATE TAXES. The SELLERS...".
+HEADING_PATTERN = re.compile(r"^([A-Z][A-Z0-9 ,&/'’()-]{2,80}?)\s*(?:[.:](?=\s|$)|$)")
+LINE_PATTERN = re.compile(r'[^\n]+')
+# A line ending in a cross reference ("subject to clause") or, if it is as long as wrapped body text,
+# in a lower-case word or a comma: the number starting the next line continues its sentence.
+REFERENCE_ENDING = re.compile(r'\b(?:clause|section|article|paragraph)s?$', re.IGNORECASE)
+OPEN_SENTENCE_ENDING = re.compile(r'[a-z,]$')
+LIST_ITEM_ENDING = re.compile(r';\s*(?:and|or)$')  # "(b) pass a resolution; and" is followed by the next item
+MAX_NUMBER_GAP = 3  # numbers may skip a few siblings (e.g. 7. followed by 7.2) and still count
+MAX_HEADING_WORDS = 10
+
+
+def follows(previous, number):
+    """
+    Check that a clause number plausibly continues the numbering seen so far, so that
+    decimals or cross references wrapped to the start of a line are not taken as clauses.
+
+    :param previous: Tuple of the previous clause number's parts, or None at the start.
+    :param number: Tuple of the candidate number's parts, e.g. (7, 2, 1).
+    :return: True if the number is a next sibling, a first child or a restart at 1, or skips a
+             few siblings without continuing into the children of a skipped one.
+    """
+    if number == (1,):
+        return True
+    previous = previous or ()
+    for depth, part in enumerate(number):
+        expected = previous[depth] if depth < len(previous) else 0
+        if part != expected:
+            children = number[depth + 1:]
+            if part == expected + 1:
+                return all(child <= 1 for child in children)
+            # 1.3 may be followed by 4. (sections 2 and 3 were missed), but not by 4.1.
+            return expected + 1 < part <= expected + MAX_NUMBER_GAP and not children
+    return False
+
+
+def ends_mid_sentence(line):
+    """
+    :param line: Stripped text of the line before a numbered one.
+    :return: True if the line breaks off mid-sentence, so the number that follows is part of it.
+    """
+    if line.isupper() or LIST_ITEM_ENDING.search(line):
+        return False  # a heading such as "47. CONFIDENTIALITY CLAUSE", or the end of a list item
+    if REFERENCE_ENDING.search(line):
+        return True
+    return len(line.split()) > MAX_HEADING_WORDS and OPEN_SENTENCE_ENDING.search(line) is not None
+
+
+def heading_text(line, styled):
+    """
+    Extract a heading from a line.
+
+    :param line: Stripped line text.
+    :param styled: Whether the whole line is set in a heading font (bold or enlarged).
+    :return: The heading, or None if the line does not start with one.
+    """
+    match = HEADING_PATTERN.match(line)
+    if match:
+        return match.group(1).strip()
+    if styled and len(line.split()) <= MAX_HEADING_WORDS:
+        return line.rstrip(".:")
+    return None
+
+
+def segment_clauses(text, heading_lines=frozenset()):
+    """
+    Split a contract into numbered sections and clauses.
+
+    A clause starts at a line beginning with a plausible clause number ("4.", "4.2", "4.2.1")
+    or at an un-numbered upper-case heading set in a heading font ("ANNEXURE A"), and runs
+    until the next one. Text before the first clause becomes an un-numbered preamble, so
+    every character of the document belongs to exactly one clause.
+
+    :param text: Document text.
+    :param heading_lines: Character offsets of lines set entirely in a heading font.
+    :return: List of (start, end, level, number, title) tuples with character offsets into
+             the text; level is the depth of the number (0 when un-numbered) and number/title
+             are "" when absent.
+    """
+    clauses = []  # [start, level, number, title, has_body]
+    previous = None
+    awaiting_title = False
+    continues_sentence = False  # the previous line breaks off mid-sentence
+
+    for match in LINE_PATTERN.finditer(text):
+        line = match.group().strip()
+        if not line:
+            continue
+        start = match.start() + len(match.group()) - len(match.group().lstrip())
+        styled = match.start() in heading_lines or start in heading_lines
+        wrapped, continues_sentence = continues_sentence, ends_mid_sentence(line)
+
+        numbered = NUMBER_PATTERN.match(line)
+        if numbered:
+            number = tuple(int(part) for part in numbered.group(1).split("."))
+            if (len(number) == 1 and not numbered.group(2)) or wrapped or not follows(previous, number):
+                numbered = None
+        if numbered:
+            rest = numbered.group(3).strip()
+            title = (heading_text(rest, styled) or "") if rest else ""
+            clauses.append([start, len(number), numbered.group(1), title, bool(rest)])
+            previous = number
+            awaiting_title = not rest
+            continue
+
+        if awaiting_title:
+            # The number stood alone on its line; its heading, if any, is the next line.
+            awaiting_title = False
+            title = heading_text(line, styled)
+            clauses[-1][4] = True
+            if title:
+                clauses[-1][3] = title
+                continue
+
+        if styled and line.isupper() and len(line.split()) <= MAX_HEADING_WORDS:
+            heading = line.rstrip(".:")
+            if clauses and not clauses[-1][2] and not clauses[-1][4]:
+                clauses[-1][3] = f"{clauses[-1][3]} {heading}".strip()  # consecutive heading lines
+            else:
+                clauses.append([start, 0, "", heading, False])
+            continue
+
+        if clauses:
+            clauses[-1][4] = True
+
+    if not clauses or text[:clauses[0][0]].strip():
+        clauses.insert(0, [0, 0, "", "", True])
+
+    segments = []
+    for i, (start, level, number, title, _) in enumerate(clauses):
+        end = clauses[i + 1][0] if i + 1 < len(clauses) else len(text)
+        end = start + len(text[start:end].rstrip())
+        segments.append((start, end, level, number, title))
+    return segments
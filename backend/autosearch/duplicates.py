@@ -0,0 +1,213 @@
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+SHINGLE_SIZE = 5  # words per shingle
+NUM_PERMUTATIONS = 128
+BANDS = 32  # 32 bands of 4 rows: pairs above ~0.6 Jaccard similarity almost always share a bucket
+THRESHOLD = 0.8  # estimated Jaccard similarity above which two documents are near-duplicates
+CHUNK_SIZE = 4096  # shingles hashed per block, bounding the (shingles x permutations) array
+SHINGLE_PRIME = np.uint64(1099511628211)
+
+
+class MinHashIndex:
+    def __init__(self, threshold=THRESHOLD, num_permutations=NUM_PERMUTATIONS, bands=BANDS, seed=1):
+        """
+        MinHash signatures of word shingles with a banded LSH index, grouping near-duplicate
+        documents (e.g. revisions of the same template) into clusters.
+
+        Candidates for a document are the documents sharing at least one band bucket with
+        it, so a lookup touches a handful of buckets instead of every document. Candidates
+        are verified against the estimated Jaccard similarity and linked with a union-find,
+        so clusters are maintained incrementally as documents are added.
+
+        :param threshold: Estimated Jaccard similarity at which two documents are linked.
+        :param num_permutations: Signature length; must be divisible by bands.
+        :param bands: Number of LSH bands.
+        :param seed: Seed of the hash permutations; signatures are only comparable with the same seed.
+        """
+        if num_permutations % bands:
+            raise ValueError("num_permutations must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2^64, keeping the high 32 bits; a must be odd.
+        self.multipliers = rng.integers(0, 2 ** 63, num_permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.increments = rng.integers(0, 2 ** 63, num_permutations, dtype=np.uint64)
+        self.word_hashes = {}
+        self.signatures = {}  # filename -> uint32 signature
+        self.buckets = [defaultdict(set) for _ in range(bands)]  # band -> band bytes -> {filenames}
+        self.parent = {}  # union-find over filenames
+        self.members = {}  # cluster root -> {filenames}
+        self.stale = False  # a document was replaced, so its old links must be dropped
+
+    def __contains__(self, filename):
+        return filename in self.signatures
+
+    def shingles(self, words):
+        """
+        :param words: List of lowercased tokens.
+        :return: Sorted unique 64-bit hashes of every run of SHINGLE_SIZE consecutive words.
+        """
+        hashes = np.fromiter((self.word_hashes.setdefault(word, zlib.crc32(word.encode("utf-8")))
+                              for word in words), dtype=np.uint64, count=len(words))
+        size = min(SHINGLE_SIZE, len(hashes))
+        if not size:
+            return hashes
+        count = len(hashes) - size + 1
+        shingles = np.zeros(count, dtype=np.uint64)
+        for offset in range(size):
+            shingles = shingles * SHINGLE_PRIME + hashes[offset:offset + count]
+        return np.unique(shingles)
+
+    def signature(self, words):
+        """
+        :param words: List of lowercased tokens.
+        :return: The document's MinHash signature, or None if it has no words.
+        """
+        shingles = self.shingles(words)
+        if not len(shingles):
+            return None
+        signature = np.full(len(self.multipliers), np.iinfo(np.uint32).max, dtype=np.uint32)
+        for start in range(0, len(shingles), CHUNK_SIZE):
+            block = shingles[start:start + CHUNK_SIZE, None] * self.multipliers + self.increments
+            np.minimum(signature, (block >> np.uint64(32)).min(axis=0).astype(np.uint32), out=signature)
+        return signature
+
+    def band_keys(self, signature):
+        """
+        :param signature: MinHash signature.
+        :return: One bucket key per band.
+        """
+        return [band.tobytes() for band in np.split(signature, self.bands)]
+
+    def add(self, filename, words):
+        """
+        Add a document and link it to the near-duplicates already indexed.
+        Adding a filename again replaces its previous version.
+
+        :param filename: Document name.
+        :param words: List of lowercased tokens.
+        """
+        if filename in self.signatures:
+            self.remove(filename)
+        signature = self.signature(words)
+        if signature is None:
+            return
+        self.signatures[filename] = signature
+        self.link(filename)
+
+    def remove(self, filename):
+        """
+        Drop a document. Its cluster is split up again by the next freeze().
+
+        :param filename: Document name.
+        """
+        signature = self.signatures.pop(filename, None)
+        if signature is None:
+            return
+        for band, key in enumerate(self.band_keys(signature)):
+            bucket = self.buckets[band][key]
+            bucket.discard(filename)
+            if not bucket:
+                del self.buckets[band][key]
+        self.stale = True
+
+    def link(self, filename):
+        """
+        Insert a document's bands into the LSH buckets and union it with its verified candidates.
+        """
+        signature = self.signatures[filename]
+        self.parent[filename] = filename
+        self.members[filename] = {filename}
+        candidates = set()
+        for band, key in enumerate(self.band_keys(signature)):
+            bucket = self.buckets[band][key]
+            candidates.update(bucket)
+            bucket.add(filename)
+        for candidate in candidates:
+            if self.similarity(filename, candidate) >= self.threshold:
+                self.union(filename, candidate)
+
+    def freeze(self):
+        """
+        Rebuild the buckets and clusters if documents were replaced or removed, so that
+        links through their old versions are dropped.
+        """
+        if not self.stale:
+            return
+        self.buckets = [defaultdict(set) for _ in range(self.bands)]
+        self.parent = {}
+        self.members = {}
+        for filename in self.signatures:
+            self.link(filename)
+        self.stale = False
+
+    def find(self, filename):
+        """
+        :param filename: Indexed document.
+        :return: The representative of the document's cluster.
+        """
+        root = filename
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[filename] != root:
+            self.parent[filename], filename = root, self.parent[filename]
+        return root
+
+    def union(self, first, second):
+        """
+        Merge the clusters of two documents.
+        """
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        if len(self.members[first]) < len(self.members[second]):
+            first, second = second, first
+        self.parent[second] = first
+        self.members[first] |= self.members.pop(second)
+
+    def similarity(self, first, second):
+        """
+        :return: Estimated Jaccard similarity of two documents' shingle sets.
+        """
+        return float(np.mean(self.signatures[first] == self.signatures[second]))
+
+    def cluster(self, filename):
+        """
+        :param filename: Indexed document.
+        :return: Sorted filenames of the document's near-duplicate cluster, including itself.
+        """
+        self.freeze()
+        if filename not in self.parent:
+            return [filename]
+        return sorted(self.members[self.find(filename)])
+
+    def near_duplicates(self, filename):
+        """
+        :param filename: Indexed document.
+        :return: List of (filename, estimated similarity) tuples for the rest of its cluster,
+                 most similar first.
+        """
+        neighbours = [(other, round(self.similarity(filename, other), 4))
+                      for other in self.cluster(filename) if other != filename]
+        return sorted(neighbours, key=lambda item: (-item[1], item[0]))
+
+    def collapse(self, results):
+        """
+        Keep only the best-ranked result of each near-duplicate cluster.
+
+        :param results: Ranked result dicts with a "file_name".
+        :return: The kept results, each with a "duplicates" list of the collapsed file names.
+        """
+        self.freeze()
+        kept = {}
+        for result in results:
+            filename = result["file_name"]
+            root = self.find(filename) if filename in self.parent else filename
+            if root in kept:
+                kept[root]["duplicates"].append(filename)
+            else:
+                kept[root] = {**result, "duplicates": []}
+        return list(kept.values())
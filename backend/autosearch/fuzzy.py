@@ -0,0 +1,144 @@
+from collections import defaultdict
+from metrics.instrumentation import stage
+
+# Weight of a matched term by its edit distance from the query term; exact matches always win.
+FUZZY_WEIGHTS = {0: 1.0, 1: 0.6, 2: 0.3}
+
+
+def edit_distance(source, target, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions), bounded.
+
+    :param source: First string.
+    :param target: Second string.
+    :param max_distance: Distance above which computation stops early.
+    :return: The distance, or max_distance + 1 if it exceeds max_distance.
+    """
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        for j in range(1, len(target) + 1):
+            cost = 0 if source[i - 1] == target[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1 and source[i - 1] == target[j - 2]
+                    and source[i - 2] == target[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    def __init__(self, words=(), max_distance=2, prefix_length=7):
+        """
+        SymSpell-style deletion index over a vocabulary.
+
+        Every word is stored under all strings obtained by deleting up to `max_distance`
+        characters from its prefix, so a lookup only generates deletes of the query term
+        instead of comparing it against the whole vocabulary.
+
+        :param words: Initial vocabulary.
+        :param max_distance: Largest edit distance supported by lookups.
+        :param prefix_length: Number of leading characters used to generate deletes.
+        """
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes = defaultdict(set)
+        self.words = set()
+        self.add_words(words)
+
+    def add_words(self, words):
+        """
+        Add words to the deletion index.
+
+        :param words: Iterable of lowercased words.
+        """
+        for word in words:
+            if word in self.words:
+                continue
+            self.words.add(word)
+            for variant in self.generate_deletes(word[:self.prefix_length], self.max_distance):
+                self.deletes[variant].add(word)
+
+    @staticmethod
+    def generate_deletes(word, max_distance):
+        """
+        Generate the word and every string reachable from it by up to max_distance deletions.
+
+        :param word: Source string.
+        :param max_distance: Maximum number of deletions.
+        :return: Set of variants.
+        """
+        variants = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+            variants |= frontier
+        return variants
+
+    def allowed_distance(self, term):
+        """
+        Edit distance allowed for a query term; short terms get less slack to avoid noise.
+
+        :param term: Query term.
+        :return: Allowed edit distance.
+        """
+        if len(term) <= 3:
+            return 0
+        if len(term) <= 5:
+            return min(1, self.max_distance)
+        return self.max_distance
+
+    def delete_candidates(self, variant):
+        """
+        :param variant: A delete variant of a query term.
+        :return: Vocabulary words stored under that variant.
+        """
+        return self.deletes.get(variant, ())
+
+    def lookup(self, term, max_distance=None):
+        """
+        Find vocabulary words within the allowed edit distance of a term.
+
+        :param term: Lowercased query term.
+        :param max_distance: Optional override of the length-based distance limit.
+        :return: List of (word, distance) tuples sorted by distance then word.
+        """
+        if max_distance is None:
+            max_distance = self.allowed_distance(term)
+        max_distance = min(max_distance, self.max_distance)
+
+        candidates = set()
+        for variant in self.generate_deletes(term[:self.prefix_length], max_distance):
+            candidates.update(self.delete_candidates(variant))
+
+        matches = []
+        for word in candidates:
+            distance = edit_distance(term, word, max_distance)
+            if distance <= max_distance:
+                matches.append((word, distance))
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def expand(self, term):
+        """
+        Expand a query term into weighted vocabulary terms.
+
+        A term that is in the vocabulary only matches itself, so correctly spelled words do
+        not pull in their neighbours ("rent" does not match "sent"). Otherwise it matches the
+        vocabulary words at the smallest edit distance found.
+
+        :param term: Lowercased query term.
+        :return: Dict mapping matching vocabulary words to weights, exact match weighted 1.0.
+        """
+        if term in self.words:
+            return {term: FUZZY_WEIGHTS[0]}
+        with stage("fuzzy_expand"):
+            matches = self.lookup(term)
+            if not matches:
+                return {}
+            closest = matches[0][1]
+            return {word: FUZZY_WEIGHTS[distance] for word, distance in matches if distance == closest}
@@ -1,25 +1,73 @@
+import math
 import os
 import fitz
 import logging
 import re
-from collections import defaultdict, Counter
+import threading
+import numpy as np
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import wraps
+from autosearch.clauses import segment_clauses
+from autosearch.duplicates import MinHashIndex
+from autosearch.fuzzy import FuzzyIndex
+from autosearch.ngrams import NGramStore
+from autosearch.query import TOKEN_PATTERN, Near, parse_query, tokenize
+from autosearch.similarity import SimilarityIndex
+from metrics.instrumentation import BYTES_EXTRACTED, DOCUMENTS_INDEXED, stage
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+BM25_K1 = 1.2
+BM25_B = 0.75
+PASSAGE_LENGTH = 1500  # characters of a retrieved clause passed to the answer model
+DOCUMENT_FIELDS = ("text", "line_starts", "page_starts", "word_boxes", "clauses")  # returned by parse_document
+
+
+def locked(method):
+    """
+    Run an Indexer method while holding the index lock, so queries never see a batch of
+    documents that add_documents has only partly applied.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class Indexer:
-    def __init__(self, pdf_directory):
+    def __init__(self, pdf_directory, min_trigram_count=1, lsa_components=0, build=True):
         """
         Initialize the Indexer with a directory containing PDF files.
 
         :param pdf_directory: Directory where the PDF files are stored.
+        :param min_trigram_count: Prune trigrams seen fewer times than this from autocomplete
+                                  (approximated with a count-min sketch); 1 keeps every trigram.
+        :param lsa_components: Reduce the TF-IDF vectors used by similar_documents to this many
+                               LSA dimensions with a truncated SVD; 0 compares raw TF-IDF vectors.
+        :param build: Build the index immediately. Pass False when the index is attached
+                      from a shared snapshot instead (see autosearch.snapshot).
         """
         self.pdf_directory = pdf_directory
-        self.index = defaultdict(list)
+        self.index = defaultdict(dict)  # term -> {filename: [token positions]}
+        self.documents = {}  # filename -> extracted text
+        self.token_offsets = {}  # filename -> (token start offsets, token end offsets)
+        self.line_starts = {}  # filename -> offsets where each line of the text begins
+        self.page_starts = {}  # filename -> offsets where each page of the text begins
+        self.word_boxes = {}  # filename -> (word start offsets, word end offsets, page indexes, word rects)
+        self.clauses = {}  # filename -> (clause start offsets, end offsets, levels, numbers, titles)
+        self.clause_titles = defaultdict(set)  # clause title token -> {(filename, clause index)}
         self.words = set()
-        self.ngrams = Counter()
+        self.fuzzy_index = FuzzyIndex()
+        self.ngrams = NGramStore(min_trigram_count=min_trigram_count)
+        self.similarity = SimilarityIndex(components=lsa_components)
+        self.duplicates = MinHashIndex()
+        self.lock = threading.RLock()
         self.stopwords = {"the", "on", "with", "for", "and", "of", "or", "as", "at", "in", "by", "to", "its", "from",
                           "such", "this", "any", "date", "a", "is", "all", "that", "an", "above"}
-        self.build_index()
+        if build:
+            self.build_index()
 
     def build_index(self):
         """
@@ -30,23 +78,208 @@ class Indexer:
             if filename.endswith(".pdf"):
                 pdf_path = os.path.join(self.pdf_directory, filename)
                 try:
-                    doc = fitz.open(pdf_path)
-                    text = ""
-                    for page in doc:
-                        text += page.get_text("text") + "\n"
-                    doc.close()
-
-                    words = re.findall(r'\b\w+\b', text.lower())
-                    self.words.update(words)
-                    self.index_document(filename, words)
-                    logging.info(
-                        f"Indexed terms for {filename}: {words[:100]}")  # Display the first 100 terms for brevity
-                    logging.info(
-                        f"Indexed n-grams for {filename}: {list(self.ngrams.keys())[:100]}")  # Display the first 100 n-grams for brevity
+                    self.add_document(filename, self.parse_document(pdf_path))
                 except Exception as e:
                     logging.error(f"Error indexing file {filename}: {str(e)}")
-        logging.info(f"Index built with {len(self.words)} unique words.")
-        logging.info(f"Sample indexed words: {list(self.words)[:50]}")
+        self.freeze()
+        logging.info(f"Index built with {len(self.words)} unique words and {len(self.ngrams)} n-grams.")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Index summary: {self.debug_summary()}")
+
+    def add_document(self, filename, document):
+        """
+        Store a parsed document and index its words. The n-gram, fuzzy, similarity and
+        duplicate indexes only include it after the next freeze().
+
+        :param filename: Name of the file being indexed.
+        :param document: The document's text and layout, as returned by parse_document.
+        """
+        self.store_document(filename, document, *self.tokenize_document(document["text"]))
+
+    @staticmethod
+    def tokenize_document(text):
+        """
+        :param text: Document text.
+        :return: (lowercased words, token start offsets, token end offsets).
+        """
+        with stage("tokenize"):
+            words = []
+            starts = array('L')
+            ends = array('L')
+            for match in TOKEN_PATTERN.finditer(text):
+                words.append(match.group().lower())
+                starts.append(match.start())
+                ends.append(match.end())
+        return words, starts, ends
+
+    def store_document(self, filename, document, words, starts, ends):
+        """
+        Store a tokenized document and index its words, see add_document.
+        """
+        self.documents[filename] = document["text"]
+        self.line_starts[filename] = document["line_starts"]
+        self.page_starts[filename] = document["page_starts"]
+        self.word_boxes[filename] = document["word_boxes"]
+        self.clauses[filename] = document["clauses"]
+        self.token_offsets[filename] = (starts, ends)
+        self.words.update(words)
+        with stage("index_document"):
+            self.index_document(filename, words)
+            self.index_clause_titles(filename)
+        DOCUMENTS_INDEXED.inc(1, "indexer")
+
+    def freeze(self):
+        """
+        Merge the documents added since the last call into the n-gram, fuzzy, similarity
+        and duplicate indexes.
+        """
+        with stage("ngram_merge"):
+            self.ngrams.freeze()
+        with stage("fuzzy_index"):
+            self.fuzzy_index.add_words(self.words)
+        with stage("similarity"):
+            self.similarity.freeze()
+        with stage("duplicate_clusters"):
+            self.duplicates.freeze()
+
+    @locked
+    def add_documents(self, documents):
+        """
+        Index new documents while the index is serving queries. The batch is applied under
+        the index lock, so concurrent queries see either none or all of it, and the merged
+        indexes are only recomputed once per batch.
+
+        Every document is validated and tokenized before the index is touched, so a batch
+        that raises leaves the index unchanged.
+
+        :param documents: List of (filename, document) tuples, documents as returned by parse_document.
+        :raises ValueError: If a file is already indexed or appears twice (replacing documents in
+                            place is not supported), or a document lacks a parse_document field.
+        """
+        filenames = [filename for filename, _ in documents]
+        indexed = [filename for filename in filenames if filename in self.documents]
+        if indexed:
+            raise ValueError(f"Files already indexed: {', '.join(indexed)}")
+        if len(set(filenames)) < len(filenames):
+            raise ValueError("A file appears more than once in the batch")
+        tokenized = []
+        for filename, document in documents:
+            missing = [field for field in DOCUMENT_FIELDS if field not in document]
+            if missing:
+                raise ValueError(f"Document {filename} lacks {', '.join(missing)}")
+            tokenized.append((filename, document, self.tokenize_document(document["text"])))
+        for filename, document, tokens in tokenized:
+            self.store_document(filename, document, *tokens)
+        self.freeze()
+
+    def debug_summary(self):
+        """
+        Summarize the built index for debugging. Only computed when debug logging is enabled.
+
+        :return: Dict with document, vocabulary and n-gram statistics.
+        """
+        return {
+            "documents": {filename: len(starts) for filename, (starts, _) in self.token_offsets.items()},
+            "unique_words": len(self.words),
+            "sample_words": sorted(self.words)[:50],
+            "ngrams": self.ngrams.summary(),
+        }
+
+    @staticmethod
+    def parse_document(pdf_path):
+        """
+        Extract the text of a PDF with its line, page, word box and clause layout.
+
+        Word boxes come from fitz's word extraction and are aligned to character offsets in
+        the extracted text, so hits can be mapped to page coordinates without re-opening the PDF.
+        Lines set in a bold or enlarged font are passed to segment_clauses as heading candidates.
+        Nothing is stored, so documents can be parsed in parallel and indexed with add_document.
+
+        :param pdf_path: Path to the PDF file.
+        :return: Dict with the "text" (pages separated by newlines) and its "line_starts",
+                 "page_starts", "word_boxes" and "clauses".
+        """
+        text_parts = []
+        page_starts = array('L')
+        word_starts = array('L')
+        word_ends = array('L')
+        word_pages = array('L')
+        word_rects = []
+        heading_lines = set()
+        offset = 0
+
+        doc = fitz.open(pdf_path)
+        for page_index, page in enumerate(doc):
+            with stage("fitz_extract"):
+                textpage = page.get_textpage()  # parse the page once for all three extractions
+                page_text = page.get_text("text", textpage=textpage)
+                page_words = page.get_text("words", textpage=textpage)
+                page_blocks = page.get_text("dict", textpage=textpage)["blocks"]
+            page_starts.append(offset)
+            heading_lines.update(offset + start for start in Indexer.find_heading_lines(page_text, page_blocks))
+            cursor = 0
+            for x0, y0, x1, y1, word, *_ in page_words:
+                start = page_text.find(word, cursor)
+                if start < 0:
+                    continue
+                cursor = start + len(word)
+                word_starts.append(offset + start)
+                word_ends.append(offset + cursor)
+                word_pages.append(page_index)
+                word_rects.append((round(x0, 2), round(y0, 2), round(x1, 2), round(y1, 2)))
+            text_parts.append(page_text + "\n")
+            offset += len(page_text) + 1
+        doc.close()
+
+        text = "".join(text_parts)
+        BYTES_EXTRACTED.inc(len(text.encode("utf-8")), "indexer")
+        with stage("segment_clauses"):
+            segments = segment_clauses(text, heading_lines)
+        return {
+            "text": text,
+            "line_starts": array('L', [0] + [match.end() for match in re.finditer(r'\n', text)]),
+            "page_starts": page_starts,
+            "word_boxes": (word_starts, word_ends, word_pages, word_rects),
+            "clauses": (array('L', [segment[0] for segment in segments]),
+                        array('L', [segment[1] for segment in segments]),
+                        array('L', [segment[2] for segment in segments]),
+                        [segment[3] for segment in segments],
+                        [segment[4] for segment in segments]),
+        }
+
+    @staticmethod
+    def find_heading_lines(page_text, page_blocks):
+        """
+        Find the lines of a page that are set entirely in a bold or larger-than-body font.
+
+        :param page_text: The page's plain text, as returned by get_text("text").
+        :param page_blocks: The page's blocks, as returned by get_text("dict").
+        :return: Offsets into page_text where such lines start.
+        """
+        lines = []
+        sizes = []
+        for block in page_blocks:
+            for line in block.get("lines", ()):
+                spans = [span for span in line["spans"] if span["text"].strip()]
+                if spans:
+                    lines.append((line["spans"], spans))
+                    sizes.extend(span["size"] for span in spans)
+        if not sizes:
+            return []
+        body_size = sorted(sizes)[len(sizes) // 2]
+
+        offsets = []
+        cursor = 0
+        for all_spans, spans in lines:
+            line_text = "".join(span["text"] for span in all_spans)
+            start = page_text.find(line_text, cursor)
+            if start < 0:
+                continue
+            cursor = start + len(line_text)
+            bold = all(span["flags"] & 16 or "bold" in span["font"].lower() for span in spans)
+            if bold or min(span["size"] for span in spans) > body_size * 1.15:
+                offsets.append(start)
+        return offsets
 
     def index_document(self, filename, words):
         """
@@ -55,156 +288,601 @@ class Indexer:
         :param filename: Name of the file being indexed.
         :param words: List of words extracted from the document.
         """
-        logging.info(f"Indexing words from file: {filename}")
-        for i in range(len(words)):
-            unigram = words[i]
-            self.ngrams[(unigram,)] += 1
-            self.index[unigram].append(filename)
-            if i < len(words) - 1:
-                bigram = (words[i], words[i + 1])
-                self.ngrams[bigram] += 1
-            if i < len(words) - 2:
-                trigram = (words[i], words[i + 1], words[i + 2])
-                self.ngrams[trigram] += 1
-        logging.info(
-            f"Indexed unigrams: {[unigram for unigram in self.ngrams.keys() if len(unigram) == 1][:100]}")  # Display the first 100 unigrams
-        logging.info(
-            f"Indexed bigrams: {[bigram for bigram in self.ngrams.keys() if len(bigram) == 2][:100]}")  # Display the first 100 bigrams
-        logging.info(
-            f"Indexed trigrams: {[trigram for trigram in self.ngrams.keys() if len(trigram) == 3][:100]}")  # Display the first 100 trigrams
+        logging.debug(f"Indexing {len(words)} words from file: {filename}")
+        for i, word in enumerate(words):
+            self.index[word].setdefault(filename, []).append(i)
+        self.ngrams.add(words)
+        self.similarity.add(filename, words)
+        with stage("minhash"):
+            self.duplicates.add(filename, words)
+
+    def index_clause_titles(self, filename):
+        """
+        Index the title tokens of a document's clauses for clause filters.
+
+        :param filename: Name of a file whose clauses were segmented.
+        """
+        titles = self.clauses[filename][4]
+        for clause_index, title in enumerate(titles):
+            for token in tokenize(title):
+                self.clause_titles[token].add((filename, clause_index))
 
+    @locked
     def search(self, query, filename=None):
         """
         Search for query terms in the indexed documents.
 
+        Quoted phrases must match at consecutive positions and `a NEAR/k b` requires both
+        operands within k tokens of each other; every clause of the query has to match.
+        Bare words missing from the vocabulary are expanded to their closest spellings, which score
+        below exact matches.
+
         :param query: Search query string.
         :param filename: Optional filename to restrict the search to a specific PDF.
         :return: List of search results with filenames and match percentages.
         :raises FileNotFoundError: If the specified file is not found.
         """
-        query_terms = query.lower().split()
+        with stage("query_parse"):
+            clauses = parse_query(query)
         document_matches = defaultdict(int)
+        document_weights = defaultdict(float)
+        document_spans = defaultdict(list)
 
         if filename:
             if not os.path.exists(os.path.join(self.pdf_directory, filename)):
                 raise FileNotFoundError(f"File {filename} not found in directory.")
-            pdf_files = [filename]
-        else:
-            pdf_files = os.listdir(self.pdf_directory)
-
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(self.pdf_directory, pdf_file)
-            doc = fitz.open(pdf_path)
-            text = ""
-            for page in doc:
-                text += page.get_text("text") + "\n"
-            doc.close()
-
-            words = re.findall(r'\b\w+\b', text.lower())
-            for term in query_terms:
-                if term in words:
+
+        with stage("postings"):
+            for clause in clauses:
+                for pdf_file, spans in self.evaluate(clause).items():
+                    if filename and pdf_file != filename:
+                        continue
                     document_matches[pdf_file] += 1
+                    document_weights[pdf_file] += max(weight for _, _, weight in spans)
+                    document_spans[pdf_file].extend(spans)
 
         results = []
-        for pdf_file, count in document_matches.items():
-            if count == len(query_terms):
-                match_percentage = (count / len(query_terms)) * 100
-                results.append({
-                    "file_name": pdf_file,
-                    "match_percentage": match_percentage,
-                    "matches": self.get_context_matches(pdf_file, query_terms)
-                })
+        with stage("snippets"):
+            for pdf_file, count in document_matches.items():
+                if count == len(clauses):
+                    match_percentage = (document_weights[pdf_file] / len(clauses)) * 100
+                    results.append({
+                        "file_name": pdf_file,
+                        "match_percentage": match_percentage,
+                        "matches": self.get_context_matches(pdf_file, document_spans[pdf_file]),
+                        "hits": self.get_hits(pdf_file, document_spans[pdf_file])
+                    })
+
+        return sorted(results, key=lambda x: (-x["match_percentage"], -len(x["matches"]), x["file_name"]))
+
+    def evaluate(self, clause):
+        """
+        Evaluate a parsed query clause against the positional index.
+
+        :param clause: Phrase or Near clause produced by parse_query.
+        :return: Dict mapping filenames to sorted (start, end, weight) token spans, end exclusive.
+        """
+        if isinstance(clause, Near):
+            left = self.evaluate(clause.left)
+            right = self.evaluate(clause.right)
+            spans = {}
+            for pdf_file in left.keys() & right.keys():
+                matched = self.intersect_near(left[pdf_file], right[pdf_file], clause.distance)
+                if matched:
+                    spans[pdf_file] = matched
+            return spans
+
+        postings = [self.term_postings({term: 1.0} if clause.exact else self.fuzzy_index.expand(term))
+                    for term in clause.terms]
+        if not all(postings):
+            return {}
+        candidate_files = set(min(postings, key=len))
+        for posting in postings:
+            candidate_files &= posting.keys()
+
+        length = len(clause.terms)
+        spans = {}
+        for pdf_file in candidate_files:
+            slots = [posting[pdf_file] for posting in postings]
+            starts = self.intersect_phrase([positions for positions, _ in slots])
+            if starts:
+                spans[pdf_file] = [
+                    (start, start + length,
+                     min(self.weight_at(weights, start + offset) for offset, (_, weights) in enumerate(slots)))
+                    for start in starts
+                ]
+        return spans
+
+    def term_postings(self, alternatives):
+        """
+        Merge the positional postings of a query term's weighted alternatives.
 
-        return sorted(results, key=lambda x: x["match_percentage"], reverse=True)
+        :param alternatives: Dict mapping vocabulary words to weights.
+        :return: Dict mapping filenames to (sorted positions, weights), where weights is either a
+                 single weight shared by every position or a dict of position -> weight.
+        """
+        if len(alternatives) == 1:
+            (word, weight), = alternatives.items()
+            return {pdf_file: (positions, weight) for pdf_file, positions in self.index.get(word, {}).items()}
+
+        merged = defaultdict(dict)
+        for word, weight in sorted(alternatives.items(), key=lambda item: item[1]):
+            for pdf_file, positions in self.index.get(word, {}).items():
+                merged[pdf_file].update(dict.fromkeys(positions, weight))
+        return {pdf_file: (sorted(weights), weights) for pdf_file, weights in merged.items()}
+
+    @staticmethod
+    def weight_at(weights, position):
+        """
+        Look up the weight of the term matched at a position.
 
-    def get_context_matches(self, filename, query_terms):  # highlight terms that are being found,Handle Tap/Click to
-        # Jump to Sections:
+        :param weights: A single weight or a dict of position -> weight, as built by term_postings.
+        :param position: Token position.
+        :return: Weight of the match.
         """
-        Get context matches for query terms in a specific document.
+        return weights[position] if isinstance(weights, dict) else weights
 
-        :param filename: Name of the file to search.
-        :param query_terms: List of query terms to search for.
-        :return: List of context matches.
+    @staticmethod
+    def intersect_phrase(position_lists):
         """
-        pdf_path = os.path.join(self.pdf_directory, filename)
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            text += page.get_text("text") + "\n"
-        doc.close()
+        Intersect positional postings for consecutive terms.
+
+        Starts from the rarest term and merges the remaining lists, shifted by their offset
+        in the phrase, so the cost is linear in the postings rather than in the document.
+
+        :param position_lists: Sorted token positions for each phrase term, in phrase order.
+        :return: Sorted start positions where the full phrase occurs.
+        """
+        order = sorted(range(len(position_lists)), key=lambda i: len(position_lists[i]))
+        rarest = order[0]
+        candidates = [position - rarest for position in position_lists[rarest] if position >= rarest]
+        for offset in order[1:]:
+            positions = position_lists[offset]
+            merged = []
+            i = j = 0
+            while i < len(candidates) and j < len(positions):
+                target = candidates[i] + offset
+                if positions[j] < target:
+                    j += 1
+                elif positions[j] > target:
+                    i += 1
+                else:
+                    merged.append(candidates[i])
+                    i += 1
+                    j += 1
+            candidates = merged
+            if not candidates:
+                break
+        return candidates
+
+    @staticmethod
+    def intersect_near(left_spans, right_spans, distance):
+        """
+        Pair spans from two operands that lie within `distance` tokens of each other.
+
+        :param left_spans: Sorted (start, end, weight) spans of the left operand.
+        :param right_spans: Sorted (start, end, weight) spans of the right operand.
+        :param distance: Maximum number of tokens between the two spans.
+        :return: Sorted, de-duplicated covering spans of every matching pair, keeping the best weight.
+        """
+        right_starts = [start for start, _, _ in right_spans]
+        widest = max(end - start for start, end, _ in right_spans)
+        matched = {}
+        for left_start, left_end, left_weight in left_spans:
+            lo = bisect_left(right_starts, left_start - distance - widest)
+            hi = bisect_right(right_starts, left_end + distance)
+            for right_start, right_end, right_weight in right_spans[lo:hi]:
+                gap = max(right_start - left_end, left_start - right_end, 0)
+                if gap <= distance:
+                    span = (min(left_start, right_start), max(left_end, right_end))
+                    matched[span] = max(matched.get(span, 0), min(left_weight, right_weight))
+        return [(start, end, weight) for (start, end), weight in sorted(matched.items())]
+
+    def get_char_spans(self, filename, spans):
+        """
+        Convert token spans into sorted, de-duplicated character spans in the document text.
+
+        :param filename: Name of the matched file.
+        :param spans: (start, end, weight) token spans.
+        :return: Sorted list of (char_start, char_end) tuples.
+        """
+        starts, ends = self.token_offsets[filename]
+        return sorted({(int(starts[start]), int(ends[end - 1])) for start, end, _ in spans})
+
+    def get_context_matches(self, filename, spans):
+        """
+        Get context snippets around matched token spans in a specific document.
+
+        Each snippet covers two lines either side of a hit, with the hits inside it given
+        as character offsets into the snippet rather than as inline markup.
 
+        :param filename: Name of the matched file.
+        :param spans: (start, end, weight) token spans to highlight.
+        :return: List of context matches with "context" and "highlights" ([start, end] pairs).
+        """
+        text = self.documents[filename]
+        line_starts = self.line_starts[filename]
+        char_spans = self.get_char_spans(filename, spans)
         matches = []
-        lines = text.splitlines()
-
-        for i, line in enumerate(lines):
-            if any(term in line.lower() for term in query_terms):
-                start_idx = max(i - 2, 0)
-                end_idx = min(i + 3, len(lines))
-                snippet = ' '.join(lines[start_idx:end_idx])
-                highlighted_snippet = snippet
-                for term in query_terms:
-                    highlighted_snippet = highlighted_snippet.replace(term, f"<mark>{term}</mark>")
-                matches.append({"context": highlighted_snippet})
+        seen_lines = set()
+
+        for char_start, _ in char_spans:
+            line = bisect_right(line_starts, char_start) - 1
+            if line in seen_lines:
+                continue
+            seen_lines.add(line)
+            start_idx = max(line - 2, 0)
+            end_idx = min(line + 3, len(line_starts))
+            window_start = int(line_starts[start_idx])
+            window_end = int(line_starts[end_idx]) - 1 if end_idx < len(line_starts) else len(text)
+
+            snippet = text[window_start:window_end].replace('\n', ' ')
+            leading = len(snippet) - len(snippet.lstrip())
+            highlights = [
+                [span_start - window_start - leading, span_end - window_start - leading]
+                for span_start, span_end in char_spans
+                if span_start >= window_start and span_end <= window_end
+            ]
+            matches.append({"context": snippet.strip(), "highlights": highlights})
 
         return matches
 
-    def autocomplete(self, query):
+    def get_hits(self, filename, spans):
         """
-        Provide autocomplete suggestions based on the query.
+        Map matched token spans to page locations for click-to-jump highlighting.
 
-        :param query: Autocomplete query string.
-        :return: List of autocomplete suggestions.
+        Hits that cross a page break are split into one entry per page.
+
+        :param filename: Name of the matched file.
+        :param spans: (start, end, weight) token spans.
+        :return: List of hits with 1-based "page_number", page-relative "start"/"end" character
+                 offsets, the matched "text" and the "boxes" ([x0, y0, x1, y1]) of the words it covers.
         """
-        query_lower = query.lower()
-        suggestions = set()
-        logging.info(f"Query: {query_lower}")
-        for ngram in self.ngrams.keys():
-            if ' '.join(ngram).startswith(query_lower):
-                suggestions.add(' '.join(ngram))
-                logging.info(f"Matched ngram: {' '.join(ngram)}")
+        text = self.documents[filename]
+        page_starts = self.page_starts[filename]
+        word_starts, word_ends, word_pages, word_rects = self.word_boxes[filename]
+        hits = []
+
+        for char_start, char_end in self.get_char_spans(filename, spans):
+            first_page = bisect_right(page_starts, char_start) - 1
+            last_page = bisect_right(page_starts, char_end - 1) - 1
+            boxes = defaultdict(list)
+            word = bisect_right(word_ends, char_start)
+            while word < len(word_starts) and word_starts[word] < char_end:
+                boxes[int(word_pages[word])].append([float(value) for value in word_rects[word]])
+                word += 1
+
+            for page in range(first_page, last_page + 1):
+                page_start = int(page_starts[page])
+                page_end = int(page_starts[page + 1]) - 1 if page + 1 < len(page_starts) else len(text)
+                start = max(char_start, page_start)
+                end = min(char_end, page_end)
+                end = start + len(text[start:end].rstrip())  # a hit cut at a page break ends with its last word
+                hits.append({
+                    "page_number": page + 1,
+                    "start": start - page_start,
+                    "end": end - page_start,
+                    "text": text[start:end],
+                    "boxes": boxes.get(page, [])
+                })
 
-        # Remove stopwords from suggestions
-        suggestions = self.remove_stopwords(suggestions)
+        return hits
 
-        logging.info(f"Autocomplete suggestions for '{query}': {suggestions}")
-        return list(suggestions)
+    @locked
+    def get_clauses(self, filename, include_text=False):
+        """
+        List the sections and clauses a document was segmented into.
 
-    def remove_stopwords(self, suggestions):
+        :param filename: Name of the PDF file.
+        :param include_text: Include each clause's text.
+        :return: List of clauses with their "index", "number", "title", "level" and 1-based
+                 "page_start"/"page_end", in document order.
+        :raises FileNotFoundError: If the file is not indexed.
+        """
+        if filename not in self.clauses:
+            raise FileNotFoundError(f"File {filename} not found in index.")
+        starts, ends = self.clauses[filename][:2]
+        text = self.documents[filename] if include_text else None
+        clauses = []
+        for clause_index in range(len(starts)):
+            clause = self.describe_clause(filename, clause_index)
+            if include_text:
+                clause["text"] = text[int(starts[clause_index]):int(ends[clause_index])]
+            clauses.append(clause)
+        return clauses
+
+    def describe_clause(self, filename, clause_index):
+        """
+        :param filename: Name of the PDF file.
+        :param clause_index: Position of the clause in the document.
+        :return: Dict with the clause's "index", "number", "title", "level", "page_start" and "page_end".
         """
-        Remove stopwords from the list of suggestions.
+        starts, ends, levels, numbers, titles = self.clauses[filename]
+        page_starts = self.page_starts[filename]
+        start, end = int(starts[clause_index]), int(ends[clause_index])
+        return {
+            "index": clause_index,
+            "number": numbers[clause_index] or None,
+            "title": titles[clause_index] or None,
+            "level": int(levels[clause_index]),
+            "page_start": bisect_right(page_starts, start),
+            "page_end": bisect_right(page_starts, max(end - 1, start)),
+        }
+
+    @locked
+    def search_clauses(self, query, filename=None):
+        """
+        Search for query terms clause by clause.
+
+        The query syntax is the same as for search, but every query clause has to match
+        within the same contract clause, and each result is that clause rather than the file.
 
-        :param suggestions: List of autocomplete suggestions.
-        :return: List of suggestions without stopwords.
+        :param query: Search query string.
+        :param filename: Optional filename to restrict the search to a specific PDF.
+        :return: List of matching clauses with their file name, match percentage, text and
+                 highlights ([start, end] pairs relative to the clause text).
+        :raises FileNotFoundError: If the specified file is not found.
         """
-        return [suggestion for suggestion in suggestions if
-                not any(stopword in suggestion.split() for stopword in self.stopwords)]
+        with stage("query_parse"):
+            query_clauses = parse_query(query)
+
+        if filename:
+            if not os.path.exists(os.path.join(self.pdf_directory, filename)):
+                raise FileNotFoundError(f"File {filename} not found in directory.")
+
+        clause_matches = defaultdict(int)
+        clause_weights = defaultdict(float)
+        clause_spans = defaultdict(list)
+        with stage("postings"):
+            for query_clause in query_clauses:
+                for pdf_file, spans in self.evaluate(query_clause).items():
+                    if filename and pdf_file != filename:
+                        continue
+                    token_starts = self.token_offsets[pdf_file][0]
+                    clause_starts = self.clauses[pdf_file][0]
+                    matched = defaultdict(list)
+                    for span in spans:
+                        matched[bisect_right(clause_starts, token_starts[span[0]]) - 1].append(span)
+                    for clause_index, clause_span_list in matched.items():
+                        key = (pdf_file, clause_index)
+                        clause_matches[key] += 1
+                        clause_weights[key] += max(weight for _, _, weight in clause_span_list)
+                        clause_spans[key].extend(clause_span_list)
 
+        results = []
+        texts = {}
+        with stage("snippets"):
+            for (pdf_file, clause_index), count in clause_matches.items():
+                if count < len(query_clauses):
+                    continue
+                if pdf_file not in texts:
+                    texts[pdf_file] = self.documents[pdf_file]
+                start = int(self.clauses[pdf_file][0][clause_index])
+                end = int(self.clauses[pdf_file][1][clause_index])
+                results.append({
+                    "file_name": pdf_file,
+                    **self.describe_clause(pdf_file, clause_index),
+                    "match_percentage": clause_weights[pdf_file, clause_index] / len(query_clauses) * 100,
+                    "text": texts[pdf_file][start:end],
+                    "highlights": [[span_start - start, span_end - start] for span_start, span_end
+                                   in self.get_char_spans(pdf_file, clause_spans[pdf_file, clause_index])],
+                })
+
+        return sorted(results, key=lambda x: (-x["match_percentage"], -len(x["highlights"]), x["file_name"],
+                                              x["index"]))
+
+    @locked
+    def retrieve_passages(self, question, top_k=3, filename=None, max_length=PASSAGE_LENGTH):
+        """
+        Rank contract clauses for a natural-language question with BM25.
+
+        Unlike search, not every word has to match: each clause is scored by the question
+        words it contains, weighted by their rarity across the searched clauses, with the clause
+        length normalized against the average length of the candidate clauses. A clause whose
+        passage falls inside (or contains) a passage already returned is skipped, so a heading
+        and its own subclause are not both returned.
+
+        :param question: Question text.
+        :param top_k: Number of passages to return.
+        :param filename: Optional filename to restrict retrieval to a specific PDF.
+        :param max_length: Longer passages are cut to a window of this many characters around
+                           their first matched word.
+        :return: List of passages (a clause and its subclauses) with the clause's file name, "index",
+                 "number", "title", "level", page range, BM25 "score" and "text", best first.
+        :raises FileNotFoundError: If the specified file is not found.
+        """
+        if filename and filename not in self.documents:
+            raise FileNotFoundError(f"File {filename} not found in index.")
+        terms = [term for term in dict.fromkeys(tokenize(question)) if term not in self.stopwords]
+
+        term_counts = defaultdict(dict)  # (filename, clause index) -> {term: count}
+        first_hits = {}  # (filename, clause index) -> character offset of the first matched word
+        clause_frequency = defaultdict(int)  # term -> number of clauses containing it
+        with stage("retrieve"):
+            for term in terms:
+                for pdf_file, positions in self.index.get(term, {}).items():
+                    if filename and pdf_file != filename:
+                        continue
+                    hits = np.asarray(self.token_offsets[pdf_file][0])[np.asarray(positions)]
+                    clause_ids = np.searchsorted(np.asarray(self.clauses[pdf_file][0]), hits, side="right") - 1
+                    clause_ids, first, counts = np.unique(clause_ids, return_index=True, return_counts=True)
+                    clause_frequency[term] += len(clause_ids)
+                    for clause_index, hit, count in zip(clause_ids.tolist(), hits[first].tolist(), counts.tolist()):
+                        key = (pdf_file, clause_index)
+                        term_counts[key][term] = count
+                        first_hits[key] = min(first_hits.get(key, hit), hit)
+
+            scope = [filename] if filename else self.clauses
+            clause_count = sum(len(self.clauses[pdf_file][0]) for pdf_file in scope)
+            idf = {term: math.log(1 + (clause_count - frequency + 0.5) / (frequency + 0.5))
+                   for term, frequency in clause_frequency.items()}
+            lengths = {key: self.clause_length(*key) for key in term_counts}
+            average_length = sum(lengths.values()) / len(lengths) if lengths else 1
+            scores = {
+                key: sum(idf[term] * count * (BM25_K1 + 1) /
+                         (count + BM25_K1 * (1 - BM25_B + BM25_B * lengths[key] / average_length))
+                         for term, count in counts.items())
+                for key, counts in term_counts.items()
+            }
+            ranked = sorted(scores, key=lambda key: (-scores[key], key))
+
+        passages = []
+        selected = defaultdict(list)  # filename -> (start, end) of the passages returned so far
+        for pdf_file, clause_index in ranked:
+            if len(passages) == top_k:
+                break
+            starts, ends, levels = self.clauses[pdf_file][:3]
+            start = int(starts[clause_index])
+            # Include the numbered subclauses, so a matched heading such as "3. RENT" brings its body.
+            last = clause_index
+            while levels[clause_index] and last + 1 < len(levels) and levels[last + 1] > levels[clause_index]:
+                last += 1
+            end = int(ends[last])
+            # Passages are whole clause subtrees, so two of them either nest or do not overlap at all.
+            if any(start < other_end and other_start < end for other_start, other_end in selected[pdf_file]):
+                continue
+            selected[pdf_file].append((start, end))
+            if end - start > max_length:
+                start = max(start, min(first_hits[pdf_file, clause_index] - max_length // 4, end - max_length))
+                end = start + max_length
+            passages.append({
+                "file_name": pdf_file,
+                **self.describe_clause(pdf_file, clause_index),
+                "score": round(scores[pdf_file, clause_index], 4),
+                "text": self.documents[pdf_file][start:end],
+            })
+        return passages
+
+    def clause_length(self, filename, clause_index):
+        """
+        :param filename: Name of an indexed PDF file.
+        :param clause_index: Position of the clause in the document.
+        :return: Number of tokens in the clause.
+        """
+        token_starts = self.token_offsets[filename][0]
+        starts, ends = self.clauses[filename][:2]
+        return bisect_left(token_starts, ends[clause_index]) - bisect_left(token_starts, starts[clause_index])
+
+    @locked
+    def find_clauses(self, title):
+        """
+        Find documents with a clause whose title contains every word of the given title.
+
+        :param title: Clause title to look for, e.g. "governing law".
+        :return: Set of filenames.
+        """
+        tokens = tokenize(title)
+        if not tokens:
+            return set()
+        with stage("clause_filter"):
+            postings = sorted((self.clause_titles.get(token, set()) for token in tokens), key=len)
+            return {pdf_file for pdf_file, _ in postings[0].intersection(*postings[1:])}
+
+    @locked
+    def similar_documents(self, filename, top_k=10):
+        """
+        Find the documents most similar to a given one by cosine similarity of their TF-IDF
+        (or LSA) vectors.
+
+        :param filename: Name of an indexed PDF file.
+        :param top_k: Number of similar documents to return.
+        :return: List of dicts with "file_name" and "similarity", most similar first.
+        :raises FileNotFoundError: If the file is not indexed.
+        """
+        if filename not in self.similarity:
+            raise FileNotFoundError(f"File {filename} not found in index.")
+        with stage("similarity"):
+            neighbours = self.similarity.similar(filename, top_k)
+        return [{"file_name": name, "similarity": similarity} for name, similarity in neighbours]
+
+    @locked
+    def near_duplicates(self, filename):
+        """
+        Find the near-duplicates of a document, such as other revisions of the same template.
+
+        :param filename: Name of an indexed PDF file.
+        :return: Dict with the document's near-duplicate "cluster" (sorted file names, including
+                 itself) and its "near_duplicates" with their estimated Jaccard similarity.
+        :raises FileNotFoundError: If the file is not indexed.
+        """
+        if filename not in self.documents:
+            raise FileNotFoundError(f"File {filename} not found in index.")
+        return {
+            "cluster": self.duplicates.cluster(filename),
+            "near_duplicates": [{"file_name": name, "similarity": similarity}
+                                for name, similarity in self.duplicates.near_duplicates(filename)],
+        }
+
+    @locked
+    def collapse_duplicates(self, results):
+        """
+        Collapse near-duplicate documents in ranked results to their best-ranked representative.
+
+        :param results: Ranked results with a "file_name", as returned by search.
+        :return: Results with one entry per near-duplicate cluster, each listing the file names
+                 it stands for under "duplicates".
+        """
+        return self.duplicates.collapse(results)
+
+    @locked
+    def autocomplete(self, query):
+        """
+        Provide autocomplete suggestions based on the query.
+
+        Suggestions are the indexed n-grams that start with the query, most frequent first,
+        excluding any that contain a stopword.
+
+        :param query: Autocomplete query string.
+        :return: List of autocomplete suggestions.
+        """
+        query_words = query.lower().split()
+        if not query_words or any(not re.fullmatch(r'\w+', word) for word in query_words):
+            return []
+        if query[-1].isspace():
+            words, partial = query_words, ""
+        else:
+            words, partial = query_words[:-1], query_words[-1]
+        if len(words) > 2:
+            return []
+
+        with stage("ngram_scan"):
+            matches = self.ngrams.complete(words, partial, exclude=self.stopwords)
+        suggestions = [ngram for ngram, _ in matches]
+        logging.info(f"Autocomplete found {len(suggestions)} suggestions for '{query}'")
+        return suggestions
+
+    @locked
     def alternative_search_results(self, query):
         """
         Provide alternative search results based on the query.
 
+        Terms missing from the vocabulary are expanded to their closest words, weighted below exact matches.
+
         :param query: Search query string.
         :return: List of alternative search results with filenames and match percentages.
         """
         query_terms = query.lower().split()
-        match_counts = defaultdict(int)
-        matched_files = set()
+        match_weights = defaultdict(float)
 
         for term in query_terms:
-            if term in self.index:
-                matched_files.update(self.index[term])
+            alternatives = self.fuzzy_index.expand(term)
+            term_weights = defaultdict(float)
+            with stage("postings"):
+                for word, weight in alternatives.items():
+                    for filename in self.index.get(word, {}):
+                        term_weights[filename] = max(term_weights[filename], weight)
+            for filename, weight in term_weights.items():
+                match_weights[filename] += weight
 
         results = []
-        for filename in matched_files:
-            match_percentage = sum(
-                1 for term in query_terms if term in self.index and filename in self.index[term]) / len(
-                query_terms) * 100
+        for filename, weight in match_weights.items():
+            match_percentage = weight / len(query_terms) * 100
             results.append({
                 "file_name": filename,
                 "match_percentage": match_percentage
             })
 
-        return sorted(results, key=lambda x: x["match_percentage"], reverse=True)
+        return sorted(results, key=lambda x: (-x["match_percentage"], x["file_name"]))
 
 
 if __name__ == "__app__":
@@ -0,0 +1,224 @@
+from bisect import bisect_left
+
+import numpy as np
+
+ID_BITS = 21  # token ids are packed three to a 64-bit key
+MAX_TOKEN_ID = (1 << ID_BITS) - 1
+ID_MASK = np.uint64(MAX_TOKEN_ID)
+SHIFTS = (np.uint64(2 * ID_BITS), np.uint64(ID_BITS), np.uint64(0))
+
+
+class CountMinSketch:
+    def __init__(self, width_bits=20, depth=4, seed=0):
+        """
+        Count-min sketch over 64-bit integer keys, using multiply-shift hashing.
+
+        :param width_bits: log2 of the number of counters per row.
+        :param depth: Number of rows (independent hash functions).
+        :param seed: Seed for the hash multipliers.
+        """
+        generator = np.random.default_rng(seed)
+        self.multipliers = generator.integers(1, 2 ** 63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.shift = np.uint64(64 - width_bits)
+        self.table = np.zeros((depth, 1 << width_bits), dtype=np.uint32)
+
+    def buckets(self, keys):
+        """
+        :param keys: uint64 array of keys.
+        :return: (depth, len(keys)) array of counter indexes.
+        """
+        with np.errstate(over="ignore"):
+            return (keys[np.newaxis, :] * self.multipliers[:, np.newaxis]) >> self.shift
+
+    def add(self, keys, counts):
+        """
+        Add counts for distinct keys and return their estimates before and after the update.
+
+        :param keys: uint64 array of distinct keys.
+        :param counts: Count to add for each key.
+        :return: (estimates before, estimates after) arrays.
+        """
+        buckets = self.buckets(keys)
+        rows = np.arange(len(self.table))[:, np.newaxis]
+        before = self.table[rows, buckets].min(axis=0)
+        np.add.at(self.table, (np.broadcast_to(rows, buckets.shape), buckets), counts.astype(np.uint32))
+        after = self.table[rows, buckets].min(axis=0)
+        return before, after
+
+
+class NGramStore:
+    def __init__(self, min_trigram_count=1):
+        """
+        Unigram, bigram and trigram counts over integer-interned tokens.
+
+        Each n-gram is packed into a single uint64 key (21 bits per token id) and counts
+        are kept as sorted NumPy arrays, so a trigram costs 12 bytes instead of a tuple
+        of strings. Documents are buffered by add() and merged into the arrays by freeze().
+
+        :param min_trigram_count: When above 1, trigrams are only kept once a count-min
+                                  sketch estimates they occurred at least this often.
+        """
+        self.token_ids = {}
+        self.tokens = []
+        self.sorted_tokens = []
+        self.keys = [np.empty(0, dtype=np.uint64) for _ in range(3)]
+        self.counts = [np.empty(0, dtype=np.int64) for _ in range(3)]
+        self.pending = [[] for _ in range(3)]
+        self.min_trigram_count = min_trigram_count
+        self.sketch = CountMinSketch() if min_trigram_count > 1 else None
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.keys)
+
+    def intern(self, token):
+        """
+        :param token: Token string.
+        :return: The token's integer id, assigning a new one if needed.
+        """
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            if token_id > MAX_TOKEN_ID:
+                raise ValueError(f"Vocabulary exceeds {MAX_TOKEN_ID + 1} tokens")
+            self.token_ids[token] = token_id
+            self.tokens.append(token)
+        return token_id
+
+    def add(self, words):
+        """
+        Count the n-grams of one document's token stream.
+
+        :param words: List of lowercased tokens.
+        """
+        ids = np.fromiter((self.intern(word) for word in words), dtype=np.uint64, count=len(words))
+        for order in range(3):
+            if len(ids) <= order:
+                break
+            keys = ids[:len(ids) - order].copy()
+            for offset in range(1, order + 1):
+                keys = (keys << np.uint64(ID_BITS)) | ids[offset:len(ids) - order + offset]
+            keys, counts = np.unique(keys, return_counts=True)
+            if order == 2 and self.sketch is not None:
+                keys, counts = self.prune(keys, counts)
+            self.pending[order].append((keys, counts))
+
+    def prune(self, keys, counts):
+        """
+        Drop trigrams the count-min sketch still considers rare.
+
+        A trigram's first kept count is its sketch estimate, which covers the occurrences
+        seen before it crossed the threshold.
+
+        :param keys: Distinct trigram keys of one document.
+        :param counts: Their counts within the document.
+        :return: (keys, counts) of the trigrams to keep.
+        """
+        before, after = self.sketch.add(keys, counts)
+        established = before >= self.min_trigram_count
+        crossed = ~established & (after >= self.min_trigram_count)
+        kept_counts = np.where(crossed, after, counts)
+        keep = established | crossed
+        return keys[keep], kept_counts[keep].astype(np.int64)
+
+    def freeze(self):
+        """
+        Merge buffered documents into the sorted key and count arrays.
+        """
+        for order in range(3):
+            if not self.pending[order]:
+                continue
+            keys = np.concatenate([self.keys[order]] + [keys for keys, _ in self.pending[order]])
+            counts = np.concatenate([self.counts[order]] + [counts for _, counts in self.pending[order]])
+            self.keys[order], inverse = np.unique(keys, return_inverse=True)
+            self.counts[order] = np.bincount(inverse, weights=counts, minlength=len(self.keys[order])).astype(np.int64)
+            self.pending[order] = []
+        self.sorted_tokens = sorted(self.tokens)
+
+    def count(self, ngram):
+        """
+        :param ngram: Tuple of one to three tokens.
+        :return: How often the n-gram occurred (0 if unseen or pruned).
+        """
+        if not 1 <= len(ngram) <= 3 or any(token not in self.token_ids for token in ngram):
+            return 0
+        key = 0
+        for token in ngram:
+            key = (key << ID_BITS) | self.token_ids[token]
+        keys = self.keys[len(ngram) - 1]
+        position = np.searchsorted(keys, np.uint64(key))
+        if position < len(keys) and keys[position] == key:
+            return int(self.counts[len(ngram) - 1][position])
+        return 0
+
+    def prefix_ids(self, prefix):
+        """
+        :param prefix: Token prefix.
+        :return: uint64 array of ids of every token starting with the prefix.
+        """
+        start = bisect_left(self.sorted_tokens, prefix)
+        ids = []
+        for token in self.sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            ids.append(self.token_ids[token])
+        return np.array(ids, dtype=np.uint64)
+
+    def components(self, order, keys):
+        """
+        Unpack keys of the given order into one id array per position.
+
+        :param order: 0 for unigrams, 1 for bigrams, 2 for trigrams.
+        :param keys: uint64 array of packed keys.
+        :return: List of order + 1 id arrays.
+        """
+        return [(keys >> SHIFTS[3 - order - 1 + position]) & ID_MASK for position in range(order + 1)]
+
+    def complete(self, words, partial, exclude=()):
+        """
+        Find n-grams that start with the given complete words followed by a word
+        beginning with `partial`.
+
+        :param words: Complete leading tokens.
+        :param partial: Prefix of the next token ("" matches any token).
+        :param exclude: Tokens that must not appear anywhere in a returned n-gram.
+        :return: List of (ngram string, count) sorted by count, most frequent first.
+        """
+        if any(word not in self.token_ids for word in words):
+            return []
+        fixed = [np.uint64(self.token_ids[word]) for word in words]
+        candidates = self.prefix_ids(partial)
+        if not len(candidates):
+            return []
+        excluded = np.array([self.token_ids[token] for token in exclude if token in self.token_ids], dtype=np.uint64)
+
+        matches = []
+        for order in range(len(words), 3):
+            keys = self.keys[order]
+            parts = self.components(order, keys)
+            mask = np.isin(parts[len(words)], candidates)
+            for position, token_id in enumerate(fixed):
+                mask &= parts[position] == token_id
+            for part in parts:
+                mask &= ~np.isin(part, excluded)
+            for key, count in zip(keys[mask], self.counts[order][mask]):
+                ngram = ' '.join(self.tokens[int(token_id)] for token_id in self.components(order, key))
+                matches.append((ngram, int(count)))
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def summary(self, limit=20):
+        """
+        Describe the store for debug logging.
+
+        :param limit: Number of most frequent n-grams to include per order.
+        :return: Dict with per-order sizes and top n-grams.
+        """
+        summary = {"tokens": len(self.tokens)}
+        for order, name in enumerate(("unigrams", "bigrams", "trigrams")):
+            top = np.argsort(self.counts[order])[::-1][:limit]
+            summary[name] = {
+                "distinct": len(self.keys[order]),
+                "bytes": self.keys[order].nbytes + self.counts[order].nbytes,
+                "top": [(' '.join(self.tokens[int(token_id)] for token_id in self.components(order, self.keys[order][i])),
+                         int(self.counts[order][i])) for i in top],
+            }
+        return summary
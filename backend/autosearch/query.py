@@ -0,0 +1,80 @@
+import re
+
+TOKEN_PATTERN = re.compile(r'\b\w+\b')
+QUERY_PATTERN = re.compile(r'"([^"]*)"|NEAR/(\d+)|(\S+)')
+
+
+class Phrase:
+    def __init__(self, terms, exact=True):
+        """
+        A run of terms that must appear at consecutive token positions.
+        A bare query word is a phrase of length one.
+
+        :param terms: Lowercased query terms in order.
+        :param exact: Whether terms must match literally; bare words allow typo-tolerant expansion.
+        """
+        self.terms = terms
+        self.exact = exact
+
+    def __repr__(self):
+        return f"Phrase({self.terms!r}, exact={self.exact})"
+
+
+class Near:
+    def __init__(self, left, right, distance):
+        """
+        Two operands that must appear within `distance` tokens of each other, in either order.
+
+        :param left: Left operand (Phrase or Near).
+        :param right: Right operand (Phrase or Near).
+        :param distance: Maximum number of tokens allowed between the two operands.
+        """
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Near({self.left!r}, {self.right!r}, {self.distance})"
+
+
+def tokenize(text):
+    """
+    Split text into lowercased word tokens, the same way documents are tokenized at index time.
+
+    :param text: Text to tokenize.
+    :return: List of lowercased tokens.
+    """
+    return [match.group().lower() for match in TOKEN_PATTERN.finditer(text)]
+
+
+def parse_query(query):
+    """
+    Parse a search query into a list of clauses that must all match.
+
+    Quoted text ("termination for convenience") is an exact phrase, bare words are
+    typo-tolerant single-term clauses and `a NEAR/k b` requires both operands within k tokens.
+    NEAR binds to the operands directly on either side and chains left to right.
+
+    :param query: Raw query string.
+    :return: List of Phrase / Near clauses.
+    """
+    clauses = []
+    pending_distance = None
+    for match in QUERY_PATTERN.finditer(query):
+        phrase, distance, word = match.groups()
+        if distance is not None:
+            if clauses:
+                pending_distance = int(distance)
+            continue
+
+        terms = tokenize(phrase if phrase is not None else word)
+        if not terms:
+            continue
+        operand = Phrase(terms, exact=phrase is not None)
+        if pending_distance is not None:
+            clauses[-1] = Near(clauses[-1], operand, pending_distance)
+            pending_distance = None
+        else:
+            clauses.append(operand)
+    return clauses
+
@@ -0,0 +1,153 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import svds
+
+REFIT_RATIO = 0.2  # refit the SVD once this fraction of documents was only folded in
+BLOCK_SIZE = 4096  # documents scored per matrix product, bounding the dense score block
+
+
+class SimilarityIndex:
+    def __init__(self, components=0):
+        """
+        TF-IDF document-term matrix for finding similar documents, optionally reduced to
+        latent semantic (LSA) vectors with a truncated SVD.
+
+        Term counts are kept as sparse rows that are appended as documents are added;
+        freeze() recomputes the IDF weights and row norms from them, which is linear in the
+        number of non-zero entries, instead of re-tokenizing anything. With LSA enabled,
+        new documents are folded into the existing SVD basis and the SVD is only refit once
+        enough of the corpus was folded in.
+
+        :param components: Number of LSA dimensions; 0 compares raw TF-IDF vectors.
+        """
+        self.components = components
+        self.term_ids = {}
+        self.doc_names = []
+        self.doc_ids = {}
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.float32)  # sublinear term frequencies
+        self.pending = {}  # filename -> (term ids, term frequencies)
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float32)  # L2-normalized TF-IDF rows
+        self.basis = None  # term -> LSA component projection (terms x components)
+        self.vectors = None  # L2-normalized LSA vectors (documents x components)
+        self.fitted_documents = 0
+
+    def __len__(self):
+        return len(self.doc_names)
+
+    def __contains__(self, filename):
+        return filename in self.doc_ids
+
+    def add(self, filename, words):
+        """
+        Buffer a document's term frequencies; they are merged in by freeze().
+        Adding a filename again replaces its previous version.
+
+        :param filename: Document name.
+        :param words: List of lowercased tokens.
+        """
+        ids = np.fromiter((self.term_ids.setdefault(word, len(self.term_ids)) for word in words),
+                          dtype=np.int64, count=len(words))
+        term_ids, term_counts = np.unique(ids, return_counts=True)
+        self.pending[filename] = (term_ids, (1 + np.log(term_counts)).astype(np.float32))
+
+    def freeze(self):
+        """
+        Merge buffered documents into the matrix and recompute the TF-IDF weights.
+        """
+        if not self.pending:
+            return
+        shape = (len(self.doc_names), len(self.term_ids))
+        kept = [doc_id for doc_id, name in enumerate(self.doc_names) if name not in self.pending]
+        self.counts.resize(shape)
+        rows = [self.counts[kept]] if kept else []
+
+        names = list(self.pending)
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum([len(self.pending[name][0]) for name in names], out=indptr[1:])
+        new_rows = sparse.csr_matrix(
+            (np.concatenate([self.pending[name][1] for name in names]),
+             np.concatenate([self.pending[name][0] for name in names]), indptr),
+            shape=(len(names), len(self.term_ids)))
+        self.counts = sparse.vstack(rows + [new_rows], format="csr")
+        self.doc_names = [self.doc_names[doc_id] for doc_id in kept] + names
+        self.doc_ids = {name: doc_id for doc_id, name in enumerate(self.doc_names)}
+        self.pending = {}
+
+        document_frequency = np.bincount(self.counts.indices, minlength=self.counts.shape[1])
+        idf = (np.log((1 + len(self.doc_names)) / (1 + document_frequency)) + 1).astype(np.float32)
+        self.matrix = self.normalize(self.counts @ sparse.diags(idf))
+
+        if self.components:
+            if self.basis is None or len(self.doc_names) - self.fitted_documents > REFIT_RATIO * len(self.doc_names):
+                self.fit_components()
+            else:
+                # Fold new documents into the existing basis; terms it has not seen get no weight.
+                missing = self.matrix.shape[1] - self.basis.shape[0]
+                self.basis = np.vstack([self.basis, np.zeros((missing, self.basis.shape[1]), dtype=np.float32)])
+                self.vectors = self.normalize(self.matrix @ self.basis)
+
+    def fit_components(self):
+        """
+        Fit the LSA basis with a truncated SVD of the TF-IDF matrix.
+        """
+        k = min(self.components, min(self.matrix.shape) - 1)
+        if k < 1:
+            self.basis = np.zeros((self.matrix.shape[1], 0), dtype=np.float32)
+        else:
+            _, _, vt = svds(self.matrix, k=k, random_state=0)
+            self.basis = np.ascontiguousarray(vt.T, dtype=np.float32)
+        self.vectors = self.normalize(self.matrix @ self.basis)
+        self.fitted_documents = len(self.doc_names)
+
+    @staticmethod
+    def normalize(rows):
+        """
+        :param rows: Sparse or dense matrix.
+        :return: The matrix with every non-zero row scaled to unit L2 norm.
+        """
+        if sparse.issparse(rows):
+            norms = np.sqrt(np.asarray(rows.multiply(rows).sum(axis=1)).ravel())
+            norms[norms == 0] = 1
+            return sparse.csr_matrix(sparse.diags(1 / norms) @ rows, dtype=np.float32)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return (rows / norms).astype(np.float32)
+
+    def most_similar(self, filenames, top_k=10):
+        """
+        Find the nearest neighbours of several documents by cosine similarity, scoring the
+        whole batch against each block of the corpus with one matrix product.
+
+        :param filenames: Indexed documents to find neighbours for.
+        :param top_k: Number of neighbours per document.
+        :return: Dict mapping each filename to a list of (filename, similarity) tuples,
+                 most similar first, excluding the document itself.
+        """
+        self.freeze()
+        rows = np.array([self.doc_ids[filename] for filename in filenames], dtype=np.int64)
+        vectors = self.vectors if self.components else self.matrix
+        queries = vectors[rows]
+        scores = np.empty((len(rows), len(self.doc_names)), dtype=np.float32)
+        for start in range(0, len(self.doc_names), BLOCK_SIZE):
+            block = queries @ vectors[start:start + BLOCK_SIZE].T
+            scores[:, start:start + BLOCK_SIZE] = block.toarray() if sparse.issparse(block) else block
+        scores[np.arange(len(rows)), rows] = -np.inf
+
+        top_k = min(top_k, len(self.doc_names) - 1)
+        neighbours = {}
+        for filename, row in zip(filenames, scores):
+            if top_k <= 0:
+                neighbours[filename] = []
+                continue
+            candidates = np.argpartition(-row, top_k - 1)[:top_k]
+            ranked = sorted(candidates, key=lambda doc_id: (-row[doc_id], self.doc_names[doc_id]))
+            neighbours[filename] = [(self.doc_names[doc_id], round(float(row[doc_id]), 6)) for doc_id in ranked]
+        return neighbours
+
+    def similar(self, filename, top_k=10):
+        """
+        :param filename: Indexed document.
+        :param top_k: Number of neighbours.
+        :return: List of (filename, similarity) tuples, most similar first.
+        """
+        return self.most_similar([filename], top_k)[filename]
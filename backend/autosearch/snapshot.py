@@ -0,0 +1,759 @@
+"""
+Read-only index snapshots shared between worker processes.
+
+A snapshot is a directory of .npy files written once by whichever process builds the
+index. Every worker maps the same files with np.load(mmap_mode="r"), so the postings,
+vocabulary, n-gram tables and document text live once in the OS page cache no matter
+how many uvicorn workers attach to them, and so do the TF-IDF matrix behind similar
+document lookups, stored as the CSR arrays scipy builds its sparse matrices from, and the
+MinHash signatures and near-duplicate clusters. The much
+smaller entity index used by advanced search is stored as entities.json and loaded by
+each worker.
+
+Snapshots are published as numbered generations under a root directory. The CURRENT
+file names the live generation and is replaced atomically, so a rebuild never exposes
+a half-written index; workers notice the new generation and swap to it.
+
+Build and publish a snapshot from the command line (from the backend directory):
+
+    python -m autosearch.snapshot --pdf-directory pdf --index-dir /var/lib/owleyes/index
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import sparse
+
+from advancedsearch.entities import EntityExtractor, EntityIndex
+from autosearch.duplicates import MinHashIndex
+from autosearch.fuzzy import FuzzyIndex
+from autosearch.indexer import Indexer
+from autosearch.ngrams import ID_BITS, NGramStore
+from autosearch.similarity import SimilarityIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishing is still atomic, concurrent builds are just not serialized
+    fcntl = None
+
+SNAPSHOT_VERSION = 6
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "build.lock"
+KEEP_GENERATIONS = 2
+
+
+def corpus_signature(pdf_directory):
+    """
+    Fingerprint the PDFs in a directory by name, size and modification time.
+
+    :param pdf_directory: Directory of PDF files.
+    :return: Hex digest that changes whenever a PDF is added, removed or modified.
+    """
+    digest = hashlib.sha1()
+    for filename in sorted(os.listdir(pdf_directory)):
+        if filename.endswith(".pdf"):
+            stat = os.stat(os.path.join(pdf_directory, filename))
+            digest.update(f"{filename}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def pack_strings(strings):
+    """
+    Pack strings into a UTF-8 blob and an offsets array.
+
+    :param strings: Sequence of strings.
+    :return: (uint8 blob, int64 offsets of length len(strings) + 1).
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def pack_ranges(items):
+    """
+    Concatenate per-document arrays into one array with a CSR-style pointer array.
+
+    :param items: List of 1-D sequences, one per document.
+    :return: (concatenated values, int64 pointers of length len(items) + 1).
+    """
+    pointers = np.zeros(len(items) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in items], out=pointers[1:])
+    values = np.concatenate([np.asarray(item, dtype=np.int64) for item in items]) if items else np.empty(0)
+    return values, pointers
+
+
+class StringTable(Sequence):
+    def __init__(self, blob, offsets):
+        """
+        Sequence of strings stored in a shared UTF-8 blob.
+
+        When the strings were packed in sorted order, membership and id lookups use binary
+        search; UTF-8 byte order matches Python's code point order.
+
+        :param blob: uint8 array of concatenated UTF-8 strings.
+        :param offsets: int64 array of string boundaries.
+        """
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step == 1:
+                return StringTable(self.blob, self.offsets[start:max(start, stop) + 1])  # a view, decoded lazily
+            return [self[j] for j in range(start, stop, step)]
+        if i < 0:
+            i += len(self)
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __contains__(self, string):
+        return self.find(string) >= 0
+
+    def find(self, string):
+        """
+        :param string: String to look up; the table must be sorted.
+        :return: Its position, or -1 if absent.
+        """
+        position = bisect_left(self, string)
+        return position if position < len(self) and self[position] == string else -1
+
+    def prefix_range(self, prefix):
+        """
+        :param prefix: String prefix; the table must be sorted.
+        :return: (start, end) positions of the strings starting with the prefix.
+        """
+        start = bisect_left(self, prefix)
+        end = start
+        while end < len(self) and self[end].startswith(prefix):
+            end += 1
+        return start, end
+
+
+class StringIds(Mapping):
+    def __init__(self, table):
+        """
+        Read-only string -> position mapping over a sorted StringTable.
+
+        :param table: Sorted StringTable.
+        """
+        self.table = table
+
+    def __getitem__(self, string):
+        position = self.table.find(string)
+        if position < 0:
+            raise KeyError(string)
+        return position
+
+    def __contains__(self, string):
+        return self.table.find(string) >= 0
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+
+class SharedPostings(Mapping):
+    def __init__(self, vocabulary, doc_names, term_pointers, entry_docs, entry_pointers, positions):
+        """
+        Positional postings (term -> {filename: positions}) over shared CSR arrays.
+
+        :param vocabulary: Sorted StringTable of terms.
+        :param doc_names: List of filenames indexed by document id.
+        :param term_pointers: For each term, the range of its entries.
+        :param entry_docs: Document id of each (term, document) entry.
+        :param entry_pointers: For each entry, the range of its positions.
+        :param positions: Token positions of all entries.
+        """
+        self.vocabulary = vocabulary
+        self.doc_names = doc_names
+        self.term_pointers = term_pointers
+        self.entry_docs = entry_docs
+        self.entry_pointers = entry_pointers
+        self.positions = positions
+
+    def __getitem__(self, term):
+        term_id = self.vocabulary.find(term)
+        if term_id < 0:
+            raise KeyError(term)
+        postings = {}
+        for entry in range(self.term_pointers[term_id], self.term_pointers[term_id + 1]):
+            start, end = self.entry_pointers[entry], self.entry_pointers[entry + 1]
+            postings[self.doc_names[self.entry_docs[entry]]] = self.positions[start:end].tolist()
+        return postings
+
+    def __contains__(self, term):
+        return term in self.vocabulary
+
+    def __iter__(self):
+        return iter(self.vocabulary)
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+
+class SharedDocuments(Mapping):
+    def __init__(self, doc_names, blob, offsets):
+        """
+        filename -> document text over a shared UTF-8 blob; text is decoded on access.
+
+        :param doc_names: List of filenames indexed by document id.
+        :param blob: uint8 array of concatenated UTF-8 documents.
+        :param offsets: int64 array of document boundaries.
+        """
+        self.doc_ids = {name: doc_id for doc_id, name in enumerate(doc_names)}
+        self.texts = StringTable(blob, offsets)
+
+    def __getitem__(self, filename):
+        return self.texts[self.doc_ids[filename]]
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+class SharedRanges(Mapping):
+    def __init__(self, doc_names, pointers, *columns):
+        """
+        filename -> per-document slices of one or more shared arrays.
+
+        :param doc_names: List of filenames indexed by document id.
+        :param pointers: CSR pointers delimiting each document's rows.
+        :param columns: Arrays sliced with the same pointers.
+        """
+        self.doc_ids = {name: doc_id for doc_id, name in enumerate(doc_names)}
+        self.pointers = pointers
+        self.columns = columns
+
+    def __getitem__(self, filename):
+        doc_id = self.doc_ids[filename]
+        start, end = self.pointers[doc_id], self.pointers[doc_id + 1]
+        sliced = tuple(column[start:end] for column in self.columns)
+        return sliced[0] if len(sliced) == 1 else sliced
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+class SharedNGramStore(NGramStore):
+    def __init__(self, vocabulary, keys, counts):
+        """
+        Frozen n-gram store whose token ids are positions in the shared sorted vocabulary,
+        so prefix lookups are a contiguous id range.
+
+        :param vocabulary: Sorted StringTable of tokens.
+        :param keys: Packed unigram, bigram and trigram keys.
+        :param counts: Matching counts.
+        """
+        super().__init__()
+        self.tokens = vocabulary
+        self.token_ids = StringIds(vocabulary)
+        self.keys = keys
+        self.counts = counts
+
+    def add(self, words):
+        raise TypeError("Shared n-gram stores are read-only")
+
+    def prefix_ids(self, prefix):
+        start, end = self.tokens.prefix_range(prefix)
+        return np.arange(start, end, dtype=np.uint64)
+
+
+class SharedFuzzyIndex(FuzzyIndex):
+    def __init__(self, vocabulary, delete_table, delete_pointers, delete_words, max_distance, prefix_length):
+        """
+        Deletion index whose delete variants and word lists live in shared arrays.
+
+        :param vocabulary: Sorted StringTable of words.
+        :param delete_table: Sorted StringTable of delete variants.
+        :param delete_pointers: For each variant, the range of its words.
+        :param delete_words: Vocabulary ids of the words under each variant.
+        :param max_distance: Largest edit distance supported by lookups.
+        :param prefix_length: Number of leading characters used to generate deletes.
+        """
+        super().__init__(max_distance=max_distance, prefix_length=prefix_length)
+        self.vocabulary = vocabulary
+        self.words = vocabulary
+        self.delete_table = delete_table
+        self.delete_pointers = delete_pointers
+        self.delete_words = delete_words
+
+    def add_words(self, words):
+        if words:
+            raise TypeError("Shared fuzzy indexes are read-only")
+
+    def delete_candidates(self, variant):
+        position = self.delete_table.find(variant)
+        if position < 0:
+            return ()
+        start, end = self.delete_pointers[position], self.delete_pointers[position + 1]
+        return [self.vocabulary[int(word_id)] for word_id in self.delete_words[start:end]]
+
+
+class SharedSimilarityIndex(SimilarityIndex):
+    def __init__(self, doc_names, matrix, vectors=None):
+        """
+        Frozen similarity index over a shared TF-IDF matrix and LSA vectors.
+
+        :param doc_names: Filenames of the matrix rows.
+        :param matrix: L2-normalized TF-IDF rows as a CSR matrix over shared arrays.
+        :param vectors: L2-normalized LSA vectors, or None when LSA is disabled.
+        """
+        super().__init__(components=0 if vectors is None else vectors.shape[1])
+        self.doc_names = doc_names
+        self.doc_ids = {name: doc_id for doc_id, name in enumerate(doc_names)}
+        self.matrix = matrix
+        self.vectors = vectors
+
+    def add(self, filename, words):
+        raise TypeError("Shared similarity indexes are read-only")
+
+
+class SharedMinHashIndex(MinHashIndex):
+    def __init__(self, doc_names, signatures, clusters, threshold):
+        """
+        Frozen near-duplicate index over shared signatures and precomputed clusters.
+
+        :param doc_names: Filenames of the signature rows.
+        :param signatures: uint32 array of MinHash signatures, one row per document.
+        :param clusters: For each document, the row of its cluster's representative.
+        :param threshold: Similarity threshold the clusters were built with.
+        """
+        super().__init__(threshold=threshold, num_permutations=signatures.shape[1])
+        self.signatures = {name: signatures[doc_id] for doc_id, name in enumerate(doc_names)}
+        self.parent = {name: doc_names[root] for name, root in zip(doc_names, clusters.tolist())}
+        for name, root in self.parent.items():
+            self.members.setdefault(root, set()).add(name)
+
+    def add(self, filename, words):
+        raise TypeError("Shared near-duplicate indexes are read-only")
+
+
+def write_snapshot(indexer, directory, signature=None, entity_index=None):
+    """
+    Serialize a built Indexer into a snapshot directory.
+
+    :param indexer: Indexer whose build has finished.
+    :param directory: Empty directory to write .npy files, meta.json and entities.json into.
+    :param signature: Corpus signature recorded for staleness checks.
+    :param entity_index: EntityIndex over the same documents; built with the heuristics-only
+                         EntityExtractor if omitted.
+    """
+    arrays = {}
+    vocabulary = sorted(indexer.index)
+    vocabulary_ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+    doc_names = sorted(indexer.documents)
+    doc_ids = {name: doc_id for doc_id, name in enumerate(doc_names)}
+    arrays["vocabulary_blob"], arrays["vocabulary_offsets"] = pack_strings(vocabulary)
+
+    term_pointers, entry_docs, entry_lengths, positions = [0], [], [], []
+    for term in vocabulary:
+        postings = indexer.index[term]
+        for filename in sorted(postings, key=doc_ids.get):
+            entry_docs.append(doc_ids[filename])
+            entry_lengths.append(len(postings[filename]))
+            positions.extend(postings[filename])
+        term_pointers.append(len(entry_docs))
+    arrays["term_pointers"] = np.array(term_pointers, dtype=np.int64)
+    arrays["entry_docs"] = np.array(entry_docs, dtype=np.uint32)
+    arrays["entry_pointers"] = np.concatenate([[0], np.cumsum(entry_lengths, dtype=np.int64)])
+    arrays["positions"] = np.array(positions, dtype=np.uint32)
+
+    texts = [indexer.documents[name] for name in doc_names]
+    arrays["text_blob"], arrays["text_offsets"] = pack_strings(texts)
+    arrays["lower_blob"], arrays["lower_offsets"] = pack_strings([text.lower() for text in texts])
+
+    token_starts, arrays["token_pointers"] = pack_ranges([indexer.token_offsets[name][0] for name in doc_names])
+    token_ends, _ = pack_ranges([indexer.token_offsets[name][1] for name in doc_names])
+    arrays["token_starts"], arrays["token_ends"] = token_starts.astype(np.uint32), token_ends.astype(np.uint32)
+    line_starts, arrays["line_pointers"] = pack_ranges([indexer.line_starts[name] for name in doc_names])
+    arrays["line_starts"] = line_starts.astype(np.uint32)
+    page_starts, arrays["page_pointers"] = pack_ranges([indexer.page_starts[name] for name in doc_names])
+    arrays["page_starts"] = page_starts.astype(np.uint32)
+    boxes = [indexer.word_boxes[name] for name in doc_names]
+    word_starts, arrays["word_pointers"] = pack_ranges([box[0] for box in boxes])
+    arrays["word_starts"] = word_starts.astype(np.uint32)
+    arrays["word_ends"] = pack_ranges([box[1] for box in boxes])[0].astype(np.uint32)
+    arrays["word_pages"] = pack_ranges([box[2] for box in boxes])[0].astype(np.uint32)
+    arrays["word_rects"] = np.array([rect for box in boxes for rect in box[3]], dtype=np.float64).reshape(-1, 4)
+    clauses = [indexer.clauses[name] for name in doc_names]
+    clause_starts, arrays["clause_pointers"] = pack_ranges([clause[0] for clause in clauses])
+    arrays["clause_starts"] = clause_starts.astype(np.uint32)
+    arrays["clause_ends"] = pack_ranges([clause[1] for clause in clauses])[0].astype(np.uint32)
+    arrays["clause_levels"] = pack_ranges([clause[2] for clause in clauses])[0].astype(np.uint8)
+    arrays["clause_number_blob"], arrays["clause_number_offsets"] = pack_strings(
+        [number for clause in clauses for number in clause[3]])
+    arrays["clause_title_blob"], arrays["clause_title_offsets"] = pack_strings(
+        [title for clause in clauses for title in clause[4]])
+
+    # Re-key the n-grams by sorted vocabulary id so shared prefix lookups are id ranges.
+    ngrams = indexer.ngrams
+    remap = np.array([vocabulary_ids[token] for token in ngrams.tokens], dtype=np.uint64)
+    for order in range(3):
+        keys = np.zeros(len(ngrams.keys[order]), dtype=np.uint64)
+        for part in ngrams.components(order, ngrams.keys[order]):
+            keys = (keys << np.uint64(ID_BITS)) | remap[part.astype(np.int64)]
+        ordering = np.argsort(keys, kind="stable")
+        arrays[f"ngram_keys_{order}"] = keys[ordering]
+        arrays[f"ngram_counts_{order}"] = ngrams.counts[order][ordering]
+
+    fuzzy = indexer.fuzzy_index
+    variants = sorted(fuzzy.deletes)
+    arrays["delete_blob"], arrays["delete_offsets"] = pack_strings(variants)
+    delete_words, arrays["delete_pointers"] = pack_ranges(
+        [sorted(vocabulary_ids[word] for word in fuzzy.deletes[variant]) for variant in variants])
+    arrays["delete_words"] = delete_words.astype(np.uint32)
+
+    similarity = indexer.similarity
+    similarity.freeze()
+    similarity_names = [name for name in doc_names if name in similarity]
+    rows = [similarity.doc_ids[name] for name in similarity_names]
+    matrix = similarity.matrix[rows] if rows else sparse.csr_matrix((0, 0), dtype=np.float32)
+    arrays["similarity_data"] = matrix.data.astype(np.float32)
+    arrays["similarity_indices"] = matrix.indices.astype(np.int32)
+    arrays["similarity_indptr"] = matrix.indptr.astype(np.int64)
+    if similarity.components:
+        # An empty corpus has no fitted LSA vectors yet; keep the configured width so the loader agrees.
+        vectors = similarity.vectors if similarity.vectors is not None else np.zeros((0, similarity.components),
+                                                                                     dtype=np.float32)
+        arrays["similarity_vectors"] = vectors[rows]
+
+    duplicates = indexer.duplicates
+    duplicates.freeze()
+    duplicate_names = [name for name in doc_names if name in duplicates]
+    duplicate_ids = {name: doc_id for doc_id, name in enumerate(duplicate_names)}
+    arrays["minhash_signatures"] = np.array([duplicates.signatures[name] for name in duplicate_names],
+                                            dtype=np.uint32).reshape(len(duplicate_names), len(duplicates.multipliers))
+    arrays["duplicate_clusters"] = np.array([duplicate_ids[duplicates.find(name)] for name in duplicate_names],
+                                            dtype=np.int64)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "signature": signature,
+        "created": time.time(),
+        "documents": doc_names,
+        "fuzzy": {"max_distance": fuzzy.max_distance, "prefix_length": fuzzy.prefix_length},
+        "similarity": {"documents": similarity_names, "terms": matrix.shape[1],
+                       "components": similarity.components},
+        "duplicates": {"documents": duplicate_names, "threshold": duplicates.threshold},
+    }
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+
+    if entity_index is None:
+        entity_index = EntityExtractor().index_documents(indexer.documents)
+    with open(os.path.join(directory, "entities.json"), "w", encoding="utf-8") as entities_file:
+        json.dump(entity_index.to_dict(), entities_file)
+
+
+def read_meta(directory):
+    """
+    :param directory: Snapshot directory.
+    :return: The snapshot's meta.json contents.
+    """
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as meta_file:
+        return json.load(meta_file)
+
+
+class IndexSnapshot:
+    def __init__(self, directory):
+        """
+        Attach to a snapshot directory, memory-mapping its arrays read-only.
+
+        :param directory: Directory written by write_snapshot.
+        """
+        self.meta = read_meta(directory)
+        if self.meta["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {self.meta['version']} in {directory}")
+        self.directory = directory
+        self.doc_names = self.meta["documents"]
+        self.vocabulary = StringTable(self.array("vocabulary_blob"), self.array("vocabulary_offsets"))
+        self.documents = SharedDocuments(self.doc_names, self.array("text_blob"), self.array("text_offsets"))
+        self.lowercase_documents = SharedDocuments(self.doc_names, self.array("lower_blob"),
+                                                   self.array("lower_offsets"))
+
+    def entity_index(self):
+        """
+        :return: A per-process EntityIndex loaded from the snapshot's entities.json.
+        """
+        with open(os.path.join(self.directory, "entities.json"), encoding="utf-8") as entities_file:
+            return EntityIndex.from_dict(json.load(entities_file))
+
+    def array(self, name):
+        """
+        :param name: Array name.
+        :return: The array, memory-mapped read-only.
+        """
+        return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+    def indexer(self, pdf_directory):
+        """
+        Build a read-only Indexer backed by this snapshot.
+
+        :param pdf_directory: Directory the PDFs are served from.
+        :return: An Indexer whose search, autocomplete and alternative search read shared memory.
+        """
+        indexer = Indexer(pdf_directory, build=False)
+        indexer.index = SharedPostings(self.vocabulary, self.doc_names, self.array("term_pointers"),
+                                       self.array("entry_docs"), self.array("entry_pointers"),
+                                       self.array("positions"))
+        indexer.documents = self.documents
+        indexer.words = self.vocabulary
+        indexer.token_offsets = SharedRanges(self.doc_names, self.array("token_pointers"),
+                                             self.array("token_starts"), self.array("token_ends"))
+        indexer.line_starts = SharedRanges(self.doc_names, self.array("line_pointers"), self.array("line_starts"))
+        indexer.page_starts = SharedRanges(self.doc_names, self.array("page_pointers"), self.array("page_starts"))
+        indexer.word_boxes = SharedRanges(self.doc_names, self.array("word_pointers"), self.array("word_starts"),
+                                          self.array("word_ends"), self.array("word_pages"),
+                                          self.array("word_rects"))
+        indexer.clauses = SharedRanges(self.doc_names, self.array("clause_pointers"), self.array("clause_starts"),
+                                       self.array("clause_ends"), self.array("clause_levels"),
+                                       StringTable(self.array("clause_number_blob"),
+                                                   self.array("clause_number_offsets")),
+                                       StringTable(self.array("clause_title_blob"), self.array("clause_title_offsets")))
+        for filename in self.doc_names:
+            indexer.index_clause_titles(filename)
+        indexer.ngrams = SharedNGramStore(self.vocabulary, [self.array(f"ngram_keys_{order}") for order in range(3)],
+                                          [self.array(f"ngram_counts_{order}") for order in range(3)])
+        indexer.fuzzy_index = SharedFuzzyIndex(
+            self.vocabulary, StringTable(self.array("delete_blob"), self.array("delete_offsets")),
+            self.array("delete_pointers"), self.array("delete_words"), **self.meta["fuzzy"])
+        indexer.similarity = self.similarity_index()
+        meta = self.meta["duplicates"]
+        indexer.duplicates = SharedMinHashIndex(meta["documents"], self.array("minhash_signatures"),
+                                                self.array("duplicate_clusters"), meta["threshold"])
+        return indexer
+
+    def similarity_index(self):
+        """
+        :return: A read-only SimilarityIndex whose matrix wraps the shared CSR arrays without copying.
+        """
+        meta = self.meta["similarity"]
+        matrix = sparse.csr_matrix((self.array("similarity_data"), self.array("similarity_indices"),
+                                    self.array("similarity_indptr")),
+                                   shape=(len(meta["documents"]), meta["terms"]), copy=False)
+        vectors = self.array("similarity_vectors") if meta["components"] else None
+        return SharedSimilarityIndex(meta["documents"], matrix, vectors)
+
+
+class SharedIndexDirectory:
+    def __init__(self, root, pdf_directory, entity_extractor=None, lsa_components=0):
+        """
+        Manage published snapshot generations under a root directory.
+
+        :param root: Directory holding generation subdirectories and the CURRENT pointer.
+        :param pdf_directory: Directory of the PDFs the snapshots are built from.
+        :param entity_extractor: EntityExtractor used when building a generation; defaults
+                                 to the heuristics-only extractor.
+        :param lsa_components: LSA dimensions of the similarity index; 0 keeps raw TF-IDF.
+        """
+        self.root = root
+        self.pdf_directory = pdf_directory
+        self.entity_extractor = entity_extractor or EntityExtractor()
+        self.lsa_components = lsa_components
+        self.generation = None
+        self.snapshot = None
+        self.checked_at = 0.0
+        self.swap_lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+    @contextmanager
+    def build_lock(self):
+        """
+        Hold an exclusive cross-process lock so only one worker builds at a time.
+        """
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def current_generation(self):
+        """
+        :return: Name of the published generation, or None if nothing was published yet.
+        """
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding="utf-8") as current_file:
+                return current_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, indexer, signature):
+        """
+        Write a snapshot of a built Indexer as a new generation and make it current.
+
+        :param indexer: Built Indexer.
+        :param signature: Corpus signature of the PDFs it was built from.
+        :return: The new generation name.
+        """
+        generation = f"gen-{time.time_ns()}-{os.getpid()}"
+        staging = os.path.join(self.root, f".{generation}.tmp")
+        os.makedirs(staging)
+        write_snapshot(indexer, staging, signature, self.entity_extractor.index_documents(indexer.documents))
+        os.rename(staging, os.path.join(self.root, generation))
+
+        pointer = os.path.join(self.root, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+        with open(pointer, "w", encoding="utf-8") as pointer_file:
+            pointer_file.write(generation)
+            pointer_file.flush()
+            os.fsync(pointer_file.fileno())
+        os.replace(pointer, os.path.join(self.root, CURRENT_FILE))
+        logging.info(f"Published index generation {generation}")
+        self.prune(generation)
+        return generation
+
+    def prune(self, current):
+        """
+        Delete old generations, keeping the newest few. Workers that still map an
+        unlinked generation keep reading it until they swap.
+
+        :param current: The generation that was just published.
+        """
+        generations = sorted(name for name in os.listdir(self.root) if name.startswith("gen-"))
+        for name in generations[:-KEEP_GENERATIONS]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def rebuild(self, min_trigram_count=1):
+        """
+        Build the index from the PDF directory and publish it.
+
+        :param min_trigram_count: Passed to Indexer.
+        :return: The new generation name.
+        """
+        signature = corpus_signature(self.pdf_directory)
+        indexer = Indexer(self.pdf_directory, min_trigram_count=min_trigram_count,
+                          lsa_components=self.lsa_components)
+        return self.publish(indexer, signature)
+
+    def attach(self):
+        """
+        Attach to the current generation, building and publishing one first if none exists,
+        its directory is missing or the PDFs changed since it was built. Only one process builds;
+        the others wait.
+
+        :return: The attached IndexSnapshot.
+        """
+        with self.build_lock():
+            generation = self.current_generation()
+            signature = corpus_signature(self.pdf_directory)
+            try:
+                meta = read_meta(os.path.join(self.root, generation)) if generation is not None else None
+            except FileNotFoundError:
+                # CURRENT names a generation that was deleted or pruned: rebuild it like a stale one.
+                meta = None
+            if (meta is None or meta["version"] != SNAPSHOT_VERSION or meta["signature"] != signature
+                    or meta["similarity"]["components"] != self.lsa_components):
+                generation = self.rebuild()
+        return self.load(generation)
+
+    def load(self, generation):
+        """
+        Attach to a specific generation.
+
+        :param generation: Generation name.
+        :return: The IndexSnapshot.
+        """
+        with self.swap_lock:
+            if generation == self.generation:
+                return self.snapshot
+            snapshot = IndexSnapshot(os.path.join(self.root, generation))
+            self.generation = generation
+            self.snapshot = snapshot
+        logging.info(f"Attached to index generation {generation}")
+        return snapshot
+
+    def refresh(self, interval=1.0):
+        """
+        Swap to a newer published generation if there is one. Checks at most once per interval.
+
+        :param interval: Minimum seconds between checks of the CURRENT pointer.
+        :return: The new IndexSnapshot if a swap happened, otherwise None.
+        """
+        with self.swap_lock:
+            now = time.monotonic()
+            if now - self.checked_at < interval:
+                return None
+            self.checked_at = now
+            generation = self.current_generation()
+            if generation is None or generation == self.generation:
+                return None
+            return self.load(generation)
+
+    def watch(self, on_swap, interval=1.0):
+        """
+        Poll for newly published generations on a daemon thread, so mapping a new snapshot
+        never runs on a request (or the event loop).
+
+        :param on_swap: Called from the watcher thread with each newly attached IndexSnapshot.
+        :param interval: Seconds between checks of the CURRENT pointer.
+        :return: The watcher thread.
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    snapshot = self.refresh(interval=0)
+                    if snapshot is not None:
+                        on_swap(snapshot)
+                except Exception:
+                    logging.exception("Failed to swap to a new index generation")
+
+        watcher = threading.Thread(target=run, name="index-watcher", daemon=True)
+        watcher.start()
+        return watcher
+
+
+def main(argv=None):
+    """
+    Build the index from a PDF directory and publish it as the current shared generation.
+
+    :param argv: Command-line arguments; sys.argv is used if omitted.
+    """
+    parser = argparse.ArgumentParser(description="Build and publish a shared index snapshot.")
+    parser.add_argument("--pdf-directory", default="pdf")
+    parser.add_argument("--index-dir", default=os.environ.get("OWLEYES_INDEX_DIR"), required=False)
+    parser.add_argument("--min-trigram-count", type=int, default=1)
+    parser.add_argument("--entity-ner-model",
+                        help="NER model name or path used for entity extraction; heuristics only if omitted.")
+    parser.add_argument("--lsa-components", type=int, default=int(os.environ.get("OWLEYES_LSA_COMPONENTS", 0)),
+                        help="LSA dimensions for similar document lookups; 0 compares raw TF-IDF vectors.")
+    args = parser.parse_args(argv)
+    if not args.index_dir:
+        parser.error("--index-dir (or OWLEYES_INDEX_DIR) is required")
+    entity_extractor = None
+    if args.entity_ner_model:
+        from keyterm.preprocess import TermExtractionHandler
+
+        entity_extractor = EntityExtractor(ner=TermExtractionHandler(args.entity_ner_model).extract_entities)
+    shared = SharedIndexDirectory(args.index_dir, args.pdf_directory, entity_extractor, args.lsa_components)
+    with shared.build_lock():
+        shared.rebuild(min_trigram_count=args.min_trigram_count)
+
+
+if __name__ == "__main__":
+    main()
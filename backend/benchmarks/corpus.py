@@ -0,0 +1,224 @@
+import os
+import random
+import textwrap
+from datetime import date, timedelta
+
+import fitz
+
+FIRST_NAMES = ["James", "Maria", "Robert", "Aisha", "Daniel", "Chen", "Olivia", "Mateo", "Priya", "Samuel",
+               "Fatima", "Lucas", "Hannah", "Omar", "Grace", "Noah", "Elena", "Victor", "Yuki", "Amara"]
+LAST_NAMES = ["Walker", "Hernandez", "Okafor", "Nguyen", "Schmidt", "Patel", "Rossi", "Kowalski", "Haddad",
+              "Thompson", "Silva", "Andersen", "Kim", "Dubois", "Mensah", "Ivanova", "Murphy", "Tanaka"]
+COMPANY_WORDS = ["Northwind", "Bluewater", "Summit", "Ironbridge", "Cedar", "Harbor", "Granite", "Meridian",
+                 "Falcon", "Silverline", "Oakridge", "Pinnacle", "Redstone", "Evergreen", "Keystone", "Lakeside"]
+COMPANY_SUFFIXES = ["Holdings LLC", "Properties Inc.", "Partners LLP", "Group Ltd.", "Logistics Corp.",
+                    "Capital LLC", "Realty Inc.", "Services Ltd."]
+
+CONTRACT_TYPES = {
+    "lease": ("COMMERCIAL LEASE AGREEMENT", "Landlord", "Tenant",
+              ["PREMISES", "TERM", "RENT", "SECURITY DEPOSIT", "USE OF PREMISES", "MAINTENANCE AND REPAIRS",
+               "INSURANCE", "DEFAULT", "TERMINATION", "GOVERNING LAW"]),
+    "employment": ("EMPLOYMENT CONTRACT", "Employer", "Employee",
+                   ["POSITION AND DUTIES", "COMPENSATION", "BENEFITS", "WORKING HOURS", "CONFIDENTIALITY",
+                    "NON-COMPETITION", "TERMINATION", "NOTICE", "GOVERNING LAW"]),
+    "purchase": ("RESIDENTIAL PURCHASE AGREEMENT", "Seller", "Buyer",
+                 ["PROPERTY", "PURCHASE PRICE", "DEPOSIT", "FINANCING", "INSPECTIONS", "TITLE", "CLOSING",
+                  "DEFAULT", "GOVERNING LAW"]),
+    "services": ("MASTER SERVICES AGREEMENT", "Client", "Provider",
+                 ["SERVICES", "FEES AND PAYMENT", "INTELLECTUAL PROPERTY", "WARRANTIES", "INDEMNIFICATION",
+                  "LIMITATION OF LIABILITY", "TERMINATION FOR CONVENIENCE", "GOVERNING LAW"]),
+    "nda": ("MUTUAL NON-DISCLOSURE AGREEMENT", "Disclosing Party", "Receiving Party",
+            ["CONFIDENTIAL INFORMATION", "OBLIGATIONS", "EXCLUSIONS", "TERM", "RETURN OF MATERIALS", "REMEDIES",
+             "GOVERNING LAW"]),
+}
+
+BOILERPLATE = [
+    "This Agreement constitutes the entire agreement between the parties and supersedes all prior understandings.",
+    "No amendment to this Agreement shall be effective unless made in writing and signed by both parties.",
+    "If any provision of this Agreement is held invalid, the remaining provisions shall continue in full force.",
+    "Any notice required under this Agreement shall be given in writing and delivered by hand or registered mail.",
+    "The failure of either party to enforce any provision shall not be construed as a waiver of that provision.",
+    "Neither party may assign its rights under this Agreement without the prior written consent of the other.",
+    "This Agreement may be executed in counterparts, each of which shall be deemed an original.",
+    "Each party shall bear its own costs and expenses incurred in connection with this Agreement.",
+    "The headings in this Agreement are for convenience only and shall not affect its interpretation.",
+    "Neither party shall be liable for any failure to perform caused by events beyond its reasonable control.",
+    "Either party may terminate this Agreement for convenience upon thirty days written notice to the other party.",
+    "The parties shall attempt in good faith to resolve any dispute arising out of this Agreement by negotiation.",
+]
+
+SUBJECTS = ["the {a}", "the {b}", "each party", "the {a} and the {b}", "any successor of the {b}"]
+VERBS = ["shall maintain", "shall provide", "may request", "shall indemnify", "shall reimburse", "shall deliver",
+         "may inspect", "shall pay", "shall insure", "shall procure", "may withhold", "shall disclose"]
+OBJECTS = ["all reasonable records", "the monthly installment", "a certificate of insurance", "written reports",
+           "the security deposit", "any confidential information", "the agreed compensation", "utility charges",
+           "all applicable permits", "the final inspection report", "an itemized invoice", "reasonable access"]
+QUALIFIERS = ["within {n} days of the effective date", "no later than {date}", "at its sole expense",
+              "in accordance with applicable law", "upon reasonable notice", "during the term of this Agreement",
+              "subject to clause {c}", "except as otherwise provided herein", "before the closing date"]
+
+
+class CorpusConfig:
+    def __init__(self, num_documents=10, min_pages=2, max_pages=6, boilerplate_ratio=0.3, num_parties=40,
+                 start_date=date(2015, 1, 1), end_date=date(2024, 12, 31), seed=0):
+        """
+        Settings for a synthetic contract corpus.
+
+        :param num_documents: Number of PDF files to generate.
+        :param min_pages: Minimum number of pages per document.
+        :param max_pages: Maximum number of pages per document.
+        :param boilerplate_ratio: Fraction of clause sentences drawn from the shared boilerplate pool.
+        :param num_parties: Size of the pool of people and companies that appear as parties.
+        :param start_date: Earliest effective date.
+        :param end_date: Latest effective date.
+        :param seed: Random seed; the same config always generates the same corpus.
+        """
+        self.num_documents = num_documents
+        self.min_pages = min_pages
+        self.max_pages = max_pages
+        self.boilerplate_ratio = boilerplate_ratio
+        self.num_parties = num_parties
+        self.start_date = start_date
+        self.end_date = end_date
+        self.seed = seed
+
+    def to_dict(self):
+        """
+        :return: The config as a JSON-serializable dict.
+        """
+        return {key: value.isoformat() if isinstance(value, date) else value for key, value in vars(self).items()}
+
+
+class ContractGenerator:
+    LINE_WIDTH = 95
+    LINES_PER_PAGE = 58
+    FONT_SIZE = 10
+
+    def __init__(self, config):
+        """
+        Generate synthetic contract PDFs with fitz.
+
+        :param config: CorpusConfig describing the corpus.
+        """
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.parties = [self.random_party() for _ in range(config.num_parties)]
+
+    def random_party(self):
+        """
+        :return: A random person or company name.
+        """
+        if self.random.random() < 0.5:
+            return f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}"
+        return f"{self.random.choice(COMPANY_WORDS)} {self.random.choice(COMPANY_SUFFIXES)}"
+
+    def random_date(self):
+        """
+        :return: A random date between the configured start and end dates.
+        """
+        span = (self.config.end_date - self.config.start_date).days
+        return self.config.start_date + timedelta(days=self.random.randint(0, span))
+
+    def sentence(self, role_a, role_b, section_count):
+        """
+        Build one clause sentence, either shared boilerplate or a generated obligation.
+
+        :param role_a: Name of the first party's role.
+        :param role_b: Name of the second party's role.
+        :param section_count: Number of sections, used for cross references.
+        :return: The sentence.
+        """
+        if self.random.random() < self.config.boilerplate_ratio:
+            return self.random.choice(BOILERPLATE)
+        subject = self.random.choice(SUBJECTS).format(a=role_a, b=role_b)
+        qualifier = self.random.choice(QUALIFIERS).format(
+            n=self.random.choice([5, 10, 14, 30, 60, 90]),
+            date=self.random_date().strftime("%B %d, %Y"),
+            c=f"{self.random.randint(1, section_count)}.{self.random.randint(1, 4)}",
+        )
+        return f"{subject[0].upper()}{subject[1:]} {self.random.choice(VERBS)} {self.random.choice(OBJECTS)} {qualifier}."
+
+    def document_lines(self, contract_type):
+        """
+        Build the lines of a contract, padded with clauses until it fills its page budget.
+
+        :param contract_type: Key into CONTRACT_TYPES.
+        :return: List of (line, is_heading) tuples.
+        """
+        title, role_a, role_b, sections = CONTRACT_TYPES[contract_type]
+        party_a, party_b = self.random.sample(self.parties, 2)
+        effective_date = self.random_date().strftime("%B %d, %Y")
+        target_lines = self.random.randint(self.config.min_pages, self.config.max_pages) * self.LINES_PER_PAGE - 12
+
+        lines = [(title, True), ("", False)]
+        preamble = (f"This {title.title()} is made and entered into on {effective_date} by and between "
+                    f"{party_a} (the \"{role_a}\") and {party_b} (the \"{role_b}\").")
+        lines += [(line, False) for line in textwrap.wrap(preamble, self.LINE_WIDTH)] + [("", False)]
+
+        section = 0
+        while len(lines) < target_lines:
+            heading = sections[section % len(sections)]
+            section += 1
+            lines.append((f"{section}. {heading}", True))
+            for clause in range(1, self.random.randint(2, 4) + 1):
+                body = " ".join(self.sentence(role_a, role_b, len(sections))
+                                for _ in range(self.random.randint(2, 5)))
+                wrapped = textwrap.wrap(f"{section}.{clause} {body}", self.LINE_WIDTH)
+                lines += [(line, False) for line in wrapped]
+            lines.append(("", False))
+
+        lines += [
+            ("IN WITNESS WHEREOF, the parties have executed this Agreement as of the date first written above.", False),
+            ("", False),
+            (f"Signed by: {party_a}, {role_a}", False),
+            (f"Signed by: {party_b}, {role_b}", False),
+            (f"Witness: {self.random.choice(self.parties)}", False),
+            (f"Date: {effective_date}", False),
+        ]
+        return lines
+
+    def write_pdf(self, path, lines):
+        """
+        Lay out lines on letter-sized pages and save them as a PDF.
+
+        :param path: Destination path.
+        :param lines: List of (line, is_heading) tuples.
+        """
+        doc = fitz.open()
+        for start in range(0, len(lines), self.LINES_PER_PAGE):
+            page = doc.new_page(width=612, height=792)
+            y = 60
+            for line, is_heading in lines[start:start + self.LINES_PER_PAGE]:
+                if line:
+                    page.insert_text((60, y), line, fontsize=self.FONT_SIZE,
+                                     fontname="hebo" if is_heading else "helv")
+                y += self.FONT_SIZE * 1.2
+        doc.save(path)
+        doc.close()
+
+    def generate(self, output_directory):
+        """
+        Generate the corpus into a directory.
+
+        :param output_directory: Directory to write PDFs to; created if missing.
+        :return: List of generated file names.
+        """
+        os.makedirs(output_directory, exist_ok=True)
+        filenames = []
+        for number in range(self.config.num_documents):
+            contract_type = self.random.choice(sorted(CONTRACT_TYPES))
+            filename = f"synthetic-{contract_type}-{number:05d}.pdf"
+            self.write_pdf(os.path.join(output_directory, filename), self.document_lines(contract_type))
+            filenames.append(filename)
+        return filenames
+
+
+def generate_corpus(output_directory, config=None):
+    """
+    Generate a synthetic contract corpus.
+
+    :param output_directory: Directory to write PDFs to.
+    :param config: Optional CorpusConfig; defaults are used if omitted.
+    :return: List of generated file names.
+    """
+    return ContractGenerator(config or CorpusConfig()).generate(output_directory)
@@ -0,0 +1,238 @@
+"""
+Benchmark the search and key-term pipeline against synthetic contract corpora.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --sizes 10 100 500 --output results.json
+    python -m benchmarks.run --sizes 10 100 --compare results.json
+
+Use `--ner-model stand-in` (the default) to replace the NER model with an offline
+regex stand-in, or pass a model name or local path (e.g. a tiny token classification
+checkpoint) to exercise the real transformers pipeline.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from advancedsearch.advanced_search import AdvancedSearch
+from autosearch.indexer import Indexer
+from benchmarks.corpus import CorpusConfig, generate_corpus
+
+SEARCH_QUERIES = ["rent", "security deposit", '"termination for convenience"', '"written notice" NEAR/5 party',
+                  "indemnfication"]
+AUTOCOMPLETE_QUERIES = ["ter", "secur", "written n"]
+ALTERNATIVE_QUERIES = ["termination notice", "insurence certificate"]
+ADVANCED_QUERIES = [["Northwind Holdings LLC"], ["governing law", "indemnify"], ["Maria Patel", "Summit Partners LLP"]]
+ENTITY_FILTERS = [{"companies": ["Northwind Holdings LLC"]}, {"dealTypes": ["lease", "employment"]},
+                  {"parties": ["Maria Patel", "Summit Partners LLP"]}]
+STAND_IN = "stand-in"
+
+
+def time_call(func, repeat):
+    """
+    Call a function repeatedly and summarize its wall-clock latency.
+
+    :param func: Zero-argument callable to time.
+    :param repeat: Number of calls.
+    :return: Dict of latency statistics in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def make_term_extraction_handler(ner_model):
+    """
+    Build a TermExtractionHandler, optionally with an offline stand-in for the NER model.
+
+    :param ner_model: STAND_IN, or a model name / path passed to TermExtractionHandler.
+    :return: The handler.
+    """
+    from keyterm.preprocess import TermExtractionHandler
+
+    if ner_model != STAND_IN:
+        return TermExtractionHandler(ner_model_name=ner_model)
+
+    class StandInTermExtractionHandler(TermExtractionHandler):
+        entity_pattern = re.compile(r"\b[A-Z][a-z]+(?: [A-Z][a-z]+\.?)+(?: (?:LLC|LLP|Inc\.|Ltd\.|Corp\.))?")
+        organization_pattern = re.compile(r"\b(?:LLC|LLP|Inc|Ltd|Corp)\.?$")
+
+        def load_ner_model(self):
+            pass
+
+        def extract_entities(self, text):
+            return [(match.group(), "ORG" if self.organization_pattern.search(match.group()) else "PER")
+                    for match in self.entity_pattern.finditer(text)]
+
+    return StandInTermExtractionHandler()
+
+
+def benchmark_corpus(directory, size, args, handler):
+    """
+    Run every benchmarked operation against one corpus.
+
+    :param directory: Directory containing the corpus PDFs.
+    :param size: Number of documents in the corpus.
+    :param args: Parsed command-line arguments.
+    :param handler: TermExtractionHandler, or None to skip key-term extraction.
+    :return: List of result records.
+    """
+    records = []
+
+    def record(operation, func, repeat, query=None):
+        stats = time_call(func, repeat)
+        records.append({"corpus_size": size, "operation": operation, "query": query, **stats})
+        logging.warning(f"[{size} docs] {operation} {query or ''}: median {stats['median_ms']} ms")
+
+    indexer = None
+
+    def build():
+        nonlocal indexer
+        indexer = Indexer(directory)
+
+    record("Indexer.build_index", build, args.build_repeat)
+    for query in SEARCH_QUERIES:
+        record("Indexer.search", lambda: indexer.search(query), args.repeat, query)
+    for query in AUTOCOMPLETE_QUERIES:
+        record("Indexer.autocomplete", lambda: indexer.autocomplete(query), args.repeat, query)
+    for query in ALTERNATIVE_QUERIES:
+        record("Indexer.alternative_search_results", lambda: indexer.alternative_search_results(query),
+               args.repeat, query)
+
+    advanced_search = AdvancedSearch(directory)
+    advanced_search.build_index()  # warm-up: the first call extracts every PDF and its entities
+    for terms in ADVANCED_QUERIES:
+        record("AdvancedSearch.search", lambda: advanced_search.search(terms), args.repeat, " | ".join(terms))
+    for filters in ENTITY_FILTERS:
+        record("AdvancedSearch.filter_entities", lambda: advanced_search.filter_entities(filters), args.repeat,
+               json.dumps(filters))
+
+    if handler is not None:
+        for filename in sorted(indexer.documents)[:args.key_term_documents]:
+            text = indexer.documents[filename]
+            record("TermExtractionHandler.extract_and_rank_key_terms",
+                   lambda: handler.extract_and_rank_key_terms(text), args.key_term_repeat, filename)
+    return records
+
+
+def git_revision():
+    """
+    :return: The current git commit hash, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(records, baseline_path):
+    """
+    Print the median latency change of every operation against a previous results file.
+
+    :param records: Result records from this run.
+    :param baseline_path: Path to a JSON file written by a previous run.
+    """
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {(r["corpus_size"], r["operation"], r["query"]): r for r in baseline["results"]}
+    print(f"{'size':>6}  {'operation':<50} {'query':<32} {'before':>10} {'after':>10} {'change':>8}")
+    for r in records:
+        old = previous.get((r["corpus_size"], r["operation"], r["query"]))
+        if old is None:
+            continue
+        change = (r["median_ms"] / old["median_ms"] - 1) * 100 if old["median_ms"] else 0.0
+        print(f"{r['corpus_size']:>6}  {r['operation']:<50} {str(r['query'] or ''):<32.32} "
+              f"{old['median_ms']:>10.2f} {r['median_ms']:>10.2f} {change:>+7.1f}%")
+
+
+def parse_args(argv=None):
+    """
+    :param argv: Command-line arguments; sys.argv is used if omitted.
+    :return: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark search and key-term extraction on synthetic contracts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="Corpus sizes to benchmark.")
+    parser.add_argument("--min-pages", type=int, default=2)
+    parser.add_argument("--max-pages", type=int, default=6)
+    parser.add_argument("--boilerplate-ratio", type=float, default=0.3)
+    parser.add_argument("--parties", type=int, default=40, help="Size of the party name pool.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="Calls per query operation.")
+    parser.add_argument("--build-repeat", type=int, default=1, help="Index builds per corpus.")
+    parser.add_argument("--key-term-documents", type=int, default=2,
+                        help="Documents per corpus to run key-term extraction on; 0 disables it.")
+    parser.add_argument("--key-term-repeat", type=int, default=1)
+    parser.add_argument("--ner-model", default=STAND_IN,
+                        help=f"NER model name or path, or '{STAND_IN}' for the offline regex stand-in.")
+    parser.add_argument("--corpus-dir", help="Keep generated corpora here instead of a temporary directory.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write JSON results.")
+    parser.add_argument("--compare", help="Previous results file to compare medians against.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Generate each corpus, benchmark it and write the results as JSON.
+
+    :param argv: Command-line arguments; sys.argv is used if omitted.
+    """
+    args = parse_args(argv)
+    handler = make_term_extraction_handler(args.ner_model) if args.key_term_documents else None
+    logging.getLogger().setLevel(logging.WARNING)
+
+    records = []
+    corpora = []
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        root = args.corpus_dir or temporary_directory
+        for size in args.sizes:
+            config = CorpusConfig(num_documents=size, min_pages=args.min_pages, max_pages=args.max_pages,
+                                  boilerplate_ratio=args.boilerplate_ratio, num_parties=args.parties,
+                                  seed=args.seed)
+            directory = os.path.join(root, f"corpus-{size}-seed{args.seed}")
+            start = time.perf_counter()
+            generate_corpus(directory, config)
+            corpora.append({**config.to_dict(), "generation_seconds": round(time.perf_counter() - start, 3)})
+            records += benchmark_corpus(directory, size, args, handler)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "ner_model": args.ner_model,
+        },
+        "corpora": corpora,
+        "results": records,
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    logging.warning(f"Wrote {len(records)} results to {args.output}")
+
+    if args.compare:
+        compare(records, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
+import json
 import os
+import time
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse, FileResponse
-from pydantic import BaseModel
-from transformers import pipeline, TFGPT2LMHeadModel, AutoTokenizer
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from transformers import TFGPT2LMHeadModel, AutoTokenizer
 from advancedsearch.advanced_search import AdvancedSearch
+from advancedsearch.entities import ENTITY_FIELDS, EntityExtractor
 from autosearch.indexer import Indexer
+from autosearch.snapshot import SharedIndexDirectory
+from chatbot.generation import BatchGenerator, BatchScheduler
+from chatbot.ingestion import IngestionPipeline, UploadReceiver, UploadTooLarge
 from chatbot.pdf_viewer import extract_text_from_pdf
 from keyterm.preprocess import TermExtractionHandler
+from metrics.instrumentation import (METRICS_ENABLED, REQUEST_SECONDS, registry, request_timings,
+                                     server_timing_header, stage)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -29,14 +38,117 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-indexer = Indexer(pdf_directory="pdf")
-advancedsearch = AdvancedSearch(pdf_directory="pdf")
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Record request latency and report per-stage timings in a Server-Timing header.
+    Does nothing when metrics are disabled with OWLEYES_METRICS=0.
+    """
+    if not METRICS_ENABLED:
+        return await call_next(request)
+
+    timings = {}
+    token = request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(elapsed, request.method, getattr(route, "path", "unmatched"), str(response.status_code))
+    timings["total"] = elapsed * 1000
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
 term_extraction_handler = TermExtractionHandler()
+entity_extractor = EntityExtractor(ner=term_extraction_handler.extract_entities)
+advancedsearch = AdvancedSearch(pdf_directory="pdf", entity_extractor=entity_extractor)
+
+# With OWLEYES_INDEX_DIR set, all workers attach to one shared, memory-mapped index snapshot
+# (built once by whichever worker starts first) instead of each building its own copy.
+INDEX_DIR = os.environ.get("OWLEYES_INDEX_DIR")
+# Reduce the similar-document vectors to this many LSA dimensions; 0 compares raw TF-IDF vectors.
+LSA_COMPONENTS = int(os.environ.get("OWLEYES_LSA_COMPONENTS", "0"))
+
+
+def swap_shared_index(new_snapshot):
+    """
+    Serve a shared index generation; newer generations are swapped in from the index watcher thread.
+    """
+    global indexer
+    indexer = new_snapshot.indexer(pdf_directory="pdf")
+    advancedsearch.use_shared_documents(new_snapshot.lowercase_documents, new_snapshot.entity_index())
+
+
+if INDEX_DIR:
+    shared_index = SharedIndexDirectory(INDEX_DIR, pdf_directory="pdf", entity_extractor=entity_extractor,
+                                        lsa_components=LSA_COMPONENTS)
+    swap_shared_index(shared_index.attach())
+    shared_index.watch(swap_shared_index)
+else:
+    shared_index = None
+    indexer = Indexer(pdf_directory="pdf", lsa_components=LSA_COMPONENTS)
+    advancedsearch.build_index()  # extract entities at startup rather than on the first advanced search
+
+# Key terms of uploaded documents, computed by the ingestion pipeline: filename -> ((mtime, size), key terms)
+key_terms_cache = {}
 
-# Initialize the Hugging Face transformers pipeline with TensorFlow model
-tokenizer = AutoTokenizer.from_pretrained("gpt2")
-model = TFGPT2LMHeadModel.from_pretrained("gpt2")
-nlp = pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+def index_uploaded_documents(documents):
+    """
+    Make parsed uploads searchable; called by the ingestion pipeline's index stage. The
+    Indexer update goes last since it is all-or-nothing; advanced search drops the cached
+    text of files that were taken out again on its next build_index.
+    """
+    for file_name, document in documents:
+        advancedsearch.add_document(file_name, document["text"])
+    indexer.add_documents(documents)
+
+
+def extract_uploaded_metadata(file_name, text):
+    """
+    Index the entities and key terms of an upload; called by the ingestion pipeline's metadata stage.
+    """
+    advancedsearch.index_entities(file_name, text)
+    key_terms = term_extraction_handler.extract_and_rank_key_terms(text)
+    stat = os.stat(os.path.join("pdf", file_name))
+    key_terms_cache[file_name] = ((stat.st_mtime, stat.st_size), key_terms)
+
+
+# Uploads to POST /documents are staged in OWLEYES_UPLOAD_DIR and ingested in the background. They are
+# opt-in with OWLEYES_INGESTION=1, which is only supported with a single worker: a shared index is
+# read-only, and without one every worker has its own index, so an upload would only be searchable on
+# the worker that received it. A worker cannot tell how many siblings uvicorn or gunicorn started.
+UPLOAD_DIR = os.environ.get("OWLEYES_UPLOAD_DIR", "uploads")
+UPLOAD_MAX_FILE_SIZE = int(os.environ.get("OWLEYES_UPLOAD_MAX_FILE_MB", "100")) * 1024 * 1024
+UPLOAD_MAX_REQUEST_SIZE = int(os.environ.get("OWLEYES_UPLOAD_MAX_REQUEST_MB", "1024")) * 1024 * 1024
+INGESTION_ENABLED = os.environ.get("OWLEYES_INGESTION", "0").lower() in ("1", "true", "yes", "on")
+if shared_index is None and INGESTION_ENABLED:
+    ingestion = IngestionPipeline(
+        "pdf", UPLOAD_DIR, Indexer.parse_document, index_uploaded_documents, extract_uploaded_metadata,
+        extract_workers=int(os.environ.get("OWLEYES_INGEST_EXTRACT_WORKERS", "2")),
+        metadata_workers=int(os.environ.get("OWLEYES_INGEST_METADATA_WORKERS", "1")),
+        queue_size=int(os.environ.get("OWLEYES_INGEST_QUEUE_SIZE", "16")),
+        index_batch_size=int(os.environ.get("OWLEYES_INGEST_BATCH_SIZE", "8")))
+else:
+    ingestion = None
+
+# Load the Hugging Face TensorFlow model used to generate answers. OWLEYES_GENERATION_MODEL
+# can point at a local GPT-2 style checkpoint instead, e.g. a tiny stand-in model for offline testing.
+GENERATION_MODEL = os.environ.get("OWLEYES_GENERATION_MODEL", "gpt2")
+tokenizer = AutoTokenizer.from_pretrained(GENERATION_MODEL)
+model = TFGPT2LMHeadModel.from_pretrained(GENERATION_MODEL)
+
+# Concurrent /ask requests are generated together in batches of up to OWLEYES_GENERATION_BATCH_SIZE,
+# waiting at most OWLEYES_GENERATION_MAX_WAIT_MS for a batch to fill.
+answer_generator = BatchGenerator(model, tokenizer)
+answer_scheduler = BatchScheduler(answer_generator,
+                                  max_batch_size=int(os.environ.get("OWLEYES_GENERATION_BATCH_SIZE", "8")),
+                                  max_wait=float(os.environ.get("OWLEYES_GENERATION_MAX_WAIT_MS", "20")) / 1000)
 
 
 class Annotation(BaseModel):
@@ -45,6 +157,14 @@ class Annotation(BaseModel):
     coordinates: Dict[str, Any]
 
 
+class Question(BaseModel):
+    question: str = Field(..., min_length=1)
+    file_name: Optional[str] = None
+    top_k: int = Field(3, ge=1, le=10)
+    max_new_tokens: int = Field(64, ge=1, le=256)
+    stream: bool = False
+
+
 class Feedback(BaseModel):
     query: str
     response: str
@@ -68,6 +188,17 @@ def read_root():
     return {"message": "Welcome to the OwlEyes Backend API"}
 
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    Expose latency histograms and counters in the Prometheus text format.
+
+    Returns:
+        PlainTextResponse: The current metrics.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/list_pdfs")
 def get_pdfs():
     """
@@ -105,19 +236,23 @@ def get_pdf(file_name: str):
 
 
 @app.get("/search")
-def search_documents(query: str = Query(..., min_length=1), file_name: Optional[str] = None):
+def search_documents(query: str = Query(..., min_length=1), file_name: Optional[str] = None,
+                     collapse_duplicates: bool = False):
     """
     Search for documents that match the query.
 
     Args:
         query (str): The search query.
         file_name (Optional[str]): The name of the file to search within (if specified).
+        collapse_duplicates (bool): Whether to return one result per group of near-duplicate files.
 
     Returns:
         dict: The search query and results.
     """
     try:
         results = indexer.search(query, file_name)
+        if collapse_duplicates:
+            results = indexer.collapse_duplicates(results)
         if not results:
             raise HTTPException(status_code=404, detail="No documents found matching the query.")
         return {"query": query, "results": results}
@@ -127,6 +262,167 @@ def search_documents(query: str = Query(..., min_length=1), file_name: Optional[
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/search/clauses")
+def search_clauses(query: str = Query(..., min_length=1), file_name: Optional[str] = None,
+                   page: int = Query(1, ge=1), page_size: int = Query(10, ge=1)):
+    """
+    Search for individual contract clauses that match the query.
+
+    Args:
+        query (str): The search query; every part of it must match within the same clause.
+        file_name (Optional[str]): The name of the file to search within (if specified).
+        page (int): The page number for pagination.
+        page_size (int): The number of results per page.
+
+    Returns:
+        dict: The search query, paginated clause results, and total results.
+    """
+    try:
+        results = indexer.search_clauses(query, file_name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    start_index = (page - 1) * page_size
+    return {
+        "query": query,
+        "results": results[start_index:start_index + page_size],
+        "total_results": len(results),
+        "page": page,
+        "page_size": page_size
+    }
+
+
+@app.post("/documents", status_code=202)
+async def upload_documents(request: Request):
+    """
+    Upload PDF files to add to the corpus.
+
+    The multipart/form-data body is parsed as it arrives and every PDF part is streamed
+    straight to disk. The files are then deduplicated, extracted, indexed and have their
+    entities and key terms extracted in the background; each becomes searchable as soon as
+    it is indexed.
+
+    Uploads are opt-in with OWLEYES_INGESTION=1, for a single worker that owns its index:
+    without it, or on a shared index (OWLEYES_INDEX_DIR), they are refused with 409.
+
+    Args:
+        request (Request): A multipart/form-data request with one or more PDF file parts.
+
+    Returns:
+        JSONResponse: The ingestion job, whose progress can be followed at /jobs/{job_id}.
+    """
+    if shared_index is not None:
+        raise HTTPException(status_code=409,
+                            detail="Uploads are not supported with a shared index (OWLEYES_INDEX_DIR).")
+    if ingestion is None:
+        raise HTTPException(status_code=409,
+                            detail="Uploads are disabled. Run a single worker with OWLEYES_INGESTION=1 to "
+                                   "accept them; with several workers an upload would only be searchable on one.")
+    try:
+        receiver = UploadReceiver(request.headers.get("content-type", ""), UPLOAD_DIR,
+                                  max_file_size=UPLOAD_MAX_FILE_SIZE, max_upload_size=UPLOAD_MAX_REQUEST_SIZE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with stage("upload"):
+            async for chunk in request.stream():
+                await run_in_threadpool(receiver.write, chunk)
+            uploads = receiver.finish()
+    except UploadTooLarge as e:
+        receiver.discard()
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        receiver.discard()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        receiver.discard()
+        raise
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No PDF files were uploaded.")
+
+    job = ingestion.submit(uploads, receiver.rejected, time.perf_counter() - receiver.started)
+    return JSONResponse(status_code=202, content=job.describe(), headers={"Location": f"/jobs/{job.id}"})
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Report the progress of a document ingestion job.
+
+    Args:
+        job_id (str): The id returned by POST /documents.
+
+    Returns:
+        dict: The job status, upload throughput, per-stage progress and throughput, and the
+            status of every uploaded file.
+    """
+    job = ingestion.job(job_id) if ingestion is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.describe()
+
+
+@app.get("/documents/{file_name}/clauses")
+def get_document_clauses(file_name: str, include_text: bool = False):
+    """
+    List the numbered sections and clauses a PDF file was segmented into.
+
+    Args:
+        file_name (str): The name of the PDF file.
+        include_text (bool): Whether to include the text of each clause.
+
+    Returns:
+        dict: The file name and its clauses with numbers, titles, levels and page ranges.
+    """
+    try:
+        clauses = indexer.get_clauses(file_name, include_text=include_text)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"file_name": file_name, "clauses": clauses}
+
+
+@app.get("/documents/{file_name}/duplicates")
+def get_document_duplicates(file_name: str):
+    """
+    Find the near-duplicates of a PDF file, such as other revisions of the same contract template.
+
+    Args:
+        file_name (str): The name of the PDF file.
+
+    Returns:
+        dict: The file name, its near-duplicate cluster and the near-duplicates with their similarity.
+    """
+    try:
+        duplicates = indexer.near_duplicates(file_name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"file_name": file_name, **duplicates}
+
+
+@app.get("/similar/{file_name}")
+def get_similar_documents(file_name: str, top_k: int = Query(10, ge=1, le=100)):
+    """
+    Find the PDF files most similar to the given one.
+
+    Documents are compared by the cosine similarity of their TF-IDF vectors (or their LSA
+    vectors when OWLEYES_LSA_COMPONENTS is set), computed entirely from the local index.
+
+    Args:
+        file_name (str): The name of the PDF file.
+        top_k (int): The number of similar files to return.
+
+    Returns:
+        dict: The file name and the most similar files with their similarity scores.
+    """
+    try:
+        similar = indexer.similar_documents(file_name, top_k=top_k)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"file_name": file_name, "similar": similar}
+
+
 @app.get("/autocomplete")
 def autocomplete(query: str = Query(..., min_length=1)):
     """
@@ -147,7 +443,7 @@ def autocomplete(query: str = Query(..., min_length=1)):
 
 @app.get("/alternative_search")
 def alternative_search(query: str = Query(..., min_length=1), page: int = Query(1, ge=1),
-                       page_size: int = Query(10, ge=1)):
+                       page_size: int = Query(10, ge=1), collapse_duplicates: bool = False):
     """
     Perform an alternative search with pagination.
 
@@ -155,12 +451,15 @@ def alternative_search(query: str = Query(..., min_length=1), page: int = Query(
         query (str): The search query.
         page (int): The page number for pagination.
         page_size (int): The number of results per page.
+        collapse_duplicates (bool): Whether to return one result per group of near-duplicate files.
 
     Returns:
         dict: The search query, paginated results, and total results.
     """
     try:
         alternative_results = indexer.alternative_search_results(query)
+        if collapse_duplicates:
+            alternative_results = indexer.collapse_duplicates(alternative_results)
 
         # Pagination
         start_index = (page - 1) * page_size
@@ -185,7 +484,7 @@ def advanced_search_documents(
         afterDate: Optional[str] = Query(None,
                                          description="Start date for the effective date range (format: YYYY-MM-DD)"),
         parties: Optional[List[str]] = Query([], description="Parties to search for"),
-        clauses: Optional[List[str]] = Query([], description="Clauses to search for"),
+        clauses: Optional[List[str]] = Query([], description="Clause titles to search for"),
         terms: Optional[List[str]] = Query([], description="Terms to search for"),
         companies: Optional[List[str]] = Query([], description="Companies to search for"),
         divisions: Optional[List[str]] = Query([], description="Divisions to search for"),
@@ -193,6 +492,8 @@ def advanced_search_documents(
         mentionedSignatures: Optional[List[str]] = Query([], description="Mentioned signatures to search for"),
         mentionedWitnesses: Optional[List[str]] = Query([], description="Mentioned witnesses to search for"),
         dealTypes: Optional[List[str]] = Query([], description="Deal types to search for"),
+        matchAll: Optional[List[str]] = Query([], description="Filters whose values must all match "
+                                                               "(default: any value matches)"),
         page: int = Query(1, description="Page number for pagination", ge=1),
         page_size: int = Query(10, description="Number of results per page", ge=1)
 ):
@@ -203,7 +504,7 @@ def advanced_search_documents(
         beforeDate (Optional[str]): End date for the effective date range.
         afterDate (Optional[str]): Start date for the effective date range.
         parties (Optional[List[str]]): Parties to search for.
-        clauses (Optional[List[str]]): Clauses to search for.
+        clauses (Optional[List[str]]): Clause titles to search for, e.g. "governing law".
         terms (Optional[List[str]]): Terms to search for.
         companies (Optional[List[str]]): Companies to search for.
         divisions (Optional[List[str]]): Divisions to search for.
@@ -211,21 +512,40 @@ def advanced_search_documents(
         mentionedSignatures (Optional[List[str]]): Mentioned signatures to search for.
         mentionedWitnesses (Optional[List[str]]): Mentioned witnesses to search for.
         dealTypes (Optional[List[str]]): Deal types to search for.
+        matchAll (Optional[List[str]]): Names of the filters above whose values must all match.
+            Other filters match if any of their values does; different filters are combined with AND.
         page (int): Page number for pagination.
         page_size (int): Number of results per page.
 
     Returns:
         dict: The paginated search results and total results.
     """
+    unknown_fields = set(matchAll) - set(ENTITY_FIELDS) - {"clauses", "terms"}
+    if unknown_fields:
+        raise HTTPException(status_code=400, detail=f"Unknown matchAll fields: {sorted(unknown_fields)}")
     try:
         before_date = datetime.strptime(beforeDate, "%Y-%m-%d").date() if beforeDate else None
         after_date = datetime.strptime(afterDate, "%Y-%m-%d").date() if afterDate else None
 
-        all_terms = set(parties + clauses + terms + companies + divisions +
-                        mentionedNames + mentionedSignatures + mentionedWitnesses + dealTypes)
-        all_terms.discard("")
+        entity_filters = {"parties": parties, "companies": companies, "divisions": divisions,
+                          "mentionedNames": mentionedNames, "mentionedSignatures": mentionedSignatures,
+                          "mentionedWitnesses": mentionedWitnesses, "dealTypes": dealTypes}
+        candidates = advancedsearch.filter_entities(entity_filters, match_all=matchAll)
+
+        # Clauses are matched against the titles of the segmented contract clauses.
+        clauses = [clause for clause in clauses if clause.strip()]
+        if clauses:
+            matches = [indexer.find_clauses(clause) for clause in clauses]
+            documents = set.intersection(*matches) if "clauses" in matchAll else set.union(*matches)
+            candidates = documents if candidates is None else candidates & documents
 
-        results = advancedsearch.search(search_terms=list(all_terms))
+        # Terms are still matched against the full text, but only of the documents that
+        # passed the other filters.
+        terms = [term for term in terms if term.strip()]
+        if terms and (candidates is None or candidates):
+            candidates = set(advancedsearch.search(terms, match_all="terms" in matchAll, filenames=candidates))
+
+        results = sorted(candidates) if candidates is not None else []
 
         start_index = (page - 1) * page_size
         end_index = start_index + page_size
@@ -236,6 +556,56 @@ def advanced_search_documents(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def stream_answer(request, question, passages):
+    """
+    Stream an answer as newline-delimited JSON: the passages first, then each generated
+    chunk of text as it is decoded, then the complete answer.
+    """
+    yield json.dumps({"question": question, "passages": passages}) + "\n"
+    try:
+        for chunk in request.stream():
+            yield json.dumps({"token": chunk}) + "\n"
+        yield json.dumps({"answer": request.result.result()}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+@app.post("/ask")
+def ask(question: Question):
+    """
+    Answer a question about the contracts.
+
+    The best matching clauses are retrieved from the index and passed to the language
+    model as context. Concurrent questions are batched together for generation.
+
+    Args:
+        question (Question): The question, an optional file to restrict retrieval to, the number
+            of passages, the maximum answer length in tokens and whether to stream the answer.
+
+    Returns:
+        dict: The question, the generated answer and the passages it was based on, or a
+            newline-delimited JSON stream of them when streaming.
+    """
+    try:
+        passages = indexer.retrieve_passages(question.question, top_k=question.top_k, filename=question.file_name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not passages:
+        raise HTTPException(status_code=404, detail="No passages found matching the question.")
+
+    prompt = answer_generator.prompt(question.question, passages, question.max_new_tokens)
+    request = answer_scheduler.submit(prompt, question.max_new_tokens, stream=question.stream)
+    if question.stream:
+        return StreamingResponse(stream_answer(request, question.question, passages),
+                                 media_type="application/x-ndjson")
+    try:
+        with stage("generate"):
+            answer = request.result.result()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"question": question.question, "answer": answer, "passages": passages}
+
+
 @app.get("/key_terms/{file_name}")
 def get_key_terms(file_name: str):
     """
@@ -252,6 +622,11 @@ def get_key_terms(file_name: str):
         if not os.path.exists(pdf_path):
             raise HTTPException(status_code=404, detail="PDF not found")
 
+        stat = os.stat(pdf_path)
+        cached = key_terms_cache.get(file_name)
+        if cached is not None and cached[0] == (stat.st_mtime, stat.st_size):
+            return {"file_name": file_name, "key_terms": cached[1]}
+
         text = extract_text_from_pdf(pdf_path)
         key_terms = term_extraction_handler.extract_and_rank_key_terms(text)
         return {"file_name": file_name, "key_terms": key_terms}
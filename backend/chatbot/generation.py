@@ -0,0 +1,284 @@
+"""
+Batched answer generation for the /ask endpoint.
+
+Requests are queued and a single worker thread coalesces whatever arrives within a short
+window into one batch, so concurrent questions share forward passes of the model instead
+of queueing behind each other. The batch is decoded token by token with the model's
+key/value cache, and each request's text is published as soon as it is decoded, so
+answers can be streamed while the rest of the batch is still generating.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics.instrumentation import GENERATED_TOKENS, GENERATION_BATCH_SIZE, STAGE_SECONDS, stage
+
+PROMPT_HEADER = "Answer the question using only the contract excerpts below.\n\n"
+STREAM_END = None
+
+
+class GenerationRequest:
+    def __init__(self, prompt, max_new_tokens, stream=False):
+        """
+        A prompt waiting to be generated as part of a batch.
+
+        :param prompt: Prompt text.
+        :param max_new_tokens: Maximum number of tokens to generate.
+        :param stream: Publish the generated text in chunks as it is decoded, see stream().
+        """
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.chunks = queue.Queue() if stream else None
+        self.result = Future()
+        self.submitted = time.perf_counter()
+
+    def emit(self, text):
+        """
+        Publish newly decoded text to a streaming consumer.
+        """
+        if self.chunks is not None and text:
+            self.chunks.put(text)
+
+    def finish(self, text=None, error=None):
+        """
+        Complete the request with its answer or an error. Later calls are ignored.
+        """
+        if self.result.done():
+            return
+        if error is not None:
+            self.result.set_exception(error)
+        else:
+            self.result.set_result(text)
+        if self.chunks is not None:
+            self.chunks.put(STREAM_END)
+
+    def stream(self):
+        """
+        Yield chunks of generated text until the answer is complete.
+
+        :raises Exception: The generation error, if generation failed.
+        """
+        while True:
+            chunk = self.chunks.get()
+            if chunk is STREAM_END:
+                break
+            yield chunk
+        self.result.result()
+
+
+class BatchGenerator:
+    def __init__(self, model, tokenizer):
+        """
+        Greedy decoding of a batch of prompts with a TensorFlow causal language model such as
+        TFGPT2LMHeadModel: one forward pass per token for the whole batch, reusing the cached
+        attention keys and values of the previous steps.
+
+        Prompts are left-padded so that every row's next token is in the last column. A row
+        stops at its own token limit or at the end-of-text token and its request is completed
+        right away, while the remaining rows keep decoding. Requests with different token
+        limits are decoded as separate batches, since their prompts were sized for them.
+
+        :param model: The causal language model.
+        :param tokenizer: Its tokenizer; pad token and padding side are set for batching.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.tokenizer_lock = threading.Lock()  # fast tokenizers fail when used from two threads at once
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        tokenizer.truncation_side = "left"  # never cut off the question at the end of the prompt
+        self.max_length = model.config.n_positions
+
+    def prompt(self, question, passages, max_new_tokens):
+        """
+        Build the prompt for a question, leaving room in the context for the answer.
+
+        :param question: The user's question.
+        :param passages: Passages from Indexer.retrieve_passages, best first.
+        :param max_new_tokens: Maximum number of tokens that will be generated.
+        :return: The prompt text.
+        """
+        with self.tokenizer_lock:
+            return build_prompt(question, passages, self.tokenizer, self.max_length - max_new_tokens)
+
+    def decode(self, tokens):
+        """
+        :param tokens: Generated token ids.
+        :return: Their text, without special tokens.
+        """
+        with self.tokenizer_lock:
+            return self.tokenizer.decode(tokens, skip_special_tokens=True)
+
+    def __call__(self, requests):
+        """
+        Generate answers for a batch of requests, completing each GenerationRequest.
+
+        :param requests: List of GenerationRequest.
+        """
+        limits = sorted({request.max_new_tokens for request in requests})
+        if len(limits) > 1:
+            # Each prompt was built to leave room for its own max_new_tokens; truncating it for a
+            # larger limit would cut off its start, so requests are decoded grouped by their limit.
+            for limit in limits:
+                self([request for request in requests if request.max_new_tokens == limit])
+            return
+        limit = limits[0]
+        with self.tokenizer_lock:
+            encoded = self.tokenizer([request.prompt for request in requests], padding=True, truncation=True,
+                                     max_length=self.max_length - limit, return_tensors="np")
+        input_ids = encoded["input_ids"].astype(np.int32)
+        attention_mask = encoded["attention_mask"].astype(np.int32)
+        position_ids = np.maximum(np.cumsum(attention_mask, axis=1) - 1, 0)
+        past_key_values = None
+        generated = [[] for _ in requests]
+        published = [""] * len(requests)
+        active = np.ones(len(requests), dtype=bool)
+
+        for _ in range(limit):
+            outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                                 past_key_values=past_key_values, use_cache=True)
+            next_tokens = np.asarray(outputs.logits[:, -1, :]).argmax(axis=-1).astype(np.int32)
+            for row in np.flatnonzero(active).tolist():
+                request = requests[row]
+                token = int(next_tokens[row])
+                if token != self.tokenizer.eos_token_id:
+                    generated[row].append(token)
+                    if request.chunks is not None:
+                        text = self.decode(generated[row])
+                        if not text.endswith("\ufffd"):  # wait for the rest of a multi-byte character
+                            request.emit(text[len(published[row]):])
+                            published[row] = text
+                if token == self.tokenizer.eos_token_id or len(generated[row]) >= request.max_new_tokens:
+                    active[row] = False
+                    self.complete(request, generated[row], published[row])
+            if not active.any():
+                break
+            next_tokens[~active] = self.tokenizer.pad_token_id
+            past_key_values = outputs.past_key_values
+            input_ids = next_tokens[:, None]
+            attention_mask = np.concatenate([attention_mask, np.ones((len(requests), 1), dtype=np.int32)], axis=1)
+            position_ids = position_ids[:, -1:] + 1
+
+        GENERATED_TOKENS.inc(sum(len(tokens) for tokens in generated))
+        for row, request in enumerate(requests):
+            self.complete(request, generated[row], published[row])
+
+    def complete(self, request, tokens, published):
+        """
+        Publish any text still held back and complete a request.
+
+        :param request: The GenerationRequest.
+        :param tokens: Its generated token ids.
+        :param published: The text already emitted to its stream.
+        """
+        if request.result.done():
+            return
+        text = self.decode(tokens)
+        request.emit(text[len(published):])
+        request.finish(text.strip())
+
+
+class BatchScheduler:
+    def __init__(self, generate_batch, max_batch_size=8, max_wait=0.02):
+        """
+        Coalesce concurrent generation requests into batches.
+
+        A worker thread takes the oldest waiting request and keeps collecting requests for
+        up to max_wait seconds or until max_batch_size are waiting, then generates them
+        together. Requests that arrive while a batch is generating queue up and form the
+        next batch.
+
+        :param generate_batch: Callable completing a list of GenerationRequest, e.g. a BatchGenerator.
+        :param max_batch_size: Largest number of requests generated together.
+        :param max_wait: Seconds the first request of a batch may wait for others to join it.
+        """
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.run, name="generation-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, prompt, max_new_tokens, stream=False):
+        """
+        Queue a prompt for generation.
+
+        :param prompt: Prompt text.
+        :param max_new_tokens: Maximum number of tokens to generate.
+        :param stream: Whether the answer will be consumed with GenerationRequest.stream().
+        :return: The GenerationRequest; its result is a Future of the answer text.
+        """
+        request = GenerationRequest(prompt, max_new_tokens, stream)
+        self.queue.put(request)
+        return request
+
+    def next_batch(self):
+        """
+        :return: The next batch of waiting requests, blocking until there is at least one.
+        """
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        """
+        Worker loop: generate batches until the process exits.
+        """
+        while True:
+            batch = self.next_batch()
+            started = time.perf_counter()
+            for request in batch:
+                STAGE_SECONDS.observe(started - request.submitted, "generation_queue")
+            GENERATION_BATCH_SIZE.observe(len(batch))
+            try:
+                with stage("generate_batch"):
+                    self.generate_batch(batch)
+            except Exception as e:
+                logging.error(f"Error generating a batch of {len(batch)} answers: {str(e)}")
+                for request in batch:
+                    request.finish(error=e)
+
+
+def build_prompt(question, passages, tokenizer, max_tokens):
+    """
+    Assemble the answer prompt from retrieved passages, best first, trimming them so the
+    prompt fits in max_tokens. The budget is split evenly, and passages shorter than their
+    share leave the rest to the passages after them.
+
+    :param question: The user's question.
+    :param passages: Passages from Indexer.retrieve_passages, best first.
+    :param tokenizer: Tokenizer of the answer model, used to count tokens.
+    :param max_tokens: Token budget of the prompt.
+    :return: The prompt text.
+    """
+    tail = f"Question: {question.strip()}\nAnswer:"
+    budget = max_tokens - len(tokenizer.encode(PROMPT_HEADER + tail))
+    sections = []
+    for number, passage in enumerate(passages, 1):
+        label = f"[{number}] {passage['file_name']}"
+        if passage["number"]:
+            label += f", clause {passage['number']}"
+        if passage["title"]:
+            label += f" ({passage['title']})"
+        section = f"{label}:\n{passage['text'].strip()}\n\n"
+        share = budget // (len(passages) - number + 1)
+        ids = tokenizer.encode(section)
+        if len(ids) > share:
+            if share < 2:
+                continue
+            ids = ids[:share - 1]
+            section = tokenizer.decode(ids).rstrip() + "\n\n"
+        budget -= len(ids) + 1
+        sections.append(section)
+    return PROMPT_HEADER + "".join(sections) + tail
@@ -0,0 +1,629 @@
+"""
+Background ingestion of uploaded PDFs for the /documents endpoint.
+
+Uploads are streamed to a staging directory and then pass through four stages, each run
+by its own bounded pool of workers:
+
+- dedupe: skip files whose content is already in the corpus and pick a free file name,
+- extract: parse the PDF in a worker process (PyMuPDF is not thread-safe and parsing holds the GIL),
+- index: move it into the PDF directory and add it to the search indexes, in batches,
+- metadata: extract entities and key terms.
+
+The queues between stages are bounded, so a large upload never holds more parsed documents
+in memory than the workers can keep up with. A document is searchable as soon as its batch
+has been indexed; the slower NER-based metadata stage runs afterwards.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    import multipart
+    from multipart.multipart import parse_options_header
+
+from metrics.instrumentation import DOCUMENTS_INGESTED, stage
+
+STAGES = ("dedupe", "extract", "index", "metadata")
+HASH_CHUNK_SIZE = 1 << 20
+MAX_JOBS = 256  # finished jobs kept for /jobs; older ones are forgotten
+
+
+class UploadTooLarge(ValueError):
+    """
+    Raised when an upload exceeds the configured file or request size limit.
+    """
+
+
+def safe_file_name(name):
+    """
+    :param name: File name sent by the client.
+    :return: The name without any directory part and with a lowercase ".pdf" extension,
+             or None if it is not a PDF file name.
+    """
+    name = os.path.basename(name.replace("\\", "/")).strip()
+    stem, extension = os.path.splitext(name)
+    if extension.lower() != ".pdf" or not stem.strip(" ."):
+        return None
+    return stem + ".pdf"
+
+
+def file_digest(path):
+    """
+    :param path: Path to a file.
+    :return: Hex SHA-256 digest of its content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadReceiver:
+    def __init__(self, content_type, directory, max_file_size=None, max_upload_size=None):
+        """
+        Incremental multipart/form-data parser writing every uploaded PDF straight to a
+        staging file while hashing it, so uploads are never buffered in memory.
+
+        :param content_type: Content-Type header of the request.
+        :param directory: Staging directory for the uploaded files.
+        :param max_file_size: Largest accepted PDF in bytes; None for no limit.
+        :param max_upload_size: Largest accepted request body in bytes; None for no limit.
+        :raises ValueError: If the request is not a multipart/form-data upload.
+        """
+        media_type, options = parse_options_header(content_type)
+        if media_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise ValueError("Expected a multipart/form-data upload")
+        self.directory = directory
+        self.max_file_size = max_file_size
+        self.max_upload_size = max_upload_size
+        self.received = 0  # bytes of the request body
+        self.uploads = []  # (upload name, staging path, size, sha256 digest)
+        self.rejected = []  # names of uploaded files that are not PDFs
+        self.started = time.perf_counter()
+        self.headers = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.part = None  # (upload name, staging path, open file, hasher) of the file being received
+        self.parser = multipart.MultipartParser(options[b"boundary"], callbacks={
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        })
+
+    def write(self, chunk):
+        """
+        Feed the next chunk of the request body to the parser.
+
+        :param chunk: Bytes of the request body.
+        :raises UploadTooLarge: If the body or one of its PDFs exceeds its size limit.
+        :raises ValueError: If the body is not valid multipart data.
+        """
+        self.received += len(chunk)
+        if self.max_upload_size is not None and self.received > self.max_upload_size:
+            raise UploadTooLarge(f"The upload exceeds {self.max_upload_size} bytes")
+        self.parser.write(chunk)
+
+    def finish(self):
+        """
+        :return: List of (upload name, staging path, size, sha256 digest) of the received PDFs.
+        :raises ValueError: If the body ended in the middle of a file.
+        """
+        self.parser.finalize()
+        if self.part is not None:
+            raise ValueError("The upload ended in the middle of a file")
+        return self.uploads
+
+    def discard(self):
+        """
+        Delete every staging file written so far, e.g. after a failed or aborted upload.
+        """
+        paths = [path for _, path, _, _ in self.uploads]
+        if self.part is not None:
+            self.part[2].close()
+            paths.append(self.part[1])
+            self.part = None
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.uploads = []
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data, start, end):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            return  # a plain form field
+        upload_name = options[b"filename"].decode("utf-8", errors="replace")
+        name = safe_file_name(upload_name)
+        if name is None:
+            self.rejected.append(upload_name)
+            return
+        descriptor, path = tempfile.mkstemp(suffix=".pdf", dir=self.directory)
+        self.part = (name, path, os.fdopen(descriptor, "wb"), hashlib.sha256())
+
+    def on_part_data(self, data, start, end):
+        if self.part is not None:
+            chunk = data[start:end]
+            if self.max_file_size is not None and self.part[2].tell() + len(chunk) > self.max_file_size:
+                raise UploadTooLarge(f"{self.part[0]} exceeds {self.max_file_size} bytes")
+            self.part[2].write(chunk)
+            self.part[3].update(chunk)
+
+    def on_part_end(self):
+        if self.part is None:
+            return
+        name, path, file, digest = self.part
+        self.uploads.append((name, path, file.tell(), digest.hexdigest()))
+        file.close()
+        self.part = None
+
+
+class IngestionFile:
+    def __init__(self, job, upload_name, path, size, digest):
+        """
+        An uploaded PDF moving through the ingestion stages.
+
+        :param job: The IngestionJob it was uploaded with.
+        :param upload_name: Sanitized file name sent by the client.
+        :param path: Staging path of the upload; None once it was moved into the PDF directory.
+        :param size: Size in bytes.
+        :param digest: Hex SHA-256 digest of its content.
+        """
+        self.job = job
+        self.upload_name = upload_name
+        self.path = path
+        self.size = size
+        self.digest = digest
+        self.file_name = None  # name in the PDF directory, chosen by the dedupe stage
+        self.stage = STAGES[0]  # stage the file is queued for or in; None once it left the pipeline
+        self.status = "pending"  # pending, indexed, completed, duplicate or failed
+        self.searchable = False
+        self.duplicate_of = None
+        self.error = None
+        self.document = None  # parsed document, from the extract to the index stage
+        self.text = None  # extracted text, from the index to the metadata stage
+
+    def describe(self):
+        return {
+            "upload_name": self.upload_name,
+            "file_name": self.file_name,
+            "size": self.size,
+            "status": self.status,
+            "stage": self.stage,
+            "searchable": self.searchable,
+            "duplicate_of": self.duplicate_of,
+            "error": self.error,
+        }
+
+
+class IngestionJob:
+    def __init__(self, uploads, rejected=(), upload_seconds=0.0):
+        """
+        Progress of one upload request through the ingestion pipeline.
+
+        :param uploads: List of (upload name, staging path, size, sha256 digest), as returned by UploadReceiver.
+        :param rejected: Names of uploaded files that were not accepted.
+        :param upload_seconds: Time spent receiving the upload.
+        """
+        self.id = uuid.uuid4().hex
+        self.created = time.time()
+        self.finished = None
+        self.files = [IngestionFile(self, *upload) for upload in uploads]
+        self.rejected = list(rejected)
+        self.upload_seconds = upload_seconds
+        self.lock = threading.Lock()
+        # stage -> completed/failed counts, busy seconds, bytes, and wall-clock start and end
+        self.stages = {name: {"completed": 0, "failed": 0, "seconds": 0.0, "bytes": 0, "started": None,
+                              "ended": None} for name in STAGES}
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def record(self, file, stage_name, started, ended, seconds, error=None):
+        """
+        Account a file's pass through a stage.
+
+        :param file: The IngestionFile.
+        :param stage_name: Stage it passed through.
+        :param started: time.time() at which the stage started working on it.
+        :param ended: time.time() at which the stage was done with it.
+        :param seconds: Worker time spent on the file.
+        :param error: The exception that failed it, if any.
+        """
+        with self.lock:
+            stats = self.stages[stage_name]
+            stats["failed" if error is not None else "completed"] += 1
+            stats["seconds"] += seconds
+            stats["bytes"] += file.size
+            stats["started"] = started if stats["started"] is None else min(stats["started"], started)
+            stats["ended"] = ended if stats["ended"] is None else max(stats["ended"], ended)
+
+    def advance(self, file, stage_name=None, status=None, error=None):
+        """
+        Move a file on to its next stage, or out of the pipeline when stage_name is None.
+
+        :param file: The IngestionFile.
+        :param stage_name: Next stage, or None if the file is done.
+        :param status: New status of the file, if it changed.
+        :param error: Error message of a failed file.
+        """
+        with self.lock:
+            file.stage = stage_name
+            if status is not None:
+                file.status = status
+                file.searchable = file.searchable or status == "indexed"
+            if error is not None:
+                file.error = error
+            if self.finished is None and all(other.stage is None for other in self.files):
+                self.finished = time.time()
+        if stage_name is None:
+            DOCUMENTS_INGESTED.inc(1, file.status)
+
+    def describe(self):
+        """
+        :return: Dict with the job's status, upload throughput, per-stage progress and throughput,
+                 and the status of every file.
+        """
+        with self.lock:
+            ended = self.finished or time.time()
+            stages = {}
+            for position, name in enumerate(STAGES):
+                stats = self.stages[name]
+                wall_seconds = stats["ended"] - stats["started"] if stats["started"] is not None else 0.0
+                remaining = sum(1 for file in self.files
+                                if file.stage is not None and STAGES.index(file.stage) <= position)
+                stages[name] = {
+                    "completed": stats["completed"],
+                    "failed": stats["failed"],
+                    "remaining": remaining,
+                    "busy_seconds": round(stats["seconds"], 4),
+                    "documents_per_second": round(stats["completed"] / wall_seconds, 2) if wall_seconds else None,
+                    "bytes_per_second": round(stats["bytes"] / wall_seconds) if wall_seconds else None,
+                }
+            upload_bytes = sum(file.size for file in self.files)
+            return {
+                "id": self.id,
+                "status": "completed" if self.finished is not None else "running",
+                "created_at": datetime.fromtimestamp(self.created, timezone.utc).isoformat(),
+                "elapsed_seconds": round(ended - self.created, 4),
+                "upload": {
+                    "files": len(self.files),
+                    "bytes": upload_bytes,
+                    "seconds": round(self.upload_seconds, 4),
+                    "bytes_per_second": round(upload_bytes / self.upload_seconds) if self.upload_seconds else None,
+                },
+                "stages": stages,
+                "files": [file.describe() for file in self.files],
+                "rejected": self.rejected,
+            }
+
+
+class IngestionStage:
+    def __init__(self, name, handle, workers=1, queue_size=0, batch_size=1):
+        """
+        A queue of files and the pool of worker threads processing it, see IngestionPipeline.run.
+
+        :param name: Stage name, one of STAGES.
+        :param handle: Callable taking a list of IngestionFile and returning those that move on
+                       to the next stage; raising fails the whole list. Of the files it drops,
+                       those whose `error` it set failed and the others were duplicates.
+        :param workers: Number of worker threads.
+        :param queue_size: Maximum number of waiting files; putting blocks while the queue is full.
+                           0 leaves the queue unbounded.
+        :param batch_size: Largest number of waiting files handled together.
+        """
+        self.name = name
+        self.handle = handle
+        self.workers = workers
+        self.queue = queue.Queue(queue_size)
+        self.batch_size = batch_size
+
+    def next_batch(self):
+        """
+        :return: Up to batch_size waiting files, blocking until there is at least one.
+        """
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+
+class IngestionPipeline:
+    def __init__(self, pdf_directory, upload_directory, parse_document, index_documents, extract_metadata,
+                 extract_workers=2, metadata_workers=1, queue_size=16, index_batch_size=8):
+        """
+        Staged, multi-threaded ingestion of uploaded PDFs into the corpus.
+
+        Dedupe and index run on a single thread each, since they claim file names and apply
+        index updates. Extract threads hand their files to a pool of worker processes, since
+        PyMuPDF is not thread-safe and parsing holds the GIL; metadata runs on its own threads.
+        The index stage takes
+        whatever parsed documents are waiting, up to index_batch_size, so the merged indexes
+        are recomputed once per batch rather than once per document.
+
+        :param pdf_directory: Directory of the corpus PDFs.
+        :param upload_directory: Staging directory for uploads; should be on the same file
+                                 system as pdf_directory so files are moved, not copied.
+        :param parse_document: Picklable callable parsing a PDF path, e.g. Indexer.parse_document.
+        :param index_documents: Callable making a list of (file name, parsed document) searchable,
+                                called once the files are in pdf_directory. It must index all or
+                                none of them: when it raises, the files are taken out again.
+        :param extract_metadata: Callable taking a file name and its text, e.g. to index entities.
+        :param extract_workers: Worker processes parsing PDFs.
+        :param metadata_workers: Worker threads extracting metadata.
+        :param queue_size: Capacity of the queues after the dedupe stage, bounding the number of
+                           parsed documents waiting in memory.
+        :param index_batch_size: Largest number of documents indexed together.
+        """
+        self.pdf_directory = pdf_directory
+        self.upload_directory = upload_directory
+        self.parse_document = parse_document
+        self.index_documents = index_documents
+        self.extract_metadata = extract_metadata
+        self.extract_workers = extract_workers
+        self.extractor = self.start_extractor()
+        self.extractor_lock = threading.Lock()
+        self.jobs = OrderedDict()  # job id -> IngestionJob, oldest first
+        self.jobs_lock = threading.Lock()
+        self.file_digests = {}  # filename -> ((mtime, size), sha256 digest) of the corpus PDFs
+        self.claimed = {}  # file name -> digest of uploads that passed dedupe but are not indexed yet
+        self.claims_lock = threading.Lock()
+        os.makedirs(upload_directory, exist_ok=True)
+
+        self.stages = [
+            IngestionStage("dedupe", self.dedupe),
+            IngestionStage("extract", self.extract, workers=extract_workers, queue_size=queue_size),
+            IngestionStage("index", self.index, queue_size=queue_size, batch_size=index_batch_size),
+            IngestionStage("metadata", self.metadata, workers=metadata_workers, queue_size=queue_size),
+        ]
+        for position, ingestion_stage in enumerate(self.stages):
+            for worker in range(ingestion_stage.workers):
+                threading.Thread(target=self.run, args=(position,), name=f"ingest-{ingestion_stage.name}-{worker}",
+                                 daemon=True).start()
+
+    def submit(self, uploads, rejected=(), upload_seconds=0.0):
+        """
+        Queue received uploads for ingestion.
+
+        :param uploads: List of (upload name, staging path, size, sha256 digest), as returned by UploadReceiver.
+        :param rejected: Names of uploaded files that were not accepted.
+        :param upload_seconds: Time spent receiving the upload.
+        :return: The IngestionJob tracking them.
+        """
+        job = IngestionJob(uploads, rejected, upload_seconds)
+        with self.jobs_lock:
+            self.jobs[job.id] = job
+            finished = [job_id for job_id, other in self.jobs.items() if other.done]
+            for job_id in finished[:max(len(self.jobs) - MAX_JOBS, 0)]:
+                del self.jobs[job_id]
+        for file in job.files:
+            self.stages[0].queue.put(file)
+        return job
+
+    def job(self, job_id):
+        """
+        :param job_id: Id of a submitted job.
+        :return: The IngestionJob, or None if it is unknown or was forgotten.
+        """
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def run(self, position):
+        """
+        Worker loop of a stage: process batches of files and pass them on until the process exits.
+
+        :param position: Index of the stage in self.stages.
+        """
+        ingestion_stage = self.stages[position]
+        next_stage = self.stages[position + 1] if position + 1 < len(self.stages) else None
+        while True:
+            batch = ingestion_stage.next_batch()
+            started = time.time()
+            error = None
+            try:
+                with stage(f"ingest_{ingestion_stage.name}"):
+                    passed = ingestion_stage.handle(batch)
+            except Exception as e:
+                logging.error(f"Error in ingestion stage {ingestion_stage.name} for "
+                              f"{', '.join(file.upload_name for file in batch)}: {str(e)}")
+                passed, error = [], e
+            ended = time.time()
+            for file in batch:
+                file_error = error if error is not None else file.error  # the stage may fail single files
+                file.job.record(file, ingestion_stage.name, started, ended, (ended - started) / len(batch),
+                                file_error)
+                if file_error is not None:
+                    self.fail(file, f"{ingestion_stage.name} failed: {str(file_error)}")
+                elif file not in passed:
+                    file.job.advance(file, status="duplicate")
+                elif next_stage is None:
+                    file.job.advance(file, status="completed")
+                else:
+                    status = "indexed" if ingestion_stage.name == "index" else None
+                    file.job.advance(file, next_stage.name, status=status)
+                    next_stage.queue.put(file)
+
+    def fail(self, file, error):
+        """
+        Take a failed file out of the pipeline and delete its staging copy.
+        """
+        self.release(file)
+        file.document = None
+        file.text = None
+        if file.path is not None and os.path.exists(file.path):
+            os.remove(file.path)
+        file.job.advance(file, status="failed", error=error)
+
+    def release(self, file):
+        """
+        Drop a file's claim on its name once it is in the PDF directory or failed.
+        """
+        with self.claims_lock:
+            if self.claimed.get(file.file_name) == file.digest:
+                del self.claimed[file.file_name]
+
+    def corpus_digests(self):
+        """
+        :return: Dict mapping the content digest of every PDF in the corpus to its file name.
+                 Files are only hashed again when their modification time or size changed.
+        """
+        digests = {}
+        for filename in os.listdir(self.pdf_directory):
+            if not filename.endswith(".pdf"):
+                continue
+            stat = os.stat(os.path.join(self.pdf_directory, filename))
+            signature = (stat.st_mtime, stat.st_size)
+            cached = self.file_digests.get(filename)
+            if cached is None or cached[0] != signature:
+                cached = (signature, file_digest(os.path.join(self.pdf_directory, filename)))
+                self.file_digests[filename] = cached
+            digests.setdefault(cached[1], filename)
+        return digests
+
+    def free_name(self, name):
+        """
+        :param name: Requested file name.
+        :return: The name, or "name (2).pdf", "name (3).pdf", ... if it is taken.
+        """
+        stem, extension = os.path.splitext(name)
+        candidate = name
+        number = 2
+        while candidate in self.claimed or os.path.exists(os.path.join(self.pdf_directory, candidate)):
+            candidate = f"{stem} ({number}){extension}"
+            number += 1
+        return candidate
+
+    def dedupe(self, files):
+        """
+        Drop uploads whose content is already in the corpus or in an earlier upload, and
+        claim a free file name for the others, so no existing file is ever overwritten.
+        """
+        passed = []
+        with self.claims_lock:
+            digests = self.corpus_digests()
+            digests.update((digest, name) for name, digest in self.claimed.items())
+            for file in files:
+                duplicate_of = digests.get(file.digest)
+                if duplicate_of is not None:
+                    file.duplicate_of = duplicate_of
+                    os.remove(file.path)
+                    file.path = None
+                    continue
+                file.file_name = self.free_name(file.upload_name)
+                self.claimed[file.file_name] = file.digest
+                digests[file.digest] = file.file_name
+                passed.append(file)
+        return passed
+
+    def start_extractor(self):
+        """
+        :return: A process pool for parsing PDFs. Workers are spawned rather than forked, since
+                 this process runs threads (and possibly a model) that must not be forked.
+        """
+        return ProcessPoolExecutor(self.extract_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def extract(self, files):
+        """
+        Parse the uploaded PDFs in the extraction processes.
+        """
+        for file in files:
+            extractor = self.extractor
+            try:
+                file.document = extractor.submit(self.parse_document, file.path).result()
+            except BrokenProcessPool:
+                # A PDF crashed its worker process; replace the pool so later uploads still parse.
+                with self.extractor_lock:
+                    if self.extractor is extractor:
+                        self.extractor = self.start_extractor()
+                raise
+        return files
+
+    def index(self, files):
+        """
+        Move a batch of parsed uploads into the PDF directory and make them searchable.
+        If the batch cannot be indexed, its files are indexed one at a time, so only the
+        files that cannot be indexed on their own fail.
+        """
+        try:
+            self.index_batch(files)
+            return files
+        except Exception as e:
+            if len(files) == 1:
+                raise
+            logging.warning(f"Indexing a batch of {len(files)} uploads failed ({str(e)}); indexing them one by one")
+        passed = []
+        for file in files:
+            try:
+                self.index_batch([file])
+                passed.append(file)
+            except Exception as e:
+                file.error = str(e)
+        return passed
+
+    def index_batch(self, files):
+        """
+        Move parsed uploads into the PDF directory and index them. If indexing raises, the
+        files are moved back to staging, so the corpus never holds a file that is not indexed.
+        """
+        moved = []
+        try:
+            for file in files:
+                path = os.path.join(self.pdf_directory, file.file_name)
+                shutil.move(file.path, path)
+                moved.append((file, path))
+            self.index_documents([(file.file_name, file.document) for file in files])
+        except Exception:
+            for file, path in moved:
+                shutil.move(path, file.path)
+            raise
+        for file in files:
+            stat = os.stat(os.path.join(self.pdf_directory, file.file_name))
+            self.file_digests[file.file_name] = ((stat.st_mtime, stat.st_size), file.digest)
+            self.release(file)
+            file.path = None
+            file.text = file.document["text"]
+            file.document = None
+
+    def metadata(self, files):
+        """
+        Extract the metadata of indexed documents.
+        """
+        for file in files:
+            self.extract_metadata(file.file_name, file.text)
+            file.text = None
+        return files
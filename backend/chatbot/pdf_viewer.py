@@ -2,6 +2,7 @@ import os
 import fitz
 from fastapi import HTTPException
 from fastapi.responses import Response
+from metrics.instrumentation import BYTES_EXTRACTED, stage
 
 
 def list_all_pdfs():
@@ -51,11 +52,13 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     :raises HTTPException: If an error occurs while extracting text from the PDF.
     """
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            text += page.get_text("text") + "\n"
-        doc.close()
+        with stage("fitz_extract"):
+            doc = fitz.open(pdf_path)
+            text = ""
+            for page in doc:
+                text += page.get_text("text") + "\n"
+            doc.close()
+        BYTES_EXTRACTED.inc(len(text.encode("utf-8")), "pdf_viewer")
         return text
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -6,6 +6,7 @@ import nltk
 from nltk.corpus import stopwords
 from nltk import word_tokenize, pos_tag
 from transformers import AutoTokenizer, TFAutoModelForTokenClassification, pipeline
+from metrics.instrumentation import stage
 
 nltk.download("stopwords")
 nltk.download("punk")
@@ -15,16 +16,22 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+NER_MODEL_NAME = "dbmdz/bert-large-cased-finetuned-conll03-english"
+
 
 class TermExtractionHandler:
     """
     Handles the extraction and ranking of key terms from text using YAKE and NER models.
     """
 
-    def __init__(self):
+    def __init__(self, ner_model_name=NER_MODEL_NAME):
         """
         Initializes the TermExtractionHandler with necessary models and stopwords.
+
+        :param ner_model_name: Hugging Face name or local path of the token classification model.
+                               A tiny stand-in model can be passed for offline testing.
         """
+        self.ner_model_name = ner_model_name
         self.ner_model = None
         self.tokenizer = None
         self.stop_words = set(stopwords.words("english"))
@@ -80,13 +87,41 @@ class TermExtractionHandler:
         """
         Loads the NER model and tokenizer.
         """
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            "dbmdz/bert-large-cased-finetuned-conll03-english"
-        )
+        self.tokenizer = AutoTokenizer.from_pretrained(self.ner_model_name)
         self.ner_model = TFAutoModelForTokenClassification.from_pretrained(
-            "dbmdz/bert-large-cased-finetuned-conll03-english"
+            self.ner_model_name
         )
 
+    def extract_entities(self, text):
+        """
+        Runs the NER model over the text and returns the entities it finds.
+
+        :param text: The input text.
+        :return: A list of (entity string, entity group) tuples, e.g. ("Maria Patel", "PER").
+        """
+        with stage("ner"):
+            ner_pipeline = pipeline(
+                "ner",
+                model=self.ner_model,
+                tokenizer=self.tokenizer,
+                aggregation_strategy="simple",
+            )
+            ner_results = ner_pipeline(text)
+        return [(result["word"], result["entity_group"]) for result in ner_results]
+
+    def extract_ner_terms(self, text):
+        """
+        Extracts multi-word named entities from the text using the NER model.
+
+        :param text: The input text.
+        :return: A set of lowercased entity strings.
+        """
+        return {
+            word.lower()
+            for word, _ in self.extract_entities(text)
+            if len(word.split()) > 1
+        }
+
     def extract_key_terms(self, text, max_terms=150):
         """
         Extracts key terms from the provided text using YAKE and NER models.
@@ -97,25 +132,15 @@ class TermExtractionHandler:
         """
         logging.info("Extracting keywords using YAKE and NER...")
 
-        yake_extractor = yake.KeywordExtractor(  # Extract using YAKE
-            lan="en", n=3, dedupLim=0.9, top=max_terms
-        )
-        yake_keywords = yake_extractor.extract_keywords(text)
+        with stage("yake"):
+            yake_extractor = yake.KeywordExtractor(  # Extract using YAKE
+                lan="en", n=3, dedupLim=0.9, top=max_terms
+            )
+            yake_keywords = yake_extractor.extract_keywords(text)
         yake_terms = set(kw.lower() for kw, _ in yake_keywords)
         logging.info(f"YAKE keywords: {yake_terms}")
 
-        ner_pipeline = pipeline(  # Extract using NER
-            "ner",
-            model=self.ner_model,
-            tokenizer=self.tokenizer,
-            aggregation_strategy="simple",
-        )
-        ner_results = ner_pipeline(text)
-        ner_terms = set(
-            result["word"].lower()
-            for result in ner_results
-            if len(result["word"].split()) > 1
-        )
+        ner_terms = self.extract_ner_terms(text)  # Extract using NER
         logging.info(f"NER keywords: {ner_terms}")
 
         all_terms = yake_terms.union(ner_terms)
@@ -139,8 +164,9 @@ class TermExtractionHandler:
         }
         logging.info(f"After stopwords removal: {filtered_terms}")
 
-        tokens = word_tokenize(text)  # Tokenize and POS tagging
-        pos_tags = pos_tag(tokens)
+        with stage("pos_tagging"):
+            tokens = word_tokenize(text)  # Tokenize and POS tagging
+            pos_tags = pos_tag(tokens)
         nouns = {word.lower() for word, pos in pos_tags if pos.startswith("NN")}
         logging.info(f"Nouns: {nouns}")  # Nouns and proper nouns
 
@@ -193,24 +219,14 @@ class TermExtractionHandler:
         """
         logging.info("Extracting and ranking key terms...")
 
-        yake_extractor = yake.KeywordExtractor(
-            lan="en", n=3, dedupLim=0.9, top=150
-        )  # Extract using YAKE for n-grams
-        yake_keywords = yake_extractor.extract_keywords(text)
+        with stage("yake"):
+            yake_extractor = yake.KeywordExtractor(
+                lan="en", n=3, dedupLim=0.9, top=150
+            )  # Extract using YAKE for n-grams
+            yake_keywords = yake_extractor.extract_keywords(text)
         yake_terms = {kw.lower(): score for kw, score in yake_keywords}
 
-        ner_pipeline = pipeline(  # Extract using NER
-            "ner",
-            model=self.ner_model,
-            tokenizer=self.tokenizer,
-            aggregation_strategy="simple",
-        )
-        ner_results = ner_pipeline(text)
-        ner_terms = {
-            result["word"].lower()
-            for result in ner_results
-            if len(result["word"].split()) > 1
-        }
+        ner_terms = self.extract_ner_terms(text)  # Extract using NER
 
         combined_terms = yake_terms.keys() | ner_terms  # Combine and filter terms
         filtered_terms = self.filter_terms(combined_terms, text)
@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.environ.get("OWLEYES_METRICS", "1").lower() not in ("0", "false", "no", "off")
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage durations of the request being served, in milliseconds, used for the Server-Timing header.
+request_timings = ContextVar("request_timings", default=None)
+
+
+def format_labels(label_names, label_values, extra=None):
+    """
+    Render a Prometheus label set.
+
+    :param label_names: Label names.
+    :param label_values: Label values, in the same order.
+    :param extra: Optional additional (name, value) pair, such as a histogram bucket bound.
+    :return: The label set, e.g. '{stage="ner"}', or an empty string.
+    """
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    rendered = ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs)
+    return "{" + rendered + "}"
+
+
+def escape_label_value(value):
+    """
+    Escape a label value for the Prometheus text format.
+
+    :param value: Label value.
+    :return: The escaped string.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        """
+        A monotonically increasing Prometheus counter.
+
+        :param name: Metric name.
+        :param documentation: HELP text.
+        :param label_names: Names of the labels that partition the counter.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        """
+        Increase the counter.
+
+        :param amount: Amount to add.
+        :param label_values: Values for the counter's labels, in order.
+        """
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        """
+        :return: Lines of the Prometheus text exposition format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        A Prometheus histogram with cumulative buckets.
+
+        :param name: Metric name.
+        :param documentation: HELP text.
+        :param label_names: Names of the labels that partition the histogram.
+        :param buckets: Sorted upper bounds of the buckets; +Inf is implied.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+        Record an observation.
+
+        :param value: Observed value (seconds for latency histograms).
+        :param label_values: Values for the histogram's labels, in order.
+        """
+        if not METRICS_ENABLED:
+            return
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+
+    def render(self):
+        """
+        :return: Lines of the Prometheus text exposition format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    labels = format_labels(self.label_names, label_values, ("le", bound))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Holds every metric exposed by the /metrics endpoint.
+        """
+        self.metrics = []
+
+    def counter(self, name, documentation, label_names=()):
+        """
+        Create and register a counter.
+        """
+        metric = Counter(name, documentation, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        Create and register a histogram.
+        """
+        metric = Histogram(name, documentation, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: All metrics in the Prometheus text exposition format.
+        """
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.histogram("owleyes_stage_duration_seconds", "Time spent in each processing stage.",
+                                   ("stage",))
+REQUEST_SECONDS = registry.histogram("owleyes_request_duration_seconds", "HTTP request latency by route.",
+                                     ("method", "route", "status"))
+DOCUMENTS_INDEXED = registry.counter("owleyes_documents_indexed_total", "Documents added to an index.",
+                                     ("index",))
+BYTES_EXTRACTED = registry.counter("owleyes_extracted_bytes_total", "UTF-8 bytes of text extracted from PDFs.",
+                                   ("source",))
+CACHE_HITS = registry.counter("owleyes_cache_hits_total", "Cache lookups served from the cache.", ("cache",))
+CACHE_MISSES = registry.counter("owleyes_cache_misses_total", "Cache lookups that had to compute the value.",
+                                ("cache",))
+GENERATION_BATCH_SIZE = registry.histogram("owleyes_generation_batch_size", "Requests generated together per batch.",
+                                           buckets=(1, 2, 4, 8, 16, 32, 64))
+GENERATED_TOKENS = registry.counter("owleyes_generated_tokens_total", "Tokens generated for answers.")
+DOCUMENTS_INGESTED = registry.counter("owleyes_documents_ingested_total", "Uploaded documents by ingestion outcome.",
+                                      ("status",))
+
+
+class StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        """
+        Context manager recording the duration of a stage.
+
+        :param name: Stage name, used as the histogram label and the Server-Timing metric name.
+        """
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed * 1000
+        return False
+
+
+NULL_STAGE = nullcontext()
+
+
+def stage(name):
+    """
+    Time a block of code as a named stage:
+
+        with stage("ner"):
+            ...
+
+    When metrics are disabled this returns a shared no-op context manager.
+
+    :param name: Stage name.
+    :return: A context manager.
+    """
+    if not METRICS_ENABLED:
+        return NULL_STAGE
+    return StageTimer(name)
+
+
+def server_timing_header(timings):
+    """
+    Format stage durations as a Server-Timing header value.
+
+    :param timings: Dict of stage name -> milliseconds.
+    :return: Header value, e.g. "fitz_extract;dur=12.5, tokenize;dur=3.1".
+    """
+    return ", ".join(f"{name};dur={duration:.2f}" for name, duration in timings.items())
@@ -0,0 +1,29 @@
+import fitz
+import pytest
+
+
+def write_pdf(path, pages):
+    """
+    Write a PDF with one page per string, each line set in a standard font.
+
+    :param path: Output path.
+    :param pages: List of page texts.
+    :return: The path.
+    """
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_text((72, 72), text, fontsize=11)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def pdf_directory(tmp_path):
+    """
+    An empty PDF directory; tests add files with write_pdf.
+    """
+    directory = tmp_path / "pdf"
+    directory.mkdir()
+    return directory
@@ -0,0 +1,78 @@
+from autosearch.clauses import follows, segment_clauses
+
+
+def outline(text, heading_lines=frozenset()):
+    return [(level, number, title, text[start:end].splitlines()[0])
+            for start, end, level, number, title in segment_clauses(text, heading_lines)]
+
+
+def test_numbered_clauses_with_inline_headings():
+    text = ("This Lease is made between the parties.\n1. TERM. The lease runs for one year.\n"
+            "2. RENT\nRent is due monthly.")
+    assert outline(text) == [
+        (0, "", "", "This Lease is made between the parties."),
+        (1, "1", "TERM", "1. TERM. The lease runs for one year."),
+        (1, "2", "RENT", "2. RENT"),
+    ]
+
+
+def test_nested_clauses_and_headings_on_the_next_line():
+    text = ("1. TERM\n2.\nSECURITY\n2.1 The deposit is held in trust.\n2.2 It is returned on expiry.\n"
+            "3. NOTICES\nIn writing.")
+    assert outline(text) == [
+        (1, "1", "TERM", "1. TERM"),
+        (1, "2", "SECURITY", "2."),
+        (2, "2.1", "", "2.1 The deposit is held in trust."),
+        (2, "2.2", "", "2.2 It is returned on expiry."),
+        (1, "3", "NOTICES", "3. NOTICES"),
+    ]
+
+
+def test_untitled_and_styled_headings():
+    text = "1. The parties agree as follows.\nANNEXURE A\nSCHEDULE OF FEES\nFees are payable on invoice."
+    heading_lines = {text.index("ANNEXURE"), text.index("SCHEDULE")}
+    assert outline(text, heading_lines) == [
+        (1, "1", "", "1. The parties agree as follows."),
+        (0, "", "ANNEXURE A SCHEDULE OF FEES", "ANNEXURE A"),
+    ]
+    # Without the heading font the upper-case lines are body text of clause 1.
+    assert [clause[:3] for clause in outline(text)] == [(1, "1", "")]
+
+
+def test_wrapped_numbers_are_not_clauses():
+    text = "1. PAYMENT\nThe fee is payable at a rate of\n2.5 percent per annum.\n30. days after invoice."
+    assert [clause[1] for clause in outline(text)] == ["1"]
+
+
+def test_wrapped_cross_references_are_not_clauses():
+    text = ("1. DUTIES\n1.1 The Employee shall report to the Employer.\n"
+            "1.2 The Employee may request reasonable access to the premises subject to clause\n"
+            "4.1. The Employer and the Employee may inspect all reasonable records.\n"
+            "2. COMPENSATION\n2.1 The Employer shall pay the agreed compensation, within fourteen days of\n"
+            "3. days after the end of each month.\n3. BENEFITS\n3.1 The Employee may take leave.")
+    assert [clause[1] for clause in outline(text)] == ["1", "1.1", "1.2", "2", "2.1", "3", "3.1"]
+
+
+def test_headings_and_list_items_ending_like_a_sentence():
+    text = ("1. NOTICES\nNotices are given in writing.\n2. CONFIDENTIALITY CLAUSE\n"
+            "2.1 For the purpose of this clause confidential information includes all records.\n"
+            "2.2 The tenant shall within sixty days of signature of this lease by the landlord:\n"
+            "2.2.1 pass a resolution adopting this lease without modification and any amendments; and\n"
+            "2.2.2 deliver to the landlord its memorandum of incorporation.")
+    assert [clause[1] for clause in outline(text)] == ["1", "2", "2.1", "2.2", "2.2.1", "2.2.2"]
+
+
+def test_clauses_cover_the_text_without_trailing_whitespace():
+    text = "Preamble\n\n1. ONE\nbody\n\n2. TWO\nbody\n\n"
+    segments = segment_clauses(text)
+    assert [text[start:end] for start, end, *_ in segments] == ["Preamble", "1. ONE\nbody", "2. TWO\nbody"]
+    assert segment_clauses("") == [(0, 0, 0, "", "")]
+
+
+def test_follows_accepts_siblings_children_and_restarts():
+    assert follows((7,), (8,)) and follows((7,), (7, 1)) and follows((7, 2), (8,)) and follows((3, 4), (1,))
+    assert follows((7,), (7, 2))  # small gaps are tolerated
+    assert not follows((7,), (12,)) and not follows((7,), (7, 5, 1)) and not follows(None, (25,))
+    assert not follows((7, 1), (7, 2, 2))  # a new grandchild has to start near 1
+    assert follows((1, 3), (4,)) and not follows((1, 3), (4, 1))  # no jump into a skipped section's children
+    assert follows(None, (3,)) and follows(None, (1, 1)) and not follows(None, (3, 1))
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from autosearch.duplicates import MinHashIndex
+
+
+def contract(seed, length=400):
+    generator = random.Random(seed)
+    return [generator.choice(["tenant", "landlord", "rent", "premises", "notice", "term", "deposit", "repair",
+                              "insurance", "assign", "default", "cure", "days", "written", "party", "lease"])
+            for _ in range(length)]
+
+
+def revise(words, every):
+    return [word if i % every else "revised" for i, word in enumerate(words)]
+
+
+def test_near_duplicates_form_a_cluster():
+    index = MinHashIndex()
+    template = contract(1)
+    index.add("template.pdf", template)
+    index.add("revision.pdf", revise(template, 200))  # two words changed
+    index.add("other.pdf", contract(2))
+
+    assert index.cluster("template.pdf") == ["revision.pdf", "template.pdf"]
+    assert index.cluster("other.pdf") == ["other.pdf"]
+    (neighbour, similarity), = index.near_duplicates("template.pdf")
+    assert neighbour == "revision.pdf" and 0.8 <= similarity < 1
+
+
+def test_revisions_of_one_template_share_a_cluster():
+    index = MinHashIndex()
+    base = contract(3, length=1200)
+    index.add("v1.pdf", base)
+    index.add("v2.pdf", base[:600] + revise(base[600:], 300))
+    index.add("v3.pdf", base[:600] + revise(base[600:], 150))
+    assert index.cluster("v1.pdf") == index.cluster("v3.pdf") == ["v1.pdf", "v2.pdf", "v3.pdf"]
+
+
+def test_replacing_a_document_drops_its_old_links():
+    index = MinHashIndex()
+    template = contract(4)
+    index.add("a.pdf", template)
+    index.add("b.pdf", template)
+    assert index.cluster("a.pdf") == ["a.pdf", "b.pdf"]
+
+    index.add("b.pdf", contract(5))
+    assert index.cluster("a.pdf") == ["a.pdf"] and index.cluster("b.pdf") == ["b.pdf"]
+    assert index.near_duplicates("a.pdf") == []
+
+
+def test_collapse_keeps_the_best_ranked_result_per_cluster():
+    index = MinHashIndex()
+    template = contract(6)
+    index.add("a.pdf", template)
+    index.add("b.pdf", template)
+    index.add("c.pdf", contract(7))
+    results = [{"file_name": "b.pdf", "rank": 1}, {"file_name": "c.pdf", "rank": 2},
+               {"file_name": "a.pdf", "rank": 3}, {"file_name": "unindexed.pdf", "rank": 4}]
+    assert index.collapse(results) == [{"file_name": "b.pdf", "rank": 1, "duplicates": ["a.pdf"]},
+                                       {"file_name": "c.pdf", "rank": 2, "duplicates": []},
+                                       {"file_name": "unindexed.pdf", "rank": 4, "duplicates": []}]
+
+
+def test_documents_without_words_are_not_indexed():
+    index = MinHashIndex()
+    index.add("empty.pdf", [])
+    assert "empty.pdf" not in index and index.cluster("empty.pdf") == ["empty.pdf"]
+
+
+def test_bands_must_divide_the_signature():
+    with pytest.raises(ValueError):
+        MinHashIndex(num_permutations=100, bands=32)
@@ -0,0 +1,114 @@
+import pytest
+
+from advancedsearch.advanced_search import AdvancedSearch
+from advancedsearch.entities import EntityExtractor, EntityIndex
+from tests.conftest import write_pdf
+
+LEASE = """LEASE AGREEMENT
+This lease is made between Northwind Holdings LLC (the "Landlord")
+and Maria Patel (the "Tenant").
+1. RENT
+The tenant pays rent monthly to the Facilities Department.
+
+Signed by : Maria Patel, Tenant
+Witness : Deborah Howard
+Date : 1 March 2024"""
+EMPLOYMENT = """CONTRACT OF EMPLOYMENT
+MADE AND ENTERED INTO BY AND BETWEEN:
+Contoso Industries Inc with address at: 4 Harbour Road
+herein represented by Ann Lee duly authorized hereto
+(hereinafter referred to as the "EMPLOYER")
+AND
+John Smith with address at: 12 Oak Street
+(hereinafter referred to as the "EMPLOYEE")
+
+Signature : John Smith
+Witness : ____________
+Witness : Deborah Howard"""
+BLANK_EMPLOYMENT = """CONTRACT OF EMPLOYMENT
+MADE AND ENTERED INTO BY AND BETWEEN:
+________________________ with address at: ________________
+(hereinafter referred to as the "EMPLOYER")
+AND
+________________________ with address at: ________________
+(hereinafter referred to as the "EMPLOYEE")"""
+
+
+def test_extracts_preamble_parties_and_signature_blocks():
+    entities = EntityExtractor().extract(LEASE)
+    assert entities["parties"] == {"northwind holdings llc", "maria patel"}
+    assert entities["companies"] == {"northwind holdings llc"}
+    assert entities["divisions"] == {"facilities department"}
+    assert entities["mentionedSignatures"] == {"maria patel"}
+    assert entities["mentionedWitnesses"] == {"deborah howard"}
+    assert entities["mentionedNames"] == {"maria patel", "deborah howard"}
+    assert entities["dealTypes"] == {"lease", "lease agreement"}
+
+
+def test_party_particulars_and_blank_fields_are_dropped():
+    entities = EntityExtractor().extract(EMPLOYMENT)
+    assert entities["parties"] == {"contoso industries inc", "john smith"}
+    assert entities["mentionedSignatures"] == {"john smith"}
+    assert entities["mentionedWitnesses"] == {"deborah howard"}
+    assert entities["dealTypes"] == {"employment", "contract of employment"}
+
+    assert EntityExtractor().extract(BLANK_EMPLOYMENT)["parties"] == set()
+
+
+def test_ner_entities_are_added():
+    extractor = EntityExtractor(ner=lambda text: [("Ann Lee", "PER"), ("Harbour Trust", "ORG"), ("Cape", "LOC")])
+    entities = extractor.extract(EMPLOYMENT)
+    assert "ann lee" in entities["mentionedNames"] and "harbour trust" in entities["companies"]
+    assert "cape" not in set().union(*entities.values())
+
+
+@pytest.fixture
+def entity_index():
+    entity_index = EntityIndex()
+    entity_index.add("lease.pdf", {"parties": ["northwind holdings llc", "maria patel"]})
+    entity_index.add("sale.pdf", {"parties": ["northwind trading", "john smith"]})
+    entity_index.add("loan.pdf", {"parties": ["maria patel"], "dealTypes": ["loan"]})
+    return entity_index
+
+
+def test_match_requires_every_token_of_the_query(entity_index):
+    assert entity_index.match("parties", "Northwind") == {"lease.pdf", "sale.pdf"}
+    assert entity_index.match("parties", "holdings northwind") == {"lease.pdf"}
+    assert entity_index.match("parties", "Northwind Patel") == set()  # tokens of different parties
+    assert entity_index.match("companies", "northwind") == set()
+    assert entity_index.match("parties", "  ") == set()
+
+
+def test_filter_combines_values_with_any_or_all(entity_index):
+    filters = {"parties": ["northwind", "maria patel"]}
+    assert entity_index.filter(filters) == {"lease.pdf", "sale.pdf", "loan.pdf"}
+    assert entity_index.filter(filters, match_all=["parties"]) == {"lease.pdf"}
+    assert entity_index.filter({"parties": ["maria patel"], "dealTypes": ["loan"]}) == {"loan.pdf"}
+    assert entity_index.filter({"parties": [], "dealTypes": [" "]}) is None
+
+
+def test_remove_and_replace_update_the_index(entity_index):
+    entity_index.add("lease.pdf", {"parties": ["contoso industries inc"]})
+    assert entity_index.match("parties", "northwind") == {"sale.pdf"}
+    entity_index.remove("sale.pdf")
+    assert entity_index.match("parties", "northwind") == set()
+    assert "northwind" not in entity_index.tokens["parties"]
+    assert EntityIndex.from_dict(entity_index.to_dict()).to_dict() == entity_index.to_dict()
+
+
+def test_advanced_search_filters_entities_of_the_pdf_directory(pdf_directory):
+    write_pdf(pdf_directory / "lease.pdf", [LEASE])
+    write_pdf(pdf_directory / "employment.pdf", [EMPLOYMENT])
+    advanced_search = AdvancedSearch(str(pdf_directory))
+
+    assert advanced_search.filter_entities({"mentionedWitnesses": ["deborah howard"]}) == {"lease.pdf",
+                                                                                        "employment.pdf"}
+    assert advanced_search.filter_entities({"parties": ["maria patel", "john smith"]}) == {"lease.pdf",
+                                                                                        "employment.pdf"}
+    assert advanced_search.filter_entities({"parties": ["maria patel", "john smith"]}, match_all=["parties"]) == set()
+    assert advanced_search.filter_entities({"parties": ["northwind"], "dealTypes": ["employment"]}) == set()
+    assert advanced_search.search(["monthly"], filenames=advanced_search.filter_entities(
+        {"parties": ["northwind"]})) == ["lease.pdf"]
+
+    (pdf_directory / "lease.pdf").unlink()
+    assert advanced_search.filter_entities({"parties": ["northwind"]}) == set()
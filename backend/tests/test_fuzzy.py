@@ -0,0 +1,46 @@
+from autosearch.fuzzy import FUZZY_WEIGHTS, FuzzyIndex, edit_distance
+from autosearch.indexer import Indexer
+from tests.conftest import write_pdf
+
+VOCABULARY = ["rent", "rents", "sent", "tenant", "tenants", "landlord", "premises", "premise"]
+
+
+def test_edit_distance_counts_transpositions_and_stops_early():
+    assert edit_distance("landlrod", "landlord", 2) == 1
+    assert edit_distance("premises", "premise", 2) == 1
+    assert edit_distance("tenant", "landlord", 2) == 3
+
+
+def test_lookup_sorts_by_distance_then_word():
+    matches = FuzzyIndex(VOCABULARY).lookup("tenamts")
+    assert matches == [("tenants", 1), ("tenant", 2)]
+
+
+def test_lookup_gives_short_terms_less_slack():
+    index = FuzzyIndex(VOCABULARY)
+    assert index.lookup("rnt") == []
+    assert index.lookup("rnet") == [("rent", 1)]
+
+
+def test_expand_keeps_only_the_closest_tier():
+    assert FuzzyIndex(VOCABULARY).expand("tenamts") == {"tenants": FUZZY_WEIGHTS[1]}
+    assert FuzzyIndex(VOCABULARY).expand("premisses") == {"premises": FUZZY_WEIGHTS[1]}
+
+
+def test_expand_exact_word_does_not_pull_in_neighbours():
+    index = FuzzyIndex(VOCABULARY)
+    assert index.expand("rent") == {"rent": FUZZY_WEIGHTS[0]}
+    assert index.expand("tenant") == {"tenant": FUZZY_WEIGHTS[0]}
+
+
+def test_expand_unknown_term_without_close_words():
+    assert FuzzyIndex(VOCABULARY).expand("arbitration") == {}
+
+
+def test_search_for_a_known_word_skips_its_neighbours(pdf_directory):
+    write_pdf(pdf_directory / "lease.pdf", ["The tenant shall pay rent monthly."])
+    write_pdf(pdf_directory / "notice.pdf", ["Notice was sent to the buyer."])
+    indexer = Indexer(str(pdf_directory))
+
+    assert [result["file_name"] for result in indexer.search("rent")] == ["lease.pdf"]
+    assert [result["file_name"] for result in indexer.search("rnet")] == ["lease.pdf"]
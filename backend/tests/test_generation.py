@@ -0,0 +1,157 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from chatbot.generation import PROMPT_HEADER, BatchGenerator, BatchScheduler, GenerationRequest, build_prompt
+
+ANSWER = "rent is due monthly"
+
+
+class WordTokenizer:
+    """
+    A whitespace tokenizer with the parts of the Hugging Face interface BatchGenerator uses.
+    """
+    eos_token = "<eos>"
+    eos_token_id = 0
+
+    def __init__(self):
+        self.pad_token = None
+        self.vocabulary = [self.eos_token]
+        self.ids = {self.eos_token: 0}
+
+    @property
+    def pad_token_id(self):
+        return self.ids[self.pad_token]
+
+    def encode(self, text):
+        ids = []
+        for word in text.split():
+            if word not in self.ids:
+                self.ids[word] = len(self.vocabulary)
+                self.vocabulary.append(word)
+            ids.append(self.ids[word])
+        return ids
+
+    def decode(self, ids, skip_special_tokens=False):
+        return " ".join(self.vocabulary[i] for i in ids if not (skip_special_tokens and i == self.eos_token_id))
+
+    def __call__(self, texts, padding, truncation, max_length, return_tensors):
+        assert self.padding_side == self.truncation_side == "left"
+        rows = [self.encode(text)[-max_length:] for text in texts]
+        width = max(len(row) for row in rows)
+        return {"input_ids": np.array([[self.pad_token_id] * (width - len(row)) + row for row in rows]),
+                "attention_mask": np.array([[0] * (width - len(row)) + [1] * len(row) for row in rows])}
+
+
+class ScriptedModel:
+    """
+    A stand-in causal language model that answers every prompt with the same words, then the
+    end-of-text token, and records the prompts of each batch it is run on.
+    """
+    def __init__(self, tokenizer, n_positions=64):
+        self.tokenizer = tokenizer
+        self.config = SimpleNamespace(n_positions=n_positions)
+        self.answer = tokenizer.encode(ANSWER) + [tokenizer.eos_token_id]
+        self.batches = []
+
+    def __call__(self, input_ids, attention_mask, position_ids, past_key_values, use_cache):
+        assert position_ids.max() < self.config.n_positions
+        step = 0 if past_key_values is None else past_key_values + 1
+        if step == 0:
+            self.batches.append([self.tokenizer.decode(row[mask == 1]) for row, mask in zip(input_ids, attention_mask)])
+        logits = np.zeros((len(input_ids), input_ids.shape[1], len(self.tokenizer.vocabulary)))
+        logits[:, -1, self.answer[min(step, len(self.answer) - 1)]] = 1
+        return SimpleNamespace(logits=logits, past_key_values=step)
+
+
+@pytest.fixture
+def generator():
+    tokenizer = WordTokenizer()
+    return BatchGenerator(ScriptedModel(tokenizer), tokenizer)
+
+
+def passage(number, words):
+    return {"file_name": f"lease-{number}.pdf", "number": str(number), "title": "RENT",
+            "text": " ".join(f"w{number}x{i}" for i in range(words))}
+
+
+def test_build_prompt_splits_the_budget_between_passages():
+    tokenizer = WordTokenizer()
+    passages = [passage(1, 3), passage(2, 50), passage(3, 50)]
+    prompt = build_prompt("When is rent due?", passages, tokenizer, max_tokens=45)
+
+    assert prompt.startswith(PROMPT_HEADER) and prompt.endswith("Question: When is rent due?\nAnswer:")
+    assert len(tokenizer.encode(prompt)) <= 45
+    sections = prompt[len(PROMPT_HEADER):].split("\n\n")[:3]
+    # The header and question take 15 tokens: the first passage fits in its third of the other 30,
+    # and the tokens it leaves are shared by the two passages after it.
+    assert [len(section.split()) for section in sections] == [8, 9, 10]
+    assert sections[0].endswith("w1x0 w1x1 w1x2")
+
+
+def test_build_prompt_drops_passages_without_room():
+    tokenizer = WordTokenizer()
+    prompt = build_prompt("When is rent due?", [passage(1, 50), passage(2, 50)], tokenizer, max_tokens=16)
+    assert prompt == PROMPT_HEADER + "Question: When is rent due?\nAnswer:"
+
+
+def test_requests_stop_at_their_own_limit_or_end_of_text(generator):
+    short, full = GenerationRequest("Question: a?", 2), GenerationRequest("Question: b?", 10)
+    generator([short, full])
+    assert short.result.result() == "rent is" and full.result.result() == ANSWER
+
+
+def test_streamed_chunks_arrive_in_order(generator):
+    request = GenerationRequest("Question: a?", 10, stream=True)
+    generator([request])
+    assert list(request.stream()) == ["rent", " is", " due", " monthly"]
+    assert request.result.result() == ANSWER
+
+
+def test_prompts_are_not_truncated_for_a_larger_limit_in_the_batch(generator):
+    passages = [passage(1, 40), passage(2, 40)]
+    short = GenerationRequest(generator.prompt("When is rent due?", passages, 4), 4)
+    long = GenerationRequest(generator.prompt("When is rent due?", passages, 40), 40)
+    assert len(generator.tokenizer.encode(short.prompt)) > 64 - 40  # would be cut for the longer request
+
+    generator([short, long])
+    prompts = [prompt for batch in generator.model.batches for prompt in batch]
+    assert sorted(prompts) == sorted(" ".join(request.prompt.split()) for request in (short, long))
+    assert short.result.result() == "rent is due monthly" and long.result.result() == ANSWER
+
+
+def test_scheduler_caps_batches_and_collects_requests_waiting_for_a_batch():
+    started, release = threading.Event(), threading.Event()
+    batches = []
+
+    def generate_batch(requests):
+        batches.append([request.prompt for request in requests])
+        started.set()
+        release.wait(5)
+        for request in requests:
+            request.finish(request.prompt.upper())
+
+    scheduler = BatchScheduler(generate_batch, max_batch_size=2, max_wait=0.01)
+    first = scheduler.submit("a", 8)
+    assert started.wait(5)  # the first batch left after max_wait without waiting for more requests
+    waiting = [scheduler.submit(prompt, 8) for prompt in "bcd"]
+    release.set()
+
+    assert [request.result.result(5) for request in [first] + waiting] == ["A", "B", "C", "D"]
+    assert batches == [["a"], ["b", "c"], ["d"]]
+
+
+def test_scheduler_fails_every_request_of_a_failed_batch():
+    def generate_batch(requests):
+        for request in requests:
+            if request.prompt == "a":
+                request.finish("done")  # completed before the error: keeps its answer
+        raise RuntimeError("out of memory")
+
+    scheduler = BatchScheduler(generate_batch, max_batch_size=4, max_wait=0.05)
+    requests = [scheduler.submit("a", 8), scheduler.submit("b", 8, stream=True)]
+    assert requests[0].result.result(5) == "done"
+    with pytest.raises(RuntimeError, match="out of memory"):
+        list(requests[1].stream())
@@ -0,0 +1,169 @@
+import os
+import time
+
+import pytest
+
+from autosearch.indexer import Indexer
+from chatbot.ingestion import IngestionPipeline, UploadReceiver, UploadTooLarge, file_digest, safe_file_name
+from tests.conftest import write_pdf
+
+BOUNDARY = "owleyes-test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def multipart_body(parts):
+    """
+    :param parts: List of (file name or None for a plain field, content bytes).
+    :return: A multipart/form-data body.
+    """
+    body = b""
+    for file_name, content in parts:
+        disposition = 'form-data; name="files"' + (f'; filename="{file_name}"' if file_name is not None else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def receive(directory, body, chunk_size=7, **limits):
+    receiver = UploadReceiver(CONTENT_TYPE, str(directory), **limits)
+    for start in range(0, len(body), chunk_size):
+        receiver.write(body[start:start + chunk_size])
+    return receiver, receiver.finish()
+
+
+def test_safe_file_name_strips_directories_and_requires_pdf():
+    assert safe_file_name("../../etc/lease.pdf") == "lease.pdf"
+    assert safe_file_name("C:\\Users\\me\\Lease.PDF") == "Lease.pdf"
+    assert safe_file_name("notes.txt") is None
+    assert safe_file_name("../.pdf") is None
+
+
+def test_receiver_streams_pdfs_to_staging(tmp_path):
+    receiver, uploads = receive(tmp_path, multipart_body([
+        ("../../outside.pdf", b"%PDF-1 first"), ("notes.txt", b"not a pdf"), (None, b"a form field"),
+        ("second.pdf", b"%PDF-1 second")]))
+
+    assert [(name, size) for name, _, size, _ in uploads] == [("outside.pdf", 12), ("second.pdf", 13)]
+    for _, path, _, _ in uploads:
+        assert os.path.dirname(path) == str(tmp_path)
+    with open(uploads[0][1], "rb") as staged:
+        assert staged.read() == b"%PDF-1 first"
+    assert receiver.rejected == ["notes.txt"]
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for _, path, _, _ in uploads)
+
+
+def test_receiver_rejects_non_multipart_and_truncated_bodies(tmp_path):
+    with pytest.raises(ValueError):
+        UploadReceiver("application/pdf", str(tmp_path))
+
+    receiver = UploadReceiver(CONTENT_TYPE, str(tmp_path))
+    body = multipart_body([("lease.pdf", b"%PDF-1 content")])
+    receiver.write(body[:body.index(b"content")])  # ends inside the file
+    with pytest.raises(ValueError):
+        receiver.finish()
+    receiver.discard()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("limits", [{"max_file_size": 16}, {"max_upload_size": 100}])
+def test_receiver_enforces_size_limits(tmp_path, limits):
+    body = multipart_body([("small.pdf", b"%PDF-1 ok"), ("large.pdf", b"%PDF-1 " + b"x" * 200)])
+    receiver = UploadReceiver(CONTENT_TYPE, str(tmp_path), **limits)
+    with pytest.raises(UploadTooLarge):
+        for start in range(0, len(body), 7):
+            receiver.write(body[start:start + 7])
+    receiver.discard()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.fixture
+def corpus(tmp_path, pdf_directory):
+    write_pdf(pdf_directory / "lease.pdf", ["The tenant shall pay rent monthly."])
+    indexer = Indexer(str(pdf_directory))
+    metadata = {}
+    failing = set()
+
+    def index_documents(documents):
+        if failing & {file_name for file_name, _ in documents}:
+            raise ValueError("cannot index")
+        indexer.add_documents(documents)
+
+    pipeline = IngestionPipeline(str(pdf_directory), str(tmp_path / "uploads"), Indexer.parse_document,
+                                 index_documents, metadata.__setitem__, extract_workers=1)
+    return pipeline, indexer, metadata, failing
+
+
+def stage_upload(pipeline, name, path):
+    """
+    Copy a file into the staging directory, as UploadReceiver would.
+
+    :return: The (upload name, staging path, size, sha256 digest) tuple of the upload.
+    """
+    staged = os.path.join(pipeline.upload_directory, f"staged-{name}")
+    with open(path, "rb") as source, open(staged, "wb") as target:
+        target.write(source.read())
+    return name, staged, os.path.getsize(staged), file_digest(staged)
+
+
+def run_job(pipeline, uploads):
+    job = pipeline.submit(uploads)
+    deadline = time.monotonic() + 60
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert job.done
+    return {file["upload_name"]: file for file in job.describe()["files"]}
+
+
+def test_pipeline_indexes_uploads_and_skips_duplicates(corpus, pdf_directory, tmp_path):
+    pipeline, indexer, metadata, _ = corpus
+    write_pdf(tmp_path / "new.pdf", ["The employee shall report to the board."])
+    files = run_job(pipeline, [stage_upload(pipeline, "lease.pdf", tmp_path / "new.pdf"),
+                               stage_upload(pipeline, "copy.pdf", pdf_directory / "lease.pdf")])
+
+    assert files["lease.pdf"]["status"] == "completed" and files["lease.pdf"]["file_name"] == "lease (2).pdf"
+    assert files["copy.pdf"]["status"] == "duplicate" and files["copy.pdf"]["duplicate_of"] == "lease.pdf"
+    assert [result["file_name"] for result in indexer.search("employee")] == ["lease (2).pdf"]
+    assert "employee" in metadata["lease (2).pdf"]
+    assert sorted(os.listdir(pdf_directory)) == ["lease (2).pdf", "lease.pdf"]
+    assert os.listdir(pipeline.upload_directory) == []
+
+
+def test_pipeline_fails_broken_pdfs(corpus, pdf_directory, tmp_path):
+    pipeline, indexer, _, _ = corpus
+    (tmp_path / "broken.pdf").write_bytes(b"%PDF-1.4 this is not really a PDF")
+    files = run_job(pipeline, [stage_upload(pipeline, "broken.pdf", tmp_path / "broken.pdf")])
+
+    assert files["broken.pdf"]["status"] == "failed" and files["broken.pdf"]["error"].startswith("extract failed")
+    assert os.listdir(pdf_directory) == ["lease.pdf"] and os.listdir(pipeline.upload_directory) == []
+    assert list(indexer.documents) == ["lease.pdf"]
+
+
+def test_pipeline_fails_only_the_files_that_cannot_be_indexed(corpus, pdf_directory, tmp_path):
+    pipeline, indexer, _, failing = corpus
+    failing.add("bad.pdf")
+    write_pdf(tmp_path / "good.pdf", ["The buyer pays the purchase price."])
+    write_pdf(tmp_path / "bad.pdf", ["The seller delivers the goods."])
+    files = run_job(pipeline, [stage_upload(pipeline, "good.pdf", tmp_path / "good.pdf"),
+                               stage_upload(pipeline, "bad.pdf", tmp_path / "bad.pdf")])
+
+    assert files["good.pdf"]["status"] == "completed" and files["good.pdf"]["searchable"]
+    assert files["bad.pdf"]["status"] == "failed" and not files["bad.pdf"]["searchable"]
+    assert sorted(os.listdir(pdf_directory)) == ["good.pdf", "lease.pdf"]
+    assert os.listdir(pipeline.upload_directory) == []
+    assert sorted(indexer.documents) == ["good.pdf", "lease.pdf"]
+
+
+def test_add_documents_leaves_the_index_unchanged_on_error(pdf_directory, tmp_path):
+    write_pdf(pdf_directory / "lease.pdf", ["The tenant shall pay rent monthly."])
+    indexer = Indexer(str(pdf_directory))
+    write_pdf(tmp_path / "new.pdf", ["The employee shall report to the board."])
+    document = Indexer.parse_document(str(tmp_path / "new.pdf"))
+
+    for batch in ([("new.pdf", document), ("broken.pdf", {"text": "employee"})],
+                  [("new.pdf", document), ("new.pdf", document)],
+                  [("new.pdf", document), ("lease.pdf", document)]):
+        with pytest.raises(ValueError):
+            indexer.add_documents(batch)
+        assert list(indexer.documents) == ["lease.pdf"] and indexer.search("employee") == []
+
+    indexer.add_documents([("new.pdf", document)])
+    assert [result["file_name"] for result in indexer.search("employee")] == ["new.pdf"]
@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+
+from metrics import instrumentation
+from metrics.instrumentation import (NULL_STAGE, Counter, Histogram, MetricsRegistry, StageTimer, request_timings,
+                                     server_timing_header, stage)
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "ner")
+    histogram.observe(0.2, "yake")
+
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="ner",le="0.1"} 2',
+        'latency_seconds_bucket{stage="ner",le="1.0"} 3',
+        'latency_seconds_bucket{stage="ner",le="+Inf"} 4',
+        'latency_seconds_sum{stage="ner"} 3.65',
+        'latency_seconds_count{stage="ner"} 4',
+        'latency_seconds_bucket{stage="yake",le="0.1"} 0',
+        'latency_seconds_bucket{stage="yake",le="1.0"} 1',
+        'latency_seconds_bucket{stage="yake",le="+Inf"} 1',
+        'latency_seconds_sum{stage="yake"} 0.2',
+        'latency_seconds_count{stage="yake"} 1',
+    ]
+
+
+def test_histogram_without_labels():
+    histogram = Histogram("batch_size", "Batch size.", buckets=(1, 2))
+    histogram.observe(2)
+    assert histogram.render()[2:] == ['batch_size_bucket{le="1"} 0', 'batch_size_bucket{le="2"} 1',
+                                      'batch_size_bucket{le="+Inf"} 1', "batch_size_sum 2.0","batch_size_count 1"]
+
+
+def test_counter_renders_each_label_set():
+    counter = Counter("documents_total", "Documents.", ("index",))
+    counter.inc(2, "indexer")
+    counter.inc(1, "advanced_search")
+    counter.inc(3, "indexer")
+    assert counter.render() == ["# HELP documents_total Documents.", "# TYPE documents_total counter",
+                                'documents_total{index="advanced_search"} 1', 'documents_total{index="indexer"} 5']
+
+
+def test_label_values_are_escaped():
+    counter = Counter("routes_total", "Routes.", ("route",))
+    counter.inc(1, 'say "hi"\\\nbye')
+    assert counter.render()[2] == 'routes_total{route="say \\"hi\\"\\\\\\nbye"} 1'
+
+
+def test_registry_renders_every_metric():
+    registry = MetricsRegistry()
+    registry.counter("a_total", "A.").inc()
+    registry.histogram("b_seconds", "B.", buckets=(1,))
+    assert registry.render() == "# HELP a_total A.\n# TYPE a_total counter\na_total 1\n" \
+                                "# HELP b_seconds B.\n# TYPE b_seconds histogram\n"
+
+
+def test_server_timing_header_formats_milliseconds():
+    assert server_timing_header({"fitz_extract": 12.5, "tokenize": 3.14159}) == \
+        "fitz_extract;dur=12.50, tokenize;dur=3.14"
+    assert server_timing_header({}) == ""
+
+
+def test_stages_accumulate_into_request_timings():
+    timings = {}
+    token = request_timings.set(timings)
+    try:
+        with stage("retrieve"):
+            with stage("postings"):  # nested stages are each reported
+                pass
+        with stage("postings"):  # repeated stages are summed
+            pass
+    finally:
+        request_timings.reset(token)
+
+    assert list(timings) == ["postings", "retrieve"]
+    assert timings["retrieve"] >= 0 and timings["postings"] >= 0
+    assert server_timing_header(timings).startswith("postings;dur=")
+    assert ", retrieve;dur=" in server_timing_header(timings)
+
+
+def test_stage_outside_a_request_only_feeds_the_histogram():
+    assert request_timings.get() is None
+    with stage("outside_request") as timer:
+        assert isinstance(timer, StageTimer)
+    assert any('stage="outside_request"' in line for line in instrumentation.STAGE_SECONDS.render())
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(instrumentation, "METRICS_ENABLED", False)
+    counter = Counter("disabled_total", "Disabled.")
+    counter.inc()
+    histogram = Histogram("disabled_seconds", "Disabled.")
+    histogram.observe(1.0)
+    assert counter.render()[2:] == [] and histogram.render()[2:] == []
+    assert stage("ner") is NULL_STAGE
+
+
+def test_owleyes_metrics_zero_disables_stages():
+    code = ("from metrics.instrumentation import METRICS_ENABLED, NULL_STAGE, stage; "
+            "assert not METRICS_ENABLED and stage('ner') is NULL_STAGE")
+    environment = {**os.environ, "OWLEYES_METRICS": "0"}
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            env=environment, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
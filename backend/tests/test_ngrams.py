@@ -0,0 +1,62 @@
+import numpy as np
+
+from autosearch.ngrams import CountMinSketch, NGramStore
+
+
+def make_store(documents, min_trigram_count=1):
+    store = NGramStore(min_trigram_count=min_trigram_count)
+    for document in documents:
+        store.add(document.split())
+    store.freeze()
+    return store
+
+
+def test_count_covers_every_order():
+    store = make_store(["written notice to the tenant", "written notice to the landlord"])
+    assert store.count(("written",)) == 2
+    assert store.count(("notice", "to")) == 2
+    assert store.count(("the", "tenant")) == 1
+    assert store.count(("written", "notice", "to")) == 2
+    assert store.count(("tenant", "written")) == 0
+    assert store.count(("unknown",)) == 0
+
+
+def test_complete_ranks_by_count_then_text():
+    store = make_store(["written notice", "written notice", "written consent", "writ of execution"])
+    assert store.complete(["written"], "") == [("written notice", 2), ("written consent", 1)]
+    assert store.complete(["written"], "no") == [("written notice", 2)]
+    assert store.complete([], "writ") == [("written", 3), ("written notice", 2), ("writ", 1), ("writ of", 1),
+                                          ("writ of execution", 1), ("written consent", 1)]
+
+
+def test_complete_excludes_tokens_anywhere_in_the_ngram():
+    store = make_store(["notice of default", "notice period"])
+    assert store.complete(["notice"], "", exclude={"of"}) == [("notice period", 1)]
+
+
+def test_complete_unknown_words_or_prefix():
+    store = make_store(["written notice"])
+    assert store.complete(["verbal"], "") == []
+    assert store.complete(["written"], "x") == []
+
+
+def test_count_min_pruning_keeps_trigrams_once_they_repeat():
+    store = make_store(["security deposit refund"], min_trigram_count=2)
+    assert store.count(("security", "deposit", "refund")) == 0
+    assert store.count(("security", "deposit")) == 1  # only trigrams are pruned
+
+    store.add("the security deposit refund".split())
+    store.add("security deposit refund".split())
+    store.freeze()
+    # The first kept count is the sketch estimate, which includes the pruned first occurrence.
+    assert store.count(("security", "deposit", "refund")) == 3
+
+
+def test_count_min_sketch_never_underestimates():
+    sketch = CountMinSketch(width_bits=4, depth=2)
+    keys = np.arange(64, dtype=np.uint64)
+    before, after = sketch.add(keys, np.ones(64, dtype=np.int64))
+    assert (before == 0).all()
+    assert (after >= 1).all()
+    _, again = sketch.add(keys, np.ones(64, dtype=np.int64))
+    assert (again >= 2).all()
@@ -0,0 +1,59 @@
+from autosearch.indexer import Indexer
+from autosearch.query import Near, Phrase, parse_query, tokenize
+from tests.conftest import write_pdf
+
+
+def test_parse_query_bare_words_and_quoted_phrases():
+    clauses = parse_query('Termination "for Convenience" notice')
+    assert [(clause.terms, clause.exact) for clause in clauses] == [
+        (["termination"], False), (["for", "convenience"], True), (["notice"], False)]
+
+
+def test_parse_query_near_chains_left_to_right():
+    first, = parse_query('"governing law" NEAR/3 state NEAR/10 court')
+    assert isinstance(first, Near) and first.distance == 10
+    assert isinstance(first.left, Near) and first.left.distance == 3
+    assert first.left.left.terms == ["governing", "law"] and first.left.right.terms == ["state"]
+    assert first.right.terms == ["court"]
+
+
+def test_parse_query_ignores_dangling_operators_and_empty_quotes():
+    clauses = parse_query('NEAR/2 rent "" NEAR/4')
+    assert len(clauses) == 1 and isinstance(clauses[0], Phrase) and clauses[0].terms == ["rent"]
+
+
+def test_tokenize_matches_index_tokens():
+    assert tokenize("Lessee's 30-day NOTICE.") == ["lessee", "s", "30", "day", "notice"]
+
+
+def test_intersect_phrase_requires_consecutive_positions():
+    assert Indexer.intersect_phrase([[1, 5, 9], [2, 7, 10], [3, 11]]) == [1, 9]
+    assert Indexer.intersect_phrase([[4], [6]]) == []
+    assert Indexer.intersect_phrase([[0, 3]]) == [0, 3]
+
+
+def test_intersect_near_pairs_within_distance_in_either_order():
+    left = [(10, 11, 1.0), (40, 42, 0.6)]
+    right = [(3, 4, 1.0), (13, 14, 0.6), (60, 61, 1.0)]
+    # 10 and 13 are two tokens apart, 3 is six tokens before 10, 60 is 18 tokens after 42
+    assert Indexer.intersect_near(left, right, 2) == [(10, 14, 0.6)]
+    assert Indexer.intersect_near(left, right, 6) == [(3, 11, 1.0), (10, 14, 0.6)]
+    assert Indexer.intersect_near(left, right, 1) == []
+
+
+def test_phrase_across_a_page_break_is_split_into_per_page_hits(pdf_directory):
+    write_pdf(pdf_directory / "contract.pdf", ["Either party may end this agreement for termination for",
+                                               "convenience on thirty days notice."])
+    indexer = Indexer(str(pdf_directory))
+
+    result, = indexer.search('"termination for convenience"')
+    assert result["file_name"] == "contract.pdf"
+    hits = result["hits"]
+    assert [hit["page_number"] for hit in hits] == [1, 2]
+    assert hits[0]["text"] == "termination for" and hits[1]["text"] == "convenience"
+    assert hits[1]["start"] == 0
+    assert all(hit["boxes"] for hit in hits)
+
+    near, = indexer.search("agreement NEAR/3 convenience")  # "for termination for" in between
+    assert near["file_name"] == "contract.pdf"
+    assert indexer.search("agreement NEAR/2 convenience") == []
@@ -0,0 +1,34 @@
+from autosearch.indexer import Indexer
+from tests.conftest import write_pdf
+
+LEASE = """1. RENT
+The tenant pays rent monthly.
+2. SECURITY
+2.1 The security deposit equals two months of rent.
+2.2 The security deposit is returned within thirty days.
+3. NOTICES
+Notices are given in writing."""
+
+
+def test_retrieve_passages_skips_clauses_inside_returned_passages(pdf_directory):
+    write_pdf(pdf_directory / "lease.pdf", [LEASE])
+    indexer = Indexer(str(pdf_directory))
+
+    numbers = [passage["number"] for passage in indexer.retrieve_passages("security deposit rent", top_k=3)]
+    assert numbers[0] == "2.1"  # the best leaf clause outranks its heading...
+    assert "2" not in numbers  # ...whose passage would repeat it
+
+
+def test_retrieve_passages_weights_terms_by_clause_rarity(pdf_directory):
+    # "deposit" is in one document only but in most of its clauses; "arbitration" is in both
+    # documents but only in one clause of each, so it is the rarer term across clauses.
+    write_pdf(pdf_directory / "lease.pdf", [
+        "1. DEPOSIT\nThe deposit is due.\n2. USE\nThe deposit covers damage.\n3. RETURN\nThe deposit is returned.\n"
+        "4. INTEREST\nThe deposit earns interest.\n5. DISPUTES\nDisputes go to arbitration."])
+    write_pdf(pdf_directory / "services.pdf", [
+        "1. SCOPE\nThe services are listed.\n2. FEES\nFees are due monthly.\n3. TERM\nThe term is one year.\n"
+        "4. DISPUTES\nDisputes go to arbitration."])
+    indexer = Indexer(str(pdf_directory))
+
+    best, = indexer.retrieve_passages("deposit arbitration", top_k=1, filename="lease.pdf")
+    assert best["number"] == "5"
@@ -0,0 +1,100 @@
+import shutil
+import threading
+
+import pytest
+
+from autosearch.indexer import Indexer
+from autosearch.snapshot import IndexSnapshot, SharedIndexDirectory, write_snapshot
+from tests.conftest import write_pdf
+
+LEASE = """1. TERM
+The tenant shall pay rent on the first day of each month.
+2. SECURITY DEPOSIT
+2.1 The security deposit is returned within thirty days.
+3. TERMINATION
+Either party may terminate this lease for convenience on written notice."""
+EMPLOYMENT = """1. DUTIES
+The employee shall perform the duties assigned by the employer.
+2. TERMINATION
+Either party may terminate employment on written notice of thirty days."""
+
+
+@pytest.fixture
+def corpus(pdf_directory):
+    write_pdf(pdf_directory / "lease.pdf", [LEASE, "4. GOVERNING LAW\nThis lease is governed by state law."])
+    write_pdf(pdf_directory / "lease copy.pdf", [LEASE, "4. GOVERNING LAW\nThis lease is governed by state law."])
+    write_pdf(pdf_directory / "employment.pdf", [EMPLOYMENT])
+    return pdf_directory
+
+
+def snapshot_indexer(indexer, directory):
+    directory.mkdir()
+    write_snapshot(indexer, str(directory))
+    return IndexSnapshot(str(directory)).indexer(indexer.pdf_directory)
+
+
+@pytest.mark.parametrize("lsa_components", [0, 2])
+def test_snapshot_matches_in_memory_index(corpus, tmp_path, lsa_components):
+    indexer = Indexer(str(corpus), lsa_components=lsa_components)
+    shared = snapshot_indexer(indexer, tmp_path / "snapshot")
+
+    for query in ["rent", "rnet", '"written notice"', "terminate NEAR/4 notice", "governing law"]:
+        assert shared.search(query) == indexer.search(query)
+        assert shared.search_clauses(query) == indexer.search_clauses(query)
+    for query in ["ter", "written n", "security d"]:
+        assert shared.autocomplete(query) == indexer.autocomplete(query)
+    assert shared.alternative_search_results("termnation notice") == indexer.alternative_search_results(
+        "termnation notice")
+    assert shared.get_clauses("lease.pdf", include_text=True) == indexer.get_clauses("lease.pdf", include_text=True)
+    assert shared.retrieve_passages("when is the security deposit returned") == indexer.retrieve_passages(
+        "when is the security deposit returned")
+    assert shared.similar_documents("lease.pdf") == pytest.approx(indexer.similar_documents("lease.pdf"))
+    assert shared.near_duplicates("lease.pdf") == indexer.near_duplicates("lease.pdf")
+
+
+def test_refresh_swaps_to_a_new_generation_once(corpus, tmp_path):
+    shared_index = SharedIndexDirectory(str(tmp_path / "index"), str(corpus))
+    first = shared_index.attach()
+    assert shared_index.refresh(interval=0) is None
+
+    generation = shared_index.rebuild()
+    second = shared_index.refresh(interval=0)
+    assert second is not None and second is not first and shared_index.generation == generation
+    assert shared_index.refresh(interval=0) is None
+    assert shared_index.load(generation) is second
+
+
+def test_attach_rebuilds_a_missing_generation(corpus, tmp_path):
+    root = tmp_path / "index"
+    first = SharedIndexDirectory(str(root), str(corpus))
+    first.attach()
+    shutil.rmtree(root / first.generation)  # pruned while CURRENT still names it
+
+    second = SharedIndexDirectory(str(root), str(corpus))
+    snapshot = second.attach()
+    assert second.generation != first.generation and (root / second.generation).is_dir()
+    assert second.current_generation() == second.generation
+    assert snapshot.indexer(str(corpus)).search("rent")
+
+
+def test_watch_swaps_on_a_background_thread(corpus, tmp_path):
+    shared_index = SharedIndexDirectory(str(tmp_path / "index"), str(corpus))
+    shared_index.attach()
+    swapped = threading.Event()
+    snapshots = []
+
+    def on_swap(snapshot):
+        snapshots.append(snapshot)
+        swapped.set()
+
+    watcher = shared_index.watch(on_swap, interval=0.01)
+    generation = shared_index.rebuild()
+    assert swapped.wait(5)
+    assert watcher.daemon and watcher is not threading.current_thread()
+    assert snapshots == [shared_index.snapshot] and shared_index.generation == generation
+
+
+def test_snapshot_of_an_empty_corpus_with_lsa(pdf_directory, tmp_path):
+    shared = snapshot_indexer(Indexer(str(pdf_directory), lsa_components=2), tmp_path / "snapshot")
+    assert shared.search("rent") == []
+    assert shared.similarity.components == 2 and shared.similarity.vectors.shape == (0, 2)